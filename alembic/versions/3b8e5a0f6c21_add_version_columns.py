@@ -0,0 +1,28 @@
+"""add version columns
+
+Revision ID: 3b8e5a0f6c21
+Revises: 7d2f1c9a4b36
+Create Date: 2026-10-18 12:40:05.917342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e5a0f6c21'
+down_revision = '7d2f1c9a4b36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ('menus', 'submenus', 'dishes'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade() -> None:
+    for table in ('dishes', 'submenus', 'menus'):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
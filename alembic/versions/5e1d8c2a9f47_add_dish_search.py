@@ -0,0 +1,75 @@
+"""add dish search
+
+Revision ID: 5e1d8c2a9f47
+Revises: 3b8e5a0f6c21
+Create Date: 2026-10-18 15:02:44.318206
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1d8c2a9f47'
+down_revision = '3b8e5a0f6c21'
+branch_labels = None
+depends_on = None
+
+
+# Postgres: сгенерированный tsvector (название важнее описания) и GIN-индекс
+POSTGRES_UPGRADE = [
+    "ALTER TABLE dishes ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX ix_dishes_search_vector ON dishes USING gin (search_vector)",
+]
+POSTGRES_DOWNGRADE = [
+    "DROP INDEX ix_dishes_search_vector",
+    "ALTER TABLE dishes DROP COLUMN search_vector",
+]
+
+# SQLite: таблица FTS5 поверх dishes, синхронизируемая триггерами
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE dishes_search USING fts5("
+    "title, description, content='dishes', content_rowid='id')",
+    "INSERT INTO dishes_search(dishes_search) VALUES ('rebuild')",
+    "CREATE TRIGGER dishes_search_insert AFTER INSERT ON dishes "
+    "BEGIN INSERT INTO dishes_search(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER dishes_search_delete AFTER DELETE ON dishes "
+    "BEGIN INSERT INTO dishes_search(dishes_search, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER dishes_search_update AFTER UPDATE ON dishes "
+    "BEGIN INSERT INTO dishes_search(dishes_search, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO dishes_search(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER dishes_search_update",
+    "DROP TRIGGER dishes_search_delete",
+    "DROP TRIGGER dishes_search_insert",
+    "DROP TABLE dishes_search",
+]
+
+
+def run(statements) -> None:
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        run(POSTGRES_UPGRADE)
+    elif dialect == 'sqlite':
+        run(SQLITE_UPGRADE)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        run(POSTGRES_DOWNGRADE)
+    elif dialect == 'sqlite':
+        run(SQLITE_DOWNGRADE)
@@ -0,0 +1,46 @@
+"""add counters columns
+
+Revision ID: 7d2f1c9a4b36
+Revises: f0eacbc3e47a
+Create Date: 2026-10-18 10:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2f1c9a4b36'
+down_revision = 'f0eacbc3e47a'
+branch_labels = None
+depends_on = None
+
+
+# Заполнение счетчиков по существующим данным
+def backfill_counters():
+    conn = op.get_bind()
+    conn.execute(sa.text(
+        "UPDATE submenus SET dishes_count = "
+        "(SELECT count(*) FROM dishes WHERE dishes.submenu_id = submenus.id)"
+    ))
+    conn.execute(sa.text(
+        "UPDATE menus SET "
+        "submenus_count = "
+        "(SELECT count(*) FROM submenus WHERE submenus.menu_id = menus.id), "
+        "dishes_count = "
+        "(SELECT coalesce(sum(submenus.dishes_count), 0) FROM submenus "
+        "WHERE submenus.menu_id = menus.id)"
+    ))
+
+
+def upgrade() -> None:
+    op.add_column('menus', sa.Column('submenus_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('menus', sa.Column('dishes_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('submenus', sa.Column('dishes_count', sa.Integer(), server_default='0', nullable=False))
+    backfill_counters()
+
+
+def downgrade() -> None:
+    op.drop_column('submenus', 'dishes_count')
+    op.drop_column('menus', 'dishes_count')
+    op.drop_column('menus', 'submenus_count')
@@ -0,0 +1,65 @@
+"""audit indexes
+
+Revision ID: a71c3e9d2b58
+Revises: 5e1d8c2a9f47
+Create Date: 2026-10-18 17:26:10.552913
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a71c3e9d2b58'
+down_revision = '5e1d8c2a9f47'
+branch_labels = None
+depends_on = None
+
+
+# Индексы внешних ключей: списки дочерних строк по порядку id
+ADDED_INDEXES = [
+    ('ix_submenus_menu_id_id', 'submenus', ['menu_id', 'id']),
+    ('ix_dishes_submenu_id_id', 'dishes', ['submenu_id', 'id']),
+]
+
+# Дубли первичных ключей и индексы, которые не используются запросами
+DROPPED_INDEXES = [
+    ('ix_menus_id', 'menus', ['id']),
+    ('ix_submenus_id', 'submenus', ['id']),
+    ('ix_dishes_id', 'dishes', ['id']),
+    ('ix_dishes_description', 'dishes', ['description']),
+    ('ix_dishes_price', 'dishes', ['price']),
+]
+
+
+def create_indexes(indexes, concurrently: bool) -> None:
+    for name, table, columns in indexes:
+        op.create_index(
+            name, table, columns, postgresql_concurrently=concurrently
+        )
+
+
+def drop_indexes(indexes, concurrently: bool) -> None:
+    for name, table, _ in indexes:
+        op.drop_index(name, table_name=table, postgresql_concurrently=concurrently)
+
+
+# На Postgres индексы строятся и удаляются CONCURRENTLY, без блокировки
+# записи; это нельзя делать внутри транзакции
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            create_indexes(ADDED_INDEXES, concurrently=True)
+            drop_indexes(DROPPED_INDEXES, concurrently=True)
+    else:
+        create_indexes(ADDED_INDEXES, concurrently=False)
+        drop_indexes(DROPPED_INDEXES, concurrently=False)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            create_indexes(DROPPED_INDEXES, concurrently=True)
+            drop_indexes(ADDED_INDEXES, concurrently=True)
+    else:
+        create_indexes(DROPPED_INDEXES, concurrently=False)
+        drop_indexes(ADDED_INDEXES, concurrently=False)
@@ -0,0 +1,25 @@
+"""add menus deleted_at
+
+Revision ID: c83f5d0e7a14
+Revises: a71c3e9d2b58
+Create Date: 2026-10-18 19:48:31.074125
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c83f5d0e7a14'
+down_revision = 'a71c3e9d2b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Удаленные большие меню, ожидающие фоновой очистки
+    op.add_column('menus', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('menus', 'deleted_at')
@@ -0,0 +1,160 @@
+# Module containing admission control for API requests.
+#
+# Reads (GET, HEAD, OPTIONS) and writes are admitted separately, at most
+# ADMISSION_READ_LIMIT and ADMISSION_WRITE_LIMIT at a time. Requests over
+# the limit wait in a bounded queue for up to ADMISSION_QUEUE_TIMEOUT
+# seconds. A request is shed with 503 and Retry-After when the queue is
+# full, when it would queue while every pooled connection is checked out,
+# or when its wait times out, instead of piling up in the threadpool and
+# on pool checkout until clients give up. Metrics and health checks are
+# never held back.
+
+
+import asyncio
+from collections import deque
+
+from fastapi.responses import JSONResponse
+
+from app import database, metrics
+from app.settings import (
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_READ_LIMIT,
+    ADMISSION_RETRY_AFTER,
+    ADMISSION_WRITE_LIMIT,
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+)
+
+# Routes served whatever the load
+EXEMPT_PATHS = ("/metrics", "/healthz", "/readyz")
+
+SHED = metrics.register(
+    metrics.Counter(
+        "http_requests_shed_total",
+        "Requests refused with 503 by admission control",
+        ("class", "reason"),
+    )
+)
+
+
+# Limit of concurrent requests with a bounded FIFO queue of waiters.
+# Only used from the event loop, so it needs no locking.
+class Limiter:
+    def __init__(self, limit: int, queue_size: int):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self._waiters = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def queue_full(self) -> bool:
+        return len(self._waiters) >= self.queue_size
+
+    # Take a free slot without waiting
+    def try_acquire(self) -> bool:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        return False
+
+    # Wait in the queue for a slot. Returns False on timeout.
+    async def wait(self, timeout: float) -> bool:
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Give back a slot handed over just as the request went away
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(waiter)
+        return not waiter.cancelled()
+
+    # Hand the slot over to the first waiter, or free it
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+limiters = {
+    "read": Limiter(ADMISSION_READ_LIMIT, ADMISSION_QUEUE_SIZE),
+    "write": Limiter(ADMISSION_WRITE_LIMIT, ADMISSION_QUEUE_SIZE),
+}
+
+for kind, limiter in limiters.items():
+    metrics.register(
+        metrics.Gauge(
+            f"admission_{kind}_in_flight",
+            f"Admitted {kind} requests being handled",
+            lambda limiter=limiter: limiter.in_flight,
+        )
+    )
+    metrics.register(
+        metrics.Gauge(
+            f"admission_{kind}_queued",
+            f"{kind.capitalize()} requests waiting for admission",
+            lambda limiter=limiter: limiter.queued,
+        )
+    )
+
+
+# Check whether every connection the request could use is checked out
+def is_pool_saturated(kind: str) -> bool:
+    pools = database.replica_pools if kind == "read" else []
+    pools = pools or [database.request_pool]
+    capacity = DB_POOL_SIZE + DB_MAX_OVERFLOW
+    return all(pool.checkedout() >= capacity for pool in pools)
+
+
+# Middleware admitting requests, see the module comment
+class AdmissionControlMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        kind = "read" if scope["method"] in ("GET", "HEAD", "OPTIONS") else "write"
+        limiter = limiters[kind]
+
+        if not limiter.try_acquire():
+            if limiter.queue_full:
+                reason = "queue_full"
+            elif is_pool_saturated(kind):
+                reason = "pool_saturated"
+            elif not await limiter.wait(ADMISSION_QUEUE_TIMEOUT):
+                reason = "timeout"
+            else:
+                reason = None
+
+            if reason is not None:
+                SHED.inc(kind, reason)
+                response = JSONResponse(
+                    {"detail": "Server is busy, retry later"},
+                    status_code=503,
+                    headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+                )
+                await response(scope, receive, send)
+                return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,136 @@
+# Module containing awaitable versions of the view functions.
+#
+# With DB_ASYNC enabled the views run on the AsyncSession through
+# run_sync, so their I/O goes through the async driver on the event loop;
+# the cache invalidations they make are then held back and made in the
+# threadpool once they return, see cache.with_deferred_invalidation.
+# Otherwise they run on the sync Session in the threadpool, as plain
+# "def" handlers would. Reads are answered from the in-memory snapshot
+# instead while one is loaded, see app.snapshot, and creates may share a
+# transaction with concurrent ones, see app.group_commit.
+
+
+import functools
+import itertools
+
+from starlette.concurrency import run_in_threadpool
+
+from app import cache, group_commit, snapshot, views
+from app.settings import DB_ASYNC, GROUP_COMMIT
+
+
+# Wrap a view function into a coroutine function with the same arguments
+def awaitable(view):
+    @functools.wraps(view)
+    async def wrapper(db, *args, **kwargs):
+        if DB_ASYNC:
+            return await cache.with_deferred_invalidation(
+                db.run_sync(view, *args, **kwargs)
+            )
+        return await run_in_threadpool(view, db, *args, **kwargs)
+
+    return wrapper
+
+
+# Wrap a read view to answer from the snapshot while one is loaded
+def snapshot_or_awaitable(read, view):
+    view = awaitable(view)
+
+    @functools.wraps(view)
+    async def wrapper(db, *args, **kwargs):
+        if snapshot.catalogue is not None:
+            return read(*args, **kwargs)
+        return await view(db, *args, **kwargs)
+
+    return wrapper
+
+
+# Wrap a create view to share a transaction with concurrent creates when
+# group commit is enabled, see app.group_commit
+def grouped_or_awaitable(committer, view):
+    view = awaitable(view)
+
+    @functools.wraps(view)
+    async def wrapper(db, *args):
+        if GROUP_COMMIT:
+            return await committer.submit(*args)
+        return await view(db, *args)
+
+    return wrapper
+
+
+post_create_menu = grouped_or_awaitable(group_commit.menus, views.post_create_menu)
+post_import_menus = awaitable(views.post_import_menus)
+get_menus_with_counts = snapshot_or_awaitable(
+    snapshot.get_menus_with_counts, views.get_menus_with_counts
+)
+get_menu_by_id = snapshot_or_awaitable(snapshot.get_menu_by_id, views.get_menu_by_id)
+get_menu_version = snapshot_or_awaitable(
+    snapshot.get_menu_version, views.get_menu_version
+)
+get_menus_tree = snapshot_or_awaitable(snapshot.get_menus_tree, views.get_menus_tree)
+update_menu_by_id = awaitable(views.update_menu_by_id)
+delete_menu_by_id = awaitable(views.delete_menu_by_id)
+
+post_create_submenu = grouped_or_awaitable(
+    group_commit.submenus, views.post_create_submenu
+)
+get_submenus_with_counts = snapshot_or_awaitable(
+    snapshot.get_submenus_with_counts, views.get_submenus_with_counts
+)
+get_submenu_by_id = snapshot_or_awaitable(
+    snapshot.get_submenu_by_id, views.get_submenu_by_id
+)
+get_submenu_version = snapshot_or_awaitable(
+    snapshot.get_submenu_version, views.get_submenu_version
+)
+update_submenu_by_id = awaitable(views.update_submenu_by_id)
+delete_submenu_by_id = awaitable(views.delete_submenu_by_id)
+
+create_dish = grouped_or_awaitable(group_commit.dishes, views.create_dish)
+get_dishes_with_counts = snapshot_or_awaitable(
+    snapshot.get_dishes_with_counts, views.get_dishes_with_counts
+)
+get_dish_by_id = snapshot_or_awaitable(snapshot.get_dish_by_id, views.get_dish_by_id)
+get_dish_version = snapshot_or_awaitable(
+    snapshot.get_dish_version, views.get_dish_version
+)
+update_dish_by_id = awaitable(views.update_dish_by_id)
+update_dishes = awaitable(views.update_dishes)
+delete_dish_by_id = awaitable(views.delete_dish_by_id)
+search_dishes = awaitable(views.search_dishes)
+
+
+# Stream the catalogue export, see views.stream_export.
+# Returns an async iterator in async mode and a sync one otherwise,
+# which StreamingResponse iterates in the threadpool.
+def stream_export(db, export_format: str):
+    if snapshot.catalogue is not None:
+        return _stream_export_snapshot(export_format)
+    if DB_ASYNC:
+        return _stream_export_async(db, export_format)
+    return views.stream_export(db, export_format)
+
+
+async def _stream_export_async(db, export_format: str):
+    result = await db.stream(
+        views.get_export_statement().execution_options(
+            max_row_buffer=views.EXPORT_BATCH_SIZE,
+            yield_per=views.EXPORT_BATCH_SIZE,
+        )
+    )
+
+    yield views.format_export_header(export_format)
+    async for rows in result.partitions(views.EXPORT_BATCH_SIZE):
+        yield views.format_export_rows(rows, export_format)
+
+
+def _stream_export_snapshot(export_format: str):
+    rows = snapshot.export_rows()
+
+    yield views.format_export_header(export_format)
+    while True:
+        batch = list(itertools.islice(rows, views.EXPORT_BATCH_SIZE))
+        if not batch:
+            break
+        yield views.format_export_rows(batch, export_format)
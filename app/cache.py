@@ -0,0 +1,482 @@
+# Module containing the response cache for menu, submenu and dish reads.
+
+
+import functools
+import json
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import List, Optional
+from urllib.parse import urlparse
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+
+from app import database, single_flight
+from app.settings import (
+    CACHE_BACKEND,
+    CACHE_MAX_ENTRIES,
+    CACHE_REDIS_URL,
+    CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Error reported by the Redis server
+class RedisError(Exception):
+    pass
+
+
+# In-process cache with LRU eviction and a TTL per entry.
+#
+# Both backends keep a generation number, moved on by every invalidation.
+# A value passed to set() with the generation read before it was loaded is
+# dropped when an invalidation happened meanwhile, so a response loaded
+# before a write is never stored after the write invalidated it.
+class MemoryCache:
+    blocking = False
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        return self._generation
+
+    def next_generation(self) -> None:
+        with self._lock:
+            self._generation += 1
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, generation: Optional[int] = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+# Prefixes a key can be dropped by, see the invalidate_* functions. Keys
+# are made of name:value pairs: the first pair names the menu or submenu
+# the key belongs to, and list pages follow it with a name:list pair. The
+# suffix of a replica read ends the last part, so it has the same prefixes.
+def key_prefixes(key: str) -> List[str]:
+    parts = key.split(":")
+    prefixes = []
+    if len(parts) > 2:
+        prefixes.append(":".join(parts[:2]) + ":")
+    if len(parts) > 4 and parts[3] == "list":
+        prefixes.append(":".join(parts[:4]) + ":")
+    return prefixes
+
+
+# Cache stored in any server speaking the Redis protocol (RESP).
+#
+# Every key is also added to a set per prefix it can be dropped by, so
+# dropping a prefix deletes the members of one set instead of scanning the
+# whole keyspace. The generation is a counter in the server, shared by
+# every process, and a conditional set() runs in a transaction watching it.
+class RedisCache:
+    blocking = True
+
+    GENERATION_KEY = "cache:generation"
+
+    def __init__(self, url: str, ttl: int, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.ttl = ttl
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection(
+            (self.host, self.port), timeout=self.timeout
+        )
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._reader = None
+
+    def _call(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return self._reader.read(length + 2)[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    # Run function on the connection, which it has to itself meanwhile.
+    # The connection is dropped on any error, as it may be mid-transaction.
+    def _run(self, function):
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                return function()
+            except (OSError, RedisError):
+                self._close()
+                raise
+
+    def command(self, *args):
+        return self._run(lambda: self._call(*args))
+
+    @staticmethod
+    def index_key(prefix: str) -> str:
+        return f"cache:prefix:{prefix}"
+
+    def get(self, key: str):
+        data = self.command("GET", key)
+        return None if data is None else json.loads(data)
+
+    def generation(self) -> int:
+        return int(self.command("GET", self.GENERATION_KEY) or 0)
+
+    def next_generation(self) -> None:
+        self.command("INCR", self.GENERATION_KEY)
+
+    def set(self, key: str, value, generation: Optional[int] = None) -> None:
+        data = json.dumps(value, separators=(",", ":"))
+        ttl = self.ttl * 1000
+        commands = [("SET", key, data, "PX", ttl)]
+        for prefix in key_prefixes(key):
+            commands.append(("SADD", self.index_key(prefix), key))
+            commands.append(("PEXPIRE", self.index_key(prefix), ttl))
+
+        def run():
+            if generation is not None:
+                self._call("WATCH", self.GENERATION_KEY)
+                if int(self._call("GET", self.GENERATION_KEY) or 0) != generation:
+                    self._call("UNWATCH")
+                    return
+            self._call("MULTI")
+            for command in commands:
+                self._call(*command)
+            # Aborted, with a nil reply, when the generation moved on
+            self._call("EXEC")
+
+        self._run(run)
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self.command("DEL", *keys)
+
+    def delete_prefix(self, prefix: str) -> None:
+        index = self.index_key(prefix)
+
+        def run():
+            keys = self._call("SMEMBERS", index)
+            self._call("DEL", index, *keys)
+
+        self._run(run)
+
+
+# Build the backend selected in settings
+def create_backend(name: str):
+    if name == "memory":
+        return MemoryCache(CACHE_MAX_ENTRIES, CACHE_TTL)
+    if name == "redis":
+        return RedisCache(CACHE_REDIS_URL, CACHE_TTL)
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+backend = create_backend(CACHE_BACKEND)
+
+# Invalidations held back by with_deferred_invalidation, None when they run
+# at once
+_deferred: ContextVar[Optional[list]] = ContextVar("cache_deferred", default=None)
+
+# Whether the current request reads from a replica. Replica reads are
+# cached under keys of their own, see source_key.
+_replica_read: ContextVar[bool] = ContextVar("cache_replica_read", default=False)
+
+# Suffix of the keys of responses read from a replica
+REPLICA_SUFFIX = "@replica"
+
+
+# Router dependency recording where the request reads from
+async def select_read_source(request: Request) -> None:
+    _replica_read.set(database.reads_from_replica(request))
+
+
+# Key of a response read by the current request. A replica may lag behind a
+# write the primary already has, so its responses are never served to
+# clients reading from the primary, which would lose their own writes.
+def source_key(key: str) -> str:
+    return key + REPLICA_SUFFIX if _replica_read.get() else key
+
+
+# Cache keys. Lists are stored per page, so they are dropped by prefix.
+def menus_list_key(skip: int, limit: int, cursor: Optional[str]) -> str:
+    return f"menus:list:{skip}:{limit}:{cursor or ''}"
+
+
+def menu_key(menu_id: int) -> str:
+    return f"menu:{menu_id}"
+
+
+def submenus_list_key(
+    menu_id: int, skip: int, limit: int, cursor: Optional[str]
+) -> str:
+    return f"menu:{menu_id}:submenus:list:{skip}:{limit}:{cursor or ''}"
+
+
+def submenu_key(menu_id: int, submenu_id: int) -> str:
+    return f"menu:{menu_id}:submenu:{submenu_id}"
+
+
+def dishes_list_key(
+    submenu_id: int, skip: int, limit: int, cursor: Optional[str]
+) -> str:
+    return f"submenu:{submenu_id}:dishes:list:{skip}:{limit}:{cursor or ''}"
+
+
+def dish_key(submenu_id: int, dish_id: int) -> str:
+    return f"submenu:{submenu_id}:dish:{dish_id}"
+
+
+# Key of the ETag/Last-Modified validators cached next to a response
+def validators_key(key: str) -> str:
+    return f"{key}#validators"
+
+
+def catalogue_tree_key() -> str:
+    return "menus:tree"
+
+
+def menu_tree_key(menu_id: Optional[int]) -> str:
+    return f"menu:{menu_id}:tree"
+
+
+# Call a backend method, keeping network round trips off the event loop
+async def _call_backend(method, *args):
+    if backend.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+
+# Return the cached response for key, or build it with loader and store it.
+# loader is a coroutine function, shared by identical concurrent requests.
+# Backend failures are logged and the request falls through to the database.
+async def get_or_set(key: str, loader):
+    key = source_key(key)
+    if backend is None:
+        return await single_flight.run(key, loader)
+
+    try:
+        value = await _call_backend(backend.get, key)
+        if value is not None:
+            return value
+        generation = await _call_backend(backend.generation)
+    except (OSError, RedisError):
+        logger.exception("Cache read failed for %s", key)
+        return await loader()
+
+    value = jsonable_encoder(await single_flight.run(key, loader))
+    try:
+        await _call_backend(backend.set, key, value, generation)
+    except (OSError, RedisError):
+        logger.exception("Cache write failed for %s", key)
+
+    return value
+
+
+def _delete(*keys: str) -> None:
+    keys = (*keys, *(validators_key(key) for key in keys))
+    try:
+        backend.delete(*keys, *(key + REPLICA_SUFFIX for key in keys))
+    except (OSError, RedisError):
+        logger.exception("Cache invalidation failed for %s", keys)
+
+
+def _delete_prefix(prefix: str) -> None:
+    try:
+        backend.delete_prefix(prefix)
+    except (OSError, RedisError):
+        logger.exception("Cache invalidation failed for %s*", prefix)
+
+
+# Decorator of the invalidate_* functions, which do nothing without a
+# backend. They first move the cache to a new generation, so responses
+# being loaded meanwhile are not stored, see MemoryCache.
+def _invalidation(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs) -> None:
+        if backend is None:
+            return
+        pending = _deferred.get()
+        if pending is not None and backend.blocking:
+            pending.append((wrapper, args, kwargs))
+            return
+        try:
+            backend.next_generation()
+        except (OSError, RedisError):
+            logger.exception("Cache generation update failed")
+        function(*args, **kwargs)
+
+    return wrapper
+
+
+def _run_all(pending: list) -> None:
+    for function, args, kwargs in pending:
+        function(*args, **kwargs)
+
+
+# Await awaitable, holding back the invalidations made meanwhile and making
+# them in the threadpool once it is done. Views running on the event loop,
+# in async mode, go through this, so a blocking backend does not stall it.
+async def with_deferred_invalidation(awaitable):
+    pending = []
+    token = _deferred.set(pending)
+    try:
+        return await awaitable
+    finally:
+        _deferred.reset(token)
+        if pending:
+            await run_in_threadpool(_run_all, pending)
+
+
+# Drop the whole catalogue tree and the tree of one menu
+def _invalidate_trees(menu_id: Optional[int]) -> None:
+    _delete(catalogue_tree_key(), menu_tree_key(menu_id))
+
+
+# Drop every menus list page and the catalogue tree after menus are added
+@_invalidation
+def invalidate_catalogue() -> None:
+    _delete_prefix("menus:list:")
+    _delete(catalogue_tree_key())
+
+
+# Drop a menu and every menus list page
+@_invalidation
+def invalidate_menu(menu_id: int) -> None:
+    _delete_prefix("menus:list:")
+    _delete(menu_key(menu_id))
+    _invalidate_trees(menu_id)
+
+
+# Drop a submenu and its menu's submenus lists.
+# When the change affects counts, the parent menu is dropped as well.
+@_invalidation
+def invalidate_submenu(menu_id: int, submenu_id: int, counts: bool = False) -> None:
+    _delete_prefix(f"menu:{menu_id}:submenus:list:")
+    _delete(submenu_key(menu_id, submenu_id))
+    _invalidate_trees(menu_id)
+    if counts:
+        invalidate_menu(menu_id)
+
+
+# Drop a dish and its submenu's dishes lists, which carry dishes_count.
+# When the change affects counts, the submenu and menu are dropped as well.
+@_invalidation
+def invalidate_dish(
+    menu_id: Optional[int], submenu_id: int, dish_id: int, counts: bool = False
+) -> None:
+    _delete_prefix(f"submenu:{submenu_id}:dishes:list:")
+    _delete(dish_key(submenu_id, dish_id))
+    _invalidate_trees(menu_id)
+    if counts and menu_id is not None:
+        invalidate_submenu(menu_id, submenu_id, counts=True)
+
+
+# Drop many dishes at once, given as (menu_id, submenu_id, dish_id), with
+# each list and tree they appear in dropped only once
+@_invalidation
+def invalidate_dishes(dishes) -> None:
+    dishes = list(dishes)
+    for submenu_id in {submenu_id for _, submenu_id, _ in dishes}:
+        _delete_prefix(f"submenu:{submenu_id}:dishes:list:")
+    menu_ids = {menu_id for menu_id, _, _ in dishes}
+    _delete(
+        *(dish_key(submenu_id, dish_id) for _, submenu_id, dish_id in dishes),
+        catalogue_tree_key(),
+        *(menu_tree_key(menu_id) for menu_id in menu_ids),
+    )
+
+
+# Drop a deleted submenu together with everything cached below it
+@_invalidation
+def invalidate_submenu_tree(menu_id: int, submenu_id: int) -> None:
+    invalidate_submenu(menu_id, submenu_id, counts=True)
+    _delete_prefix(f"submenu:{submenu_id}:")
+
+
+# Drop a deleted menu together with everything cached below it
+@_invalidation
+def invalidate_menu_tree(menu_id: int, submenu_ids) -> None:
+    invalidate_menu(menu_id)
+    _delete_prefix(f"menu:{menu_id}:")
+    for submenu_id in submenu_ids:
+        _delete_prefix(f"submenu:{submenu_id}:")
@@ -0,0 +1,143 @@
+# Command line entry point for maintenance tasks.
+#
+# Usage: python -m app.cli <command>
+
+
+import argparse
+import json
+import os
+import sys
+from typing import List
+
+from pydantic import parse_obj_as
+
+from app import migrate, purge, schemas, views
+from app.database import SessionLocal
+from app.settings import CACHE_BACKEND, READ_SNAPSHOT, WEB_CONCURRENCY
+
+
+# Open a session without the statement timeout, which is meant for
+# requests: maintenance commands may run long on a large catalogue
+def open_session():
+    db = SessionLocal()
+    db.info["statement_timeout"] = 0
+    return db
+
+
+# Recompute the stored submenus_count and dishes_count counters
+def repair_counters(args) -> None:
+    db = open_session()
+    try:
+        fixed_submenus, fixed_menus = schemas.recalculate_counts(db)
+    finally:
+        db.close()
+
+    print(f"Fixed counters of {fixed_submenus} submenus and {fixed_menus} menus")
+
+
+# Apply the pending migrations, never generating new ones
+def migrate_database(args) -> None:
+    before, after = migrate.upgrade()
+    if before == after:
+        print(f"Database is up to date at revision {after}")
+    else:
+        print(f"Migrated database from revision {before} to {after}")
+
+
+# Purge the menus marked deleted instead of waiting for the server to
+def purge_menus(args) -> None:
+    db = open_session()
+    try:
+        batches = purge.purge_all(db)
+    finally:
+        db.close()
+
+    print(f"Purged deleted menus in {batches} batches")
+
+
+# Import a JSON document of menus with nested submenus and dishes
+def import_menus(args) -> None:
+    with open(args.path, encoding="utf-8") as file:
+        menus = parse_obj_as(List[schemas.MenuCreate], json.load(file))
+
+    db = open_session()
+    try:
+        results = views.post_import_menus(db, menus)
+    finally:
+        db.close()
+
+    submenus = [submenu for menu in results for submenu in menu.submenus]
+    dishes_count = sum(len(submenu.dishes) for submenu in submenus)
+    print(
+        f"Imported {len(results)} menus, {len(submenus)} submenus "
+        f"and {dishes_count} dishes"
+    )
+
+
+# Get the number of CPUs this process may run on
+def get_cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Get the number of server workers, see WEB_CONCURRENCY in app.settings
+def get_worker_count() -> int:
+    if WEB_CONCURRENCY:
+        return WEB_CONCURRENCY
+    if CACHE_BACKEND == "redis" and not READ_SNAPSHOT:
+        return get_cpu_count()
+    return 1
+
+
+# Print the number of server workers for docker-entrypoint.sh, warning
+# when several workers would keep state of their own
+def print_worker_count(args) -> None:
+    workers = get_worker_count()
+    if workers > 1 and (CACHE_BACKEND == "memory" or READ_SNAPSHOT):
+        print(
+            f"Warning: {workers} workers each keep their own response cache "
+            "or read snapshot and serve stale reads after writes handled by "
+            "the others",
+            file=sys.stderr,
+        )
+    print(workers)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser(
+        "migrate", help="apply pending database migrations"
+    )
+    migrate_parser.set_defaults(handler=migrate_database)
+
+    repair = commands.add_parser(
+        "repair-counters", help="recompute stored submenu and dish counters"
+    )
+    repair.set_defaults(handler=repair_counters)
+
+    purge_parser = commands.add_parser(
+        "purge-menus", help="purge menus deleted in the background"
+    )
+    purge_parser.set_defaults(handler=purge_menus)
+
+    import_parser = commands.add_parser(
+        "import-menus", help="import menus with nested submenus and dishes"
+    )
+    import_parser.add_argument("path", help="JSON file with a list of menus")
+    import_parser.set_defaults(handler=import_menus)
+
+    workers_parser = commands.add_parser(
+        "workers", help="print the number of server worker processes"
+    )
+    workers_parser.set_defaults(handler=print_worker_count)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
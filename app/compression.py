@@ -0,0 +1,238 @@
+# Module containing the response compression middleware.
+#
+# Responses of at least COMPRESSION_MIN_SIZE bytes with a JSON, CSV or
+# NDJSON body are compressed with the best encoding the client accepts:
+# zstd or br when the optional zstandard and brotli packages are installed,
+# and gzip. Levels are set per encoding in COMPRESSION_LEVELS. Compressed
+# bodies of GET responses are kept in memory under a digest of the body, so
+# a cached list or tree is compressed once per version rather than once per
+# request. Streamed responses, like the export, are compressed on the fly.
+
+
+import hashlib
+import zlib
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from app import metrics
+from app.cache import MemoryCache
+from app.settings import (
+    CACHE_TTL,
+    COMPRESSION_CACHE_ENTRIES,
+    COMPRESSION_LEVELS,
+    COMPRESSION_MIN_SIZE,
+)
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/csv")
+
+# Bodies larger than this are compressed in the threadpool, off the loop
+THREADPOOL_MIN_SIZE = 64 * 1024
+
+COMPRESSED_BYTES = metrics.register(
+    metrics.Counter(
+        "http_response_compression_bytes_total",
+        "Response body bytes before (raw) and after (sent) compression",
+        ("encoding", "stage"),
+    )
+)
+COMPRESSION_CACHE = metrics.register(
+    metrics.Counter(
+        "http_response_compression_cache_total",
+        "Lookups of compressed GET response bodies, hit or miss",
+        ("result",),
+    )
+)
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Available encodings, in order of preference
+COMPRESSORS = {}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = ZstdCompressor
+if brotli is not None:
+    COMPRESSORS["br"] = BrotliCompressor
+COMPRESSORS["gzip"] = GzipCompressor
+
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+LEVELS = {**DEFAULT_LEVELS, **COMPRESSION_LEVELS}
+
+_cache = MemoryCache(COMPRESSION_CACHE_ENTRIES, CACHE_TTL)
+
+
+# Get a streaming compressor of an encoding at its configured level
+def get_compressor(encoding: str, level: Optional[int] = None):
+    return COMPRESSORS[encoding](LEVELS[encoding] if level is None else level)
+
+
+# Compress a whole body
+def compress(encoding: str, body: bytes, level: Optional[int] = None) -> bytes:
+    compressor = get_compressor(encoding, level)
+    return compressor.compress(body) + compressor.flush()
+
+
+# Choose the encoding the client prefers by q value, ties going to ours
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    default = accepted.get("*", 0.0)
+    encoding = max(COMPRESSORS, key=lambda name: accepted.get(name, default))
+    return encoding if accepted.get(encoding, default) > 0 else None
+
+
+# Check whether a response is worth compressing from its headers
+def is_compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").split(";")[0].strip()
+    return content_type in COMPRESSIBLE_TYPES and "content-encoding" not in headers
+
+
+# Compress a complete body, reusing the result for identical GET bodies
+async def compress_body(encoding: str, body: bytes, cacheable: bool) -> bytes:
+    key = None
+    if cacheable:
+        key = f"{encoding}:{hashlib.blake2b(body, digest_size=16).hexdigest()}"
+        compressed = _cache.get(key)
+        COMPRESSION_CACHE.inc("miss" if compressed is None else "hit")
+        if compressed is not None:
+            return compressed
+
+    if len(body) >= THREADPOOL_MIN_SIZE:
+        compressed = await run_in_threadpool(compress, encoding, body)
+    else:
+        compressed = compress(encoding, body)
+
+    if key is not None:
+        _cache.set(key, compressed)
+    return compressed
+
+
+# Middleware compressing responses, see the module comment
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        cacheable = scope["method"] == "GET"
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None and start_message is not None:
+                headers = MutableHeaders(raw=list(start_message["headers"]))
+                start_message["headers"] = headers.raw
+                # A complete small body is sent as it is
+                if not is_compressible(headers) or (
+                    not more_body and len(body) < COMPRESSION_MIN_SIZE
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                headers.add_vary_header("Accept-Encoding")
+                headers["content-encoding"] = encoding
+                COMPRESSED_BYTES.inc(encoding, "raw", amount=len(body))
+
+                if not more_body:
+                    body = await compress_body(
+                        encoding, body, cacheable and start_message["status"] == 200
+                    )
+                    headers["content-length"] = str(len(body))
+                    COMPRESSED_BYTES.inc(encoding, "sent", amount=len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                # Streamed body, its length is not known up front
+                del headers["content-length"]
+                compressor = get_compressor(encoding)
+                await send(start_message)
+                start_message = None
+            else:
+                COMPRESSED_BYTES.inc(encoding, "raw", amount=len(body))
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            COMPRESSED_BYTES.inc(encoding, "sent", amount=len(chunk))
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,90 @@
+# Module containing helpers for conditional GET requests.
+#
+# Menus, submenus and dishes carry a version column bumped on every write,
+# including writes to children that change the parent's counts. It is sent
+# as a weak ETag together with Last-Modified, and a request whose
+# If-None-Match or If-Modified-Since still matches is answered with 304
+# after a single primary key lookup.
+#
+# Last-Modified only has whole seconds, so a later write in the same second
+# gets the same value. It is therefore only sent, and If-Modified-Since
+# only answered with 304, once that second is over: a copy carrying it was
+# then read after every write of its second. The ETag is always exact.
+
+
+import time
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+from app import cache
+
+
+# Format a row's version and update time as response validators
+async def _load_validators(load_version) -> Optional[dict]:
+    row = await load_version()
+    if row is None:
+        return None
+
+    version, updated_at = row
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+
+    return {
+        "etag": f'W/"{version}"',
+        "last_modified": format_datetime(
+            updated_at.astimezone(timezone.utc), usegmt=True
+        ),
+    }
+
+
+# Check whether the second of a Last-Modified value is over, see above
+def _is_settled(last_modified: str) -> bool:
+    return parsedate_to_datetime(last_modified).timestamp() + 1 <= time.time()
+
+
+# Check whether the client's copy described by the request headers is current
+def _is_fresh(request: Request, validators: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().lstrip("W/") for tag in if_none_match.split(",")}
+        return validators["etag"].lstrip("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and _is_settled(validators["last_modified"]):
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return parsedate_to_datetime(validators["last_modified"]) <= since
+
+    return False
+
+
+# Return a 304 response when the client's copy of the resource cached under
+# key is current. Otherwise set ETag and Last-Modified on response and
+# return None. load_version is a coroutine function returning
+# (version, updated_at), or None when the resource does not exist.
+async def check_not_modified(
+    request: Request, response: Response, key: str, load_version
+) -> Optional[Response]:
+    validators = await cache.get_or_set(
+        cache.validators_key(key), lambda: _load_validators(load_version)
+    )
+    if validators is None:
+        return None
+
+    headers = {"ETag": validators["etag"]}
+    if _is_settled(validators["last_modified"]):
+        headers["Last-Modified"] = validators["last_modified"]
+    if _is_fresh(request, validators):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
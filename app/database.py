@@ -1,25 +1,326 @@
 # Module for working with the database.
 
 
-from sqlalchemy import create_engine
+import itertools
+import time
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app import metrics
+from app.settings import (
+    DB_ASYNC,
+    DB_ECHO,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_QUERY_BUDGET,
+    DB_REPLICA_BALANCING,
+    DB_REPLICA_PIN_SECONDS,
+    DB_ROUTE_STATEMENT_TIMEOUTS,
+    DB_STATEMENT_TIMEOUT,
+    REQUEST_METRICS,
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    SQLALCHEMY_ASYNC_REPLICA_URLS,
+    SQLALCHEMY_DATABASE_URL,
+    SQLALCHEMY_REPLICA_URLS,
+)
+
+POOL_CHECKOUT_WAIT = metrics.register(
+    metrics.Histogram(
+        "db_pool_checkout_wait_seconds",
+        "Time spent waiting for a connection from the pool",
+        (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+    )
+)
+POOL_CHECKOUT_TIMEOUTS = metrics.register(
+    metrics.Counter(
+        "db_pool_checkout_timeouts_total",
+        "Checkouts that gave up waiting for a free connection",
+    )
+)
+
+
+# Pool recording how long each checkout waits for a free connection,
+# so pool starvation can be told apart from slow queries
+class InstrumentedPoolMixin:
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# Get driver arguments applying the default statement timeout on Postgres.
+# Pooled SQLite connections are handed between threadpool threads, which
+# the sqlite3 module refuses unless told otherwise.
+def get_connect_args(url: str, async_driver: bool) -> dict:
+    if url.startswith("sqlite"):
+        return {"check_same_thread": False}
+    if not url.startswith("postgresql") or not DB_STATEMENT_TIMEOUT:
+        return {}
+    if async_driver:
+        return {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}}
+    return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"}
+
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+
+# SQLite only enforces foreign keys, and so their ON DELETE CASCADE,
+# when asked to on each connection
+def enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
 
-from app.settings import SQLALCHEMY_DATABASE_URL
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=True)
+# Create a pooled engine
+def create_pooled_engine(url: str):
+    engine = create_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=InstrumentedQueuePool,
+        connect_args=get_connect_args(url, async_driver=False),
+        **POOL_OPTIONS,
+    )
+    if url.startswith("sqlite"):
+        event.listen(engine, "connect", enable_foreign_keys)
+    return engine
+
+
+# Create a pooled async engine
+def create_pooled_async_engine(url: str):
+    engine = create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=InstrumentedAsyncQueuePool,
+        connect_args=get_connect_args(url, async_driver=True),
+        **POOL_OPTIONS,
+    )
+    if url.startswith("sqlite"):
+        event.listen(engine.sync_engine, "connect", enable_foreign_keys)
+    return engine
+
+
+engine = create_pooled_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The async stack is only built when it is enabled in settings,
+# so the async driver is not required otherwise
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    async_engine = create_pooled_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL)
+    AsyncSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, bind=async_engine, class_=AsyncSession
+    )
+
+# Read replicas, used for GET requests of the selected stack
+if DB_ASYNC:
+    replica_engines = [
+        create_pooled_async_engine(url) for url in SQLALCHEMY_ASYNC_REPLICA_URLS
+    ]
+    ReplicaSessions = [
+        sessionmaker(
+            autocommit=False, autoflush=False, bind=replica, class_=AsyncSession
+        )
+        for replica in replica_engines
+    ]
+    replica_pools = [replica.sync_engine.pool for replica in replica_engines]
+else:
+    replica_engines = [create_pooled_engine(url) for url in SQLALCHEMY_REPLICA_URLS]
+    ReplicaSessions = [
+        sessionmaker(autocommit=False, autoflush=False, bind=replica)
+        for replica in replica_engines
+    ]
+    replica_pools = [replica.pool for replica in replica_engines]
+
+# Cookie holding the time until which a client reads from the primary
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+_replica_counter = itertools.count()
+
+# Pool serving the requests, for the in-use metrics
+request_pool = async_engine.sync_engine.pool if DB_ASYNC else engine.pool
+
+metrics.register(
+    metrics.Gauge(
+        "db_pool_connections_in_use",
+        "Connections currently checked out of the pool",
+        lambda: request_pool.checkedout(),
+    )
+)
+metrics.register(
+    metrics.Gauge(
+        "db_pool_connections_idle",
+        "Connections open and idle in the pool",
+        lambda: request_pool.checkedin(),
+    )
+)
+metrics.register(
+    metrics.Gauge(
+        "db_pool_overflow",
+        "Connections open beyond pool_size",
+        lambda: max(request_pool.overflow(), 0),
+    )
+)
+
 Base = declarative_base()
 
 metadata = Base.metadata
 
 
+# Time every SQL statement for the per-request metrics and query budgets
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    metrics.record_statement(time.perf_counter() - context._metrics_started)
+
+
+if REQUEST_METRICS or DB_QUERY_BUDGET != "off":
+    event.listen(Engine, "before_cursor_execute", start_statement_timer)
+    event.listen(Engine, "after_cursor_execute", stop_statement_timer)
+
+
+# Apply the statement timeout of the current route to each transaction
+@event.listens_for(Session, "after_begin")
+def set_route_statement_timeout(session, transaction, connection):
+    timeout = session.info.get("statement_timeout")
+    if timeout is not None and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+# Remember the route's statement timeout when it differs from the default
+def set_statement_timeout(db, request: Request) -> None:
+    endpoint = request.scope.get("endpoint")
+    timeout = DB_ROUTE_STATEMENT_TIMEOUTS.get(getattr(endpoint, "__name__", None))
+    if timeout is not None and timeout != DB_STATEMENT_TIMEOUT:
+        db.info["statement_timeout"] = timeout
+
+
+# Check whether the client wrote recently and must read from the primary
+def is_pinned_to_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+# Check whether a request reads from a replica: reads do unless the client
+# has just written, everything else goes to the primary
+def reads_from_replica(request: Request) -> bool:
+    return (
+        bool(ReplicaSessions)
+        and request.method in ("GET", "HEAD")
+        and not is_pinned_to_primary(request)
+    )
+
+
+# Get the session factory for a request, see reads_from_replica
+def choose_sessionmaker(request: Request, primary):
+    if not reads_from_replica(request):
+        return primary
+
+    if DB_REPLICA_BALANCING == "least_connections":
+        index = min(
+            range(len(replica_pools)), key=lambda i: replica_pools[i].checkedout()
+        )
+    else:
+        index = next(_replica_counter) % len(ReplicaSessions)
+
+    return ReplicaSessions[index]
+
+
+# Middleware pinning a client to the primary after a successful write,
+# so its next reads see the write even if replicas lag behind
+class ReadYourWritesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                pinned_until = time.time() + DB_REPLICA_PIN_SECONDS
+                cookie = (
+                    f"{PRIMARY_PIN_COOKIE}={pinned_until:.3f}; "
+                    f"Max-Age={int(DB_REPLICA_PIN_SECONDS) + 1}; Path=/; HttpOnly"
+                )
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"set-cookie", cookie.encode())
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
+
+
 # Get a database session.
-def get_db():
-    db = SessionLocal()
+def get_sync_db(request: Request):
+    db = choose_sessionmaker(request, SessionLocal)()
+    set_statement_timeout(db, request)
     try:
         yield db
     finally:
         db.close()
+
+
+# Get an async database session.
+async def get_async_db(request: Request):
+    async with choose_sessionmaker(request, AsyncSessionLocal)() as db:
+        set_statement_timeout(db, request)
+        yield db
+
+
+# Session dependency used by the routers
+get_db = get_async_db if DB_ASYNC else get_sync_db
+
+
+# Run function(db) with a primary session of its own, off the event loop,
+# for work done outside of requests
+async def run_in_session(function):
+    if DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(function)
+
+    def run():
+        db = SessionLocal()
+        try:
+            return function(db)
+        finally:
+            db.close()
+
+    return await run_in_threadpool(run)
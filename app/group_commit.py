@@ -0,0 +1,88 @@
+# Module grouping concurrent create requests into shared transactions.
+#
+# With GROUP_COMMIT enabled, menus, submenus and dishes created by
+# concurrent requests are collected for up to GROUP_COMMIT_WINDOW
+# milliseconds, or until GROUP_COMMIT_MAX_BATCH of a kind are waiting, and
+# inserted with multi-row INSERT ... RETURNING in one transaction, so a
+# burst of creates costs one commit instead of one per row. Each request
+# still gets its own response, or its own error: items that cannot be
+# inserted with the group are created one by one afterwards (see
+# views.create_one_by_one). Responses and status codes are the same as
+# without grouping.
+
+
+import asyncio
+import logging
+from typing import Callable, List, Optional
+
+from app import cache, database, metrics, views
+from app.settings import GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_WINDOW
+
+logger = logging.getLogger(__name__)
+
+GROUP_SIZE = metrics.register(
+    metrics.Histogram(
+        "group_commit_items",
+        "Create requests written per group commit",
+        (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+        ("kind",),
+    )
+)
+
+
+# Collects items of one kind and writes them with write_group(db, items),
+# which returns a response or an exception per item. Only used from the
+# event loop, so it needs no locking.
+class GroupCommitter:
+    def __init__(self, kind: str, write_group: Callable[..., list]):
+        self.kind = kind
+        self.write_group = write_group
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    # Queue the arguments of one create and wait for its response
+    async def submit(self, *args):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((args, future))
+        if len(self._pending) >= GROUP_COMMIT_MAX_BATCH:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(GROUP_COMMIT_WINDOW / 1000, self._flush)
+        # The write goes ahead even if this request goes away
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        group, self._pending = self._pending, []
+        if group:
+            asyncio.get_event_loop().create_task(self._write(group))
+
+    async def _write(self, group: List[tuple]) -> None:
+        # The statements belong to no single request, keep them out of the
+        # request metrics and query budgets
+        metrics.request_stats.set(None)
+        GROUP_SIZE.observe(len(group), self.kind)
+        items = [args for args, _ in group]
+        try:
+            results = await cache.with_deferred_invalidation(
+                database.run_in_session(lambda db: self.write_group(db, items))
+            )
+        except Exception as exc:
+            logger.exception("Group commit of %d %s failed", len(group), self.kind)
+            results = [exc] * len(group)
+
+        for (_, future), result in zip(group, results):
+            if future.cancelled():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+menus = GroupCommitter("menus", views.post_create_menus)
+submenus = GroupCommitter("submenus", views.post_create_submenus)
+dishes = GroupCommitter("dishes", views.create_dishes)
@@ -0,0 +1,49 @@
+# Module containing the health check routes for orchestrators.
+#
+# /healthz answers once the database can be queried. /readyz also requires
+# the database to be migrated to the latest revision, so a replica started
+# with newer code gets no traffic until the migrations are applied.
+
+
+from fastapi import APIRouter, HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import database, migrate
+
+router = APIRouter()
+
+
+def _ping(db: Session) -> None:
+    db.execute(text("SELECT 1"))
+
+
+def _get_revision(db: Session):
+    return migrate.get_current_revision(db.connection())
+
+
+# Run a check off the event loop, turning database errors into 503
+async def _check(function):
+    try:
+        return await database.run_in_session(function)
+    except SQLAlchemyError as exc:
+        raise HTTPException(status_code=503, detail="Database unavailable") from exc
+
+
+@router.get("/healthz", include_in_schema=False)
+async def read_health():
+    await _check(_ping)
+    return {"status": "ok"}
+
+
+@router.get("/readyz", include_in_schema=False)
+async def read_readiness():
+    revision = await _check(_get_revision)
+    head = migrate.get_head()
+    if revision != head:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Database is at revision {revision}, expected {head}",
+        )
+    return {"status": "ok", "revision": revision}
@@ -3,8 +3,67 @@
 
 from fastapi import FastAPI
 
+from app import (
+    admission,
+    compression,
+    database,
+    health,
+    metrics,
+    purge,
+    query_budget,
+    snapshot,
+)
 from app.routers import router
+from app.settings import (
+    ADMISSION_CONTROL,
+    COMPRESSION,
+    DB_ASYNC,
+    DB_QUERY_BUDGET,
+    READ_SNAPSHOT,
+    REQUEST_METRICS,
+)
 
 app = FastAPI()
 
 app.include_router(router)
+app.include_router(metrics.router)
+app.include_router(health.router)
+
+if database.replica_engines:
+    app.add_middleware(database.ReadYourWritesMiddleware)
+
+if DB_QUERY_BUDGET != "off":
+    app.add_middleware(query_budget.QueryBudgetMiddleware)
+
+if COMPRESSION:
+    app.add_middleware(compression.CompressionMiddleware)
+
+# Outside the routes, but inside the metrics, which then count shed requests
+if ADMISSION_CONTROL:
+    app.add_middleware(admission.AdmissionControlMiddleware)
+
+# Added last so it wraps the budget check, which then shares its counter
+if REQUEST_METRICS:
+    app.add_middleware(metrics.RequestMetricsMiddleware)
+
+
+# Background purge of large deleted menus
+app.add_event_handler("startup", purge.start)
+app.add_event_handler("shutdown", purge.stop)
+
+if READ_SNAPSHOT:
+    app.add_event_handler("startup", snapshot.start)
+    app.add_event_handler("shutdown", snapshot.stop)
+
+
+# Close pooled connections when the server stops
+@app.on_event("shutdown")
+async def dispose_engines():
+    for replica in database.replica_engines:
+        if DB_ASYNC:
+            await replica.dispose()
+        else:
+            replica.dispose()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+    database.engine.dispose()
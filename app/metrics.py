@@ -0,0 +1,230 @@
+# Module containing in-process metrics exposed in Prometheus text format.
+
+
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+router = APIRouter()
+
+LabelValues = Tuple[str, ...]
+
+
+# Format label names and values as {name="value",...}
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Monotonic counter, optionally split by labels
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {} if labels else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+# Gauge read from a callback when metrics are collected
+class Gauge:
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read()}"
+
+
+# Histogram with fixed buckets, optionally split by labels
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Tuple[float, ...],
+        labels: Tuple[str, ...] = (),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Bucket counts, then sum and count of observations
+                series = self._series[label_values] = [0] * len(self.buckets) + [0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    # Get the count and sum of observations of a series
+    def totals(self, *label_values: str) -> Tuple[int, float]:
+        with self._lock:
+            series = self._series.get(label_values)
+            return (series[-1], series[-2]) if series is not None else (0, 0.0)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series_list = [(key, list(series)) for key, series in self._series.items()]
+        for label_values, series in series_list:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(
+                    self.labels + ("le",), label_values + (repr(float(bound)),)
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels + ("le",), label_values + ("+Inf",))
+            yield f"{self.name}_bucket{labels} {series[-1]}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {series[-2]}"
+            yield f"{self.name}_count{labels} {series[-1]}"
+
+
+registry = []
+
+
+# Add a metric to the registry exposed at /metrics
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+# Render every registered metric in Prometheus text format
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+REQUEST_LATENCY = register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time spent handling a request",
+        LATENCY_BUCKETS,
+        ("method", "route"),
+    )
+)
+REQUESTS = register(
+    Counter(
+        "http_requests_total",
+        "Handled requests",
+        ("method", "route", "status"),
+    )
+)
+REQUEST_QUERIES = register(
+    Histogram(
+        "http_request_sql_statements",
+        "SQL statements executed while handling a request",
+        (0, 1, 2, 3, 5, 10, 20, 50, 100),
+        ("method", "route"),
+    )
+)
+REQUEST_DB_TIME = register(
+    Histogram(
+        "http_request_db_seconds",
+        "Time spent in SQL statements while handling a request",
+        LATENCY_BUCKETS,
+        ("method", "route"),
+    )
+)
+
+# Statement count and database time of the request being handled. The
+# engine hooks in app.database add to it, including from the threadpool
+# and greenlets, which run in a copy of the request's context.
+request_stats: ContextVar[Optional[list]] = ContextVar("request_stats", default=None)
+
+
+# Add an executed statement to the current request's stats
+def record_statement(duration: float) -> None:
+    stats = request_stats.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += duration
+
+
+# Get the route template of the endpoint that handled the request
+def _route_template(scope) -> str:
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "unmatched"
+
+    templates = getattr(app, "_route_templates", None)
+    if templates is None:
+        templates = app._route_templates = {
+            getattr(route, "endpoint", None): route.path for route in app.routes
+        }
+    return templates.get(endpoint, "unmatched")
+
+
+# Middleware recording latency, SQL statement count and database time
+# of each request, labelled by method and route template
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = [0, 0.0]
+        token = request_stats.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_stats.reset(token)
+            method, route = scope["method"], _route_template(scope)
+            REQUEST_LATENCY.observe(elapsed, method, route)
+            REQUESTS.inc(method, route, str(status))
+            REQUEST_QUERIES.observe(stats[0], method, route)
+            REQUEST_DB_TIME.observe(stats[1], method, route)
+
+
+# Expose metrics for Prometheus
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics():
+    return render()
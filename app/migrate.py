@@ -0,0 +1,71 @@
+# Module applying the database migrations at startup.
+#
+# Only revisions already in alembic/versions are applied, nothing is
+# autogenerated. On Postgres the upgrade holds an advisory lock, so when
+# several replicas start together one of them migrates while the others
+# wait for it and then find the database at head.
+
+
+import os
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.pool import NullPool
+
+from app.settings import SQLALCHEMY_DATABASE_URL
+
+ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "alembic")
+
+# Key of the advisory lock taken while migrating, shared by all replicas
+MIGRATION_LOCK_KEY = 7_341_205_118
+
+
+def get_config() -> Config:
+    config = Config(os.path.join(ALEMBIC_DIR, "alembic.ini"))
+    config.set_main_option("script_location", ALEMBIC_DIR)
+    return config
+
+
+_head: Optional[str] = None
+
+
+# Get the latest revision in alembic/versions
+def get_head() -> str:
+    global _head
+    if _head is None:
+        _head = ScriptDirectory.from_config(get_config()).get_current_head()
+    return _head
+
+
+# Get the revision the database is at, None when it was never migrated
+def get_current_revision(connection: Connection) -> Optional[str]:
+    return MigrationContext.configure(connection).get_current_revision()
+
+
+# Upgrade the database to head. Returns the revisions before and after.
+def upgrade() -> tuple:
+    config = get_config()
+    # A connection of its own, free of the statement timeout of requests
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+    with engine.connect() as connection:
+        locked = connection.dialect.name == "postgresql"
+        if locked:
+            connection.execute(select(func.pg_advisory_lock(MIGRATION_LOCK_KEY)))
+        try:
+            before = get_current_revision(connection)
+            # env.py migrates through this connection, under the lock
+            config.attributes["connection"] = connection
+            command.upgrade(config, "head")
+            after = get_current_revision(connection)
+        finally:
+            if locked:
+                connection.execute(
+                    select(func.pg_advisory_unlock(MIGRATION_LOCK_KEY))
+                )
+    engine.dispose()
+    return before, after
@@ -1,7 +1,18 @@
 # Module containing SQLAlchemy models for the application.
 
 
-from sqlalchemy import Column, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    DDL,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    event,
+    func,
+)
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -10,17 +21,31 @@ from .database import Base
 # SQLAlchemy model for submenus.
 class Submenu(Base):
     __tablename__ = "submenus"
+    # Serves the submenus of a menu in id order, for lists and cursors
+    __table_args__ = (Index("ix_submenus_menu_id_id", "menu_id", "id"),)
 
-    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String, index=True)
     menu_id = Column(
         Integer, ForeignKey("menus.id", ondelete="CASCADE"), nullable=False
     )
     description = Column(String, nullable=False)
+    dishes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
 
     menu = relationship("Menu", back_populates="submenus")
     dishes = relationship(
-        "Dish", back_populates="submenu", cascade="all, delete-orphan"
+        "Dish",
+        back_populates="submenu",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="Dish.id",
     )
 
 
@@ -28,23 +53,93 @@ class Submenu(Base):
 class Menu(Base):
     __tablename__ = "menus"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     title = Column(String, index=True, nullable=False)
     description = Column(String, nullable=False)
+    submenus_count = Column(Integer, nullable=False, default=0, server_default="0")
+    dishes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+    # Set when a large menu is deleted; it is hidden from reads and purged
+    # in the background (see app.purge)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
     submenus = relationship(
-        "Submenu", back_populates="menu", cascade="all, delete-orphan"
+        "Submenu",
+        back_populates="menu",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="Submenu.id",
     )
 
 
 # SQLAlchemy model for dishes.
 class Dish(Base):
     __tablename__ = "dishes"
+    # Serves the dishes of a submenu in id order, for lists and cursors
+    __table_args__ = (Index("ix_dishes_submenu_id_id", "submenu_id", "id"),)
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     title = Column(String, index=True)
-    description = Column(String, index=True, nullable=False)
-    price = Column(Float, index=True)
+    description = Column(String, nullable=False)
+    price = Column(Float)
     submenu_id = Column(Integer, ForeignKey("submenus.id", ondelete="CASCADE"))
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
 
     submenu = relationship("Submenu", back_populates="dishes")
+
+
+# Full-text search over dish titles and descriptions (see app.search).
+# Postgres keeps a generated tsvector column with a GIN index, SQLite an
+# FTS5 table kept in sync by triggers. The same objects are created by the
+# migration adding search, these hooks cover metadata.create_all().
+DISH_SEARCH_DDL = {
+    "postgresql": [
+        "ALTER TABLE dishes ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+        ") STORED",
+        "CREATE INDEX IF NOT EXISTS ix_dishes_search_vector "
+        "ON dishes USING gin (search_vector)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS dishes_search USING fts5("
+        "title, description, content='dishes', content_rowid='id')",
+        "INSERT INTO dishes_search(dishes_search) VALUES ('rebuild')",
+        "CREATE TRIGGER IF NOT EXISTS dishes_search_insert AFTER INSERT ON dishes "
+        "BEGIN INSERT INTO dishes_search(rowid, title, description) "
+        "VALUES (new.id, new.title, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS dishes_search_delete AFTER DELETE ON dishes "
+        "BEGIN INSERT INTO dishes_search(dishes_search, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS dishes_search_update AFTER UPDATE ON dishes "
+        "BEGIN INSERT INTO dishes_search(dishes_search, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); "
+        "INSERT INTO dishes_search(rowid, title, description) "
+        "VALUES (new.id, new.title, new.description); END",
+    ],
+}
+
+for dialect, statements in DISH_SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(
+            Dish.__table__, "after_create", DDL(statement).execute_if(dialect=dialect)
+        )
+
+event.listen(
+    Dish.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS dishes_search").execute_if(dialect="sqlite"),
+)
@@ -0,0 +1,54 @@
+# Module containing helpers for cursor (keyset) pagination.
+#
+# A cursor is an opaque token holding the id of the last item of a page.
+# The next page is read with "WHERE id > :last_id ORDER BY id LIMIT n",
+# so deep pages cost the same as the first one and rows inserted
+# meanwhile are neither skipped nor repeated.
+
+
+import base64
+import binascii
+import json
+from typing import Optional
+
+from fastapi import HTTPException, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+# Encode the id of the last item of a page into a cursor
+def encode_cursor(last_id: int) -> str:
+    data = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+# Decode a cursor back into the id of the last item of a page
+def decode_cursor(cursor: str) -> int:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_id = json.loads(data)["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return last_id
+
+
+# Page a statement by id_column, by cursor when given, by offset otherwise
+def paginate(stmt, id_column, skip: int, limit: int, cursor: Optional[str]):
+    stmt = stmt.order_by(id_column).limit(limit)
+    if cursor is not None:
+        return stmt.where(id_column > decode_cursor(cursor))
+    return stmt.offset(skip)
+
+
+# Set the cursor of the following page, unless items is the last page
+def set_next_cursor(response: Response, items, limit: int) -> None:
+    if limit <= 0 or len(items) < limit:
+        return
+
+    last = items[-1]
+    last_id = last["id"] if isinstance(last, dict) else last.id
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(int(last_id))
@@ -0,0 +1,136 @@
+# Module purging menus deleted in the background.
+#
+# Deleting a menu larger than DB_PURGE_THRESHOLD only marks it deleted,
+# which hides it and everything below it from reads right away. Its dishes
+# and then its submenus are deleted here, DB_PURGE_BATCH_SIZE at a time,
+# each batch in a short transaction of its own, and finally the menu
+# itself, which has nothing left to cascade to. Marked menus survive
+# restarts, so a purge interrupted by a shutdown resumes later.
+
+
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import database, metrics
+from app.models import Dish as DBDish
+from app.models import Menu as DBMenu
+from app.models import Submenu as DBSubmenu
+from app.settings import DB_PURGE_BATCH_SIZE, DB_PURGE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+PURGED_ROWS = metrics.register(
+    metrics.Counter(
+        "purged_rows_total",
+        "Rows of deleted menus purged in the background",
+        ("table",),
+    )
+)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_wakeup: Optional[asyncio.Event] = None
+_task: Optional[asyncio.Task] = None
+
+
+# Delete one batch of rows of the oldest menu marked deleted. Returns the
+# number of rows deleted, 0 when nothing is left to purge.
+def purge_batch(db: Session) -> int:
+    menu_id = db.scalar(
+        select(DBMenu.id)
+        .where(DBMenu.deleted_at.is_not(None))
+        .order_by(DBMenu.deleted_at, DBMenu.id)
+        .limit(1)
+    )
+    if menu_id is None:
+        return 0
+
+    batch = (
+        select(DBDish.id)
+        .join(DBSubmenu, DBSubmenu.id == DBDish.submenu_id)
+        .where(DBSubmenu.menu_id == menu_id)
+        .limit(DB_PURGE_BATCH_SIZE)
+    )
+    deleted = db.execute(
+        delete(DBDish)
+        .where(DBDish.id.in_(batch))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    table = "dishes"
+
+    if not deleted:
+        batch = (
+            select(DBSubmenu.id)
+            .where(DBSubmenu.menu_id == menu_id)
+            .limit(DB_PURGE_BATCH_SIZE)
+        )
+        deleted = db.execute(
+            delete(DBSubmenu)
+            .where(DBSubmenu.id.in_(batch))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        table = "submenus"
+
+    if not deleted:
+        deleted = db.execute(
+            delete(DBMenu)
+            .where(DBMenu.id == menu_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        table = "menus"
+        logger.info("Purged deleted menu %s", menu_id)
+
+    db.commit()
+    PURGED_ROWS.inc(table, amount=deleted)
+    # Another process may have removed the menu meanwhile, carry on anyway
+    return max(deleted, 1)
+
+
+# Purge every menu marked deleted. Returns the number of batches run.
+def purge_all(db: Session) -> int:
+    batches = 0
+    while purge_batch(db):
+        batches += 1
+    return batches
+
+
+# Ask the background job to purge now. Safe to call from any thread.
+def wake() -> None:
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+async def _purge_forever() -> None:
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), DB_PURGE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+        try:
+            # One batch per session, so requests get the pool in between
+            while await database.run_in_session(purge_batch):
+                pass
+        except SQLAlchemyError:
+            logger.exception("Purging deleted menus failed")
+
+
+# Start the background job, which first resumes any pending purge
+async def start() -> None:
+    global _loop, _wakeup, _task
+    _loop = asyncio.get_event_loop()
+    _wakeup = asyncio.Event()
+    _wakeup.set()
+    _task = _loop.create_task(_purge_forever())
+
+
+async def stop() -> None:
+    global _loop
+    _loop = None
+    if _task is not None:
+        _task.cancel()
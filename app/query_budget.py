@@ -0,0 +1,110 @@
+# Module containing the per-request SQL statement budget.
+#
+# Routes declare how many statements they are expected to run with
+# dependencies=[Depends(query_budget(n))]. When DB_QUERY_BUDGET is "log"
+# or "raise", every response carries the statement count in X-DB-Queries
+# and a request going over its route's budget, usually an N+1 pattern, is
+# logged or answered with 500.
+
+
+import json
+import logging
+
+from fastapi import Request
+
+from app import metrics
+from app.settings import DB_QUERY_BUDGET
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = "X-DB-Queries"
+
+
+# Dependency declaring the statement budget of a route
+def query_budget(statements: int):
+    async def set_query_budget(request: Request) -> None:
+        request.state.query_budget = statements
+
+    set_query_budget.statements = statements
+    return set_query_budget
+
+
+# Middleware counting the statements of each request and enforcing the
+# budget of its route when the response starts
+class QueryBudgetMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Share the counter of the request metrics when they are enabled
+        stats = metrics.request_stats.get()
+        token = None
+        if stats is None:
+            stats = [0, 0.0]
+            token = metrics.request_stats.set(stats)
+
+        replaced = False
+        reported = False
+
+        # Describe the overrun when the request went over its budget
+        def check_budget():
+            nonlocal reported
+            budget = scope.get("state", {}).get("query_budget")
+            if reported or budget is None or stats[0] <= budget:
+                return None
+            reported = True
+            return (
+                f"{scope['method']} {scope['path']} ran {stats[0]} SQL "
+                f"statements, over its budget of {budget}"
+            )
+
+        async def send_with_count(message):
+            nonlocal replaced
+            if message["type"] == "http.response.start":
+                detail = check_budget()
+                if detail is not None and DB_QUERY_BUDGET == "raise":
+                    logger.error("Query budget exceeded: %s", detail)
+                    replaced = True
+                    await send_error(send, stats[0], detail)
+                    return
+                if detail is not None:
+                    logger.warning("Query budget exceeded: %s", detail)
+
+                message["headers"] = list(message.get("headers", [])) + [
+                    (QUERY_COUNT_HEADER.lower().encode(), str(stats[0]).encode())
+                ]
+            elif replaced:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            if token is not None:
+                metrics.request_stats.reset(token)
+
+        # Streaming responses run statements after the headers are sent,
+        # so going over the budget then can only be logged
+        detail = check_budget()
+        if detail is not None:
+            logger.warning("Query budget exceeded: %s", detail)
+
+
+async def send_error(send, count: int, detail: str) -> None:
+    body = json.dumps({"detail": f"Query budget exceeded: {detail}"}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 500,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (QUERY_COUNT_HEADER.lower().encode(), str(count).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
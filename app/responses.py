@@ -0,0 +1,31 @@
+# Module containing the fast JSON response used by the list endpoints.
+#
+# List views return plain dicts built straight from SQL rows. In fast mode
+# the handlers send them as FastJSONResponse, skipping the response_model
+# validation and jsonable_encoder pass, and encode them with orjson when it
+# is installed. The bytes are the same as JSONResponse would send.
+
+
+import json
+import typing
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# Encode content as compact UTF-8 JSON, as JSONResponse does
+def dumps(content: typing.Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: typing.Any) -> bytes:
+        return dumps(content)
@@ -1,45 +1,153 @@
 # Module containing FastAPI routers for menu-related endpoints.
 
 
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app import schemas, views
+from app import (
+    async_views,
+    cache,
+    conditional,
+    pagination,
+    responses,
+    schemas,
+    single_flight,
+)
 from app.database import get_db
+from app.query_budget import query_budget
+from app.settings import FAST_RESPONSES
+
+router = APIRouter(
+    dependencies=[
+        Depends(cache.select_read_source),
+        Depends(single_flight.coalesce_route),
+    ]
+)
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+# Send a list page. In fast mode the rows are encoded as they are,
+# without validating them against the response model again.
+def list_response(response: Response, items: list, limit: int):
+    pagination.set_next_cursor(response, items, limit)
+    return rows_response(response, items)
 
-router = APIRouter()
+
+# Send a list of rows, see list_response
+def rows_response(response: Response, items: list):
+    if not FAST_RESPONSES:
+        return items
+
+    fast_response = responses.FastJSONResponse(items)
+    fast_response.raw_headers.extend(response.raw_headers)
+    return fast_response
 
 
 # Create new menu
-@router.post("/api/v1/menus/", response_model=schemas.MenuResponse, status_code=201)
-def create_menu(menu: schemas.MenuCreate, db: Session = Depends(get_db)):
-    return views.post_create_menu(db, menu)
+@router.post(
+    "/api/v1/menus/",
+    response_model=schemas.MenuResponse,
+    status_code=201,
+    dependencies=[Depends(query_budget(2))],
+)
+async def create_menu(menu: schemas.MenuCreate, db: Session = Depends(get_db)):
+    return await async_views.post_create_menu(db, menu)
+
+
+# Import menus with nested submenus and dishes
+@router.post(
+    "/api/v1/menus/bulk",
+    response_model=List[schemas.MenuImportResult],
+    status_code=201,
+)
+async def import_menus(
+    menus: List[schemas.MenuCreate], db: Session = Depends(get_db)
+):
+    return await async_views.post_import_menus(db, menus)
 
 
 # Get menus list with counts
-@router.get("/api/v1/menus/", response_model=List[schemas.MenuResponse])
-def read_menus(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return views.get_menus_with_counts(db, skip, limit)
+@router.get(
+    "/api/v1/menus/",
+    response_model=List[schemas.MenuResponse],
+    dependencies=[Depends(query_budget(1))],
+)
+async def read_menus(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    menus = await cache.get_or_set(
+        cache.menus_list_key(skip, limit, cursor),
+        lambda: async_views.get_menus_with_counts(db, skip, limit, cursor),
+    )
+    return list_response(response, menus, limit)
+
+
+# Get menus tree with submenus and dishes
+@router.get(
+    "/api/v1/menus/tree",
+    response_model=List[schemas.MenuTreeResponse],
+    dependencies=[Depends(query_budget(3))],
+)
+async def read_menus_tree(
+    menu_id: Optional[int] = None, db: Session = Depends(get_db)
+):
+    if menu_id is None:
+        key = cache.catalogue_tree_key()
+    else:
+        key = cache.menu_tree_key(menu_id)
+
+    return await cache.get_or_set(
+        key, lambda: async_views.get_menus_tree(db, menu_id)
+    )
 
 
 # Get menu by id
-@router.get("/api/v1/menus/{menu_id}", response_model=schemas.MenuResponse)
-def read_menu(menu_id: int, db: Session = Depends(get_db)):
-    return views.get_menu_by_id(db, menu_id)
+@router.get(
+    "/api/v1/menus/{menu_id}",
+    response_model=schemas.MenuResponse,
+    dependencies=[Depends(query_budget(2))],
+)
+async def read_menu(
+    menu_id: int, request: Request, response: Response, db: Session = Depends(get_db)
+):
+    key = cache.menu_key(menu_id)
+    not_modified = await conditional.check_not_modified(
+        request, response, key, lambda: async_views.get_menu_version(db, menu_id)
+    )
+    if not_modified is not None:
+        return not_modified
+
+    return await cache.get_or_set(
+        key, lambda: async_views.get_menu_by_id(db, menu_id)
+    )
 
 
 # Update menu
-@router.patch("/api/v1/menus/{menu_id}", response_model=schemas.MenuResponse)
-def update_menu(menu_id: int, menu: schemas.MenuCreate, db: Session = Depends(get_db)):
-    return views.update_menu_by_id(db, menu_id, menu)
+@router.patch(
+    "/api/v1/menus/{menu_id}",
+    response_model=schemas.MenuResponse,
+    dependencies=[Depends(query_budget(3))],
+)
+async def update_menu(menu_id: int, menu: schemas.MenuCreate, db: Session = Depends(get_db)):
+    return await async_views.update_menu_by_id(db, menu_id, menu)
 
 
 # Delete menu
-@router.delete("/api/v1/menus/{menu_id}", status_code=status.HTTP_200_OK)
-def delete_menu(menu_id: int, db: Session = Depends(get_db)):
-    return views.delete_menu_by_id(db, menu_id)
+@router.delete(
+    "/api/v1/menus/{menu_id}",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(query_budget(3))],
+)
+async def delete_menu(menu_id: int, db: Session = Depends(get_db)):
+    return await async_views.delete_menu_by_id(db, menu_id)
 
 
 # Create new submenu
@@ -47,52 +155,88 @@ def delete_menu(menu_id: int, db: Session = Depends(get_db)):
     "/api/v1/menus/{menu_id}/submenus/",
     response_model=schemas.SubMenuResponse,
     status_code=201,
+    dependencies=[Depends(query_budget(3))],
 )
-def create_submenu(
+async def create_submenu(
     menu_id: int, submenu: schemas.SubMenuCreate, db: Session = Depends(get_db)
 ):
-    return views.post_create_submenu(db, menu_id, submenu)
+    return await async_views.post_create_submenu(db, menu_id, submenu)
 
 
 # Get submenus list with counts
 @router.get(
-    "/api/v1/menus/{menu_id}/submenus/", response_model=List[schemas.SubMenuResponse]
+    "/api/v1/menus/{menu_id}/submenus/",
+    response_model=List[schemas.SubMenuResponse],
+    dependencies=[Depends(query_budget(1))],
 )
-def read_submenus(
-    menu_id: int, skip: int = 0, limit: int = 10, db: Session = Depends(get_db)
+async def read_submenus(
+    menu_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
 ):
-    return views.get_submenus_with_counts(db, menu_id, skip, limit)
+    submenus = await cache.get_or_set(
+        cache.submenus_list_key(menu_id, skip, limit, cursor),
+        lambda: async_views.get_submenus_with_counts(
+            db, menu_id, skip, limit, cursor
+        ),
+    )
+    return list_response(response, submenus, limit)
 
 
 # Get submenu by id
 @router.get(
     "/api/v1/menus/{menu_id}/submenus/{submenu_id}",
     response_model=schemas.SubMenuResponse,
+    dependencies=[Depends(query_budget(2))],
 )
-def read_submenu_by_id(menu_id: int, submenu_id: int, db: Session = Depends(get_db)):
-    return views.get_submenu_by_id(db, menu_id, submenu_id)
+async def read_submenu_by_id(
+    menu_id: int,
+    submenu_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
+    key = cache.submenu_key(menu_id, submenu_id)
+    not_modified = await conditional.check_not_modified(
+        request,
+        response,
+        key,
+        lambda: async_views.get_submenu_version(db, menu_id, submenu_id),
+    )
+    if not_modified is not None:
+        return not_modified
+
+    return await cache.get_or_set(
+        key, lambda: async_views.get_submenu_by_id(db, menu_id, submenu_id)
+    )
 
 
 # Update submenu
 @router.patch(
     "/api/v1/menus/{menu_id}/submenus/{submenu_id}",
     response_model=schemas.SubMenuResponse,
+    dependencies=[Depends(query_budget(3))],
 )
-def update_submenu(
+async def update_submenu(
     menu_id: int,
     submenu_id: int,
     submenu: schemas.SubMenuCreate,
     db: Session = Depends(get_db),
 ):
-    return views.update_submenu_by_id(db, menu_id, submenu_id, submenu)
+    return await async_views.update_submenu_by_id(db, menu_id, submenu_id, submenu)
 
 
 # Delete submenu
 @router.delete(
-    "/api/v1/menus/{menu_id}/submenus/{submenu_id}", status_code=status.HTTP_200_OK
+    "/api/v1/menus/{menu_id}/submenus/{submenu_id}",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(query_budget(3))],
 )
-def delete_submenu(menu_id: int, submenu_id: int, db: Session = Depends(get_db)):
-    return views.delete_submenu_by_id(db, menu_id, submenu_id)
+async def delete_submenu(menu_id: int, submenu_id: int, db: Session = Depends(get_db)):
+    return await async_views.delete_submenu_by_id(db, menu_id, submenu_id)
 
 
 # Create new dish
@@ -100,34 +244,62 @@ def delete_submenu(menu_id: int, submenu_id: int, db: Session = Depends(get_db))
     "/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/",
     response_model=schemas.DishResponse,
     status_code=201,
+    dependencies=[Depends(query_budget(5))],
 )
-def create_dish(
+async def create_dish(
     submenu_id: int, dish: schemas.DishCreate, db: Session = Depends(get_db)
 ):
-    return views.create_dish(db, submenu_id, dish)
+    return await async_views.create_dish(db, submenu_id, dish)
 
 
 # Get dishes list
 @router.get(
     "/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/",
     response_model=List[schemas.DishResponse],
+    dependencies=[Depends(query_budget(1))],
 )
-def read_dishes(
-    submenu_id: int, skip: int = 0, limit: int = 10, db: Session = Depends(get_db)
+async def read_dishes(
+    submenu_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
 ):
-    return views.get_dishes_with_counts(db, submenu_id, skip, limit)
+    dishes = await cache.get_or_set(
+        cache.dishes_list_key(submenu_id, skip, limit, cursor),
+        lambda: async_views.get_dishes_with_counts(
+            db, submenu_id, skip, limit, cursor
+        ),
+    )
+    return list_response(response, dishes, limit)
 
 
 # Get dish by id
 @router.get(
     "/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
     response_model=schemas.DishResponse,
+    dependencies=[Depends(query_budget(2))],
 )
-def read_dish(dish_id: int, submenu_id: int, db: Session = Depends(get_db)):
-    return views.get_dish_by_id(
-        db,
-        dish_id,
-        submenu_id,
+async def read_dish(
+    dish_id: int,
+    submenu_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
+    key = cache.dish_key(submenu_id, dish_id)
+    not_modified = await conditional.check_not_modified(
+        request,
+        response,
+        key,
+        lambda: async_views.get_dish_version(db, dish_id, submenu_id),
+    )
+    if not_modified is not None:
+        return not_modified
+
+    return await cache.get_or_set(
+        key, lambda: async_views.get_dish_by_id(db, dish_id, submenu_id)
     )
 
 
@@ -135,20 +307,72 @@ def read_dish(dish_id: int, submenu_id: int, db: Session = Depends(get_db)):
 @router.patch(
     "/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
     response_model=schemas.DishResponse,
+    dependencies=[Depends(query_budget(4))],
 )
-def update_dish(
+async def update_dish(
     dish_id: int,
     submenu_id: int,
     dish: schemas.DishCreate,
     db: Session = Depends(get_db),
 ):
-    return views.update_dish_by_id(db, dish_id, submenu_id, dish)
+    return await async_views.update_dish_by_id(db, dish_id, submenu_id, dish)
 
 
 # Delete dish
 @router.delete(
     "/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(query_budget(4))],
+)
+async def delete_dish(dish_id: int, submenu_id: int, db: Session = Depends(get_db)):
+    return await async_views.delete_dish_by_id(db, dish_id, submenu_id)
+
+
+# Update many dishes in one transaction
+@router.patch(
+    "/api/v1/dishes/bulk",
+    response_model=List[schemas.DishBulkUpdateResult],
 )
-def delete_dish(dish_id: int, submenu_id: int, db: Session = Depends(get_db)):
-    return views.delete_dish_by_id(db, dish_id, submenu_id)
+async def update_dishes(
+    dishes: List[schemas.DishBulkUpdate], db: Session = Depends(get_db)
+):
+    return await async_views.update_dishes(db, dishes)
+
+
+# Search dishes by title and description, best matches first
+@router.get(
+    "/api/v1/dishes/search",
+    response_model=List[schemas.DishSearchResult],
+    dependencies=[Depends(query_budget(1))],
+)
+async def search_dishes(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    menu_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    dishes, next_cursor = await async_views.search_dishes(
+        db, q, menu_id, min_price, max_price, limit, cursor
+    )
+    if next_cursor is not None:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return rows_response(response, dishes)
+
+
+# Export menus, submenus and dishes as NDJSON or CSV
+@router.get("/api/v1/export", dependencies=[Depends(query_budget(2))])
+async def export_catalogue(
+    export_format: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$"),
+    db: Session = Depends(get_db),
+):
+    return StreamingResponse(
+        async_views.stream_export(db, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f"attachment; filename=catalogue.{export_format}"
+        },
+    )
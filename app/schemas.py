@@ -4,7 +4,7 @@
 from typing import List, Optional, Tuple
 
 from pydantic import BaseModel
-from sqlalchemy import func, select
+from sqlalchemy import exists, func, select, update
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session
 
@@ -13,19 +13,93 @@ from app.models import Menu as DBMenu
 from app.models import Submenu as DBSubmenu
 
 
-# Calculate submenus_count and dishes_count
-def calculate_counts(db: Session, menu_id: int) -> Tuple[int, int]:
-    submenus_count = db.scalar(
-        select(func.count(DBSubmenu.id)).where(DBSubmenu.menu_id == menu_id)
-    )
-
-    dishes_count = db.scalar(
+# Recalculate the stored submenus_count and dishes_count of every row.
+# Returns the number of submenus and menus whose counters had drifted.
+def recalculate_counts(db: Session) -> Tuple[int, int]:
+    submenu_dishes = (
         select(func.count(DBDish.id))
-        .join(DBSubmenu)
-        .where(DBSubmenu.menu_id == menu_id)
+        .where(DBDish.submenu_id == DBSubmenu.id)
+        .scalar_subquery()
+    )
+    fixed_submenus = db.execute(
+        update(DBSubmenu)
+        .where(DBSubmenu.dishes_count.is_distinct_from(submenu_dishes))
+        .values(dishes_count=submenu_dishes, version=DBSubmenu.version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    menu_submenus = (
+        select(func.count(DBSubmenu.id))
+        .where(DBSubmenu.menu_id == DBMenu.id)
+        .scalar_subquery()
+    )
+    menu_dishes = (
+        select(func.coalesce(func.sum(DBSubmenu.dishes_count), 0))
+        .where(DBSubmenu.menu_id == DBMenu.id)
+        .scalar_subquery()
     )
+    fixed_menus = db.execute(
+        update(DBMenu)
+        .where(
+            DBMenu.submenus_count.is_distinct_from(menu_submenus)
+            | DBMenu.dishes_count.is_distinct_from(menu_dishes)
+        )
+        .values(
+            submenus_count=menu_submenus,
+            dishes_count=menu_dishes,
+            version=DBMenu.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    db.commit()
+
+    return fixed_submenus, fixed_menus
+
+
+# Shift the stored counters of a menu and bump its version. Returns 0 when
+# the menu does not exist or is marked deleted.
+def add_to_menu_counts(
+    db: Session, menu_id: int, submenus: int = 0, dishes: int = 0
+) -> int:
+    return db.execute(
+        update(DBMenu)
+        .where(DBMenu.id == menu_id, DBMenu.deleted_at.is_(None))
+        .values(
+            submenus_count=DBMenu.submenus_count + submenus,
+            dishes_count=DBMenu.dishes_count + dishes,
+            version=DBMenu.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# Shift the stored dishes counter of a submenu and bump its version
+def add_to_submenu_counts(db: Session, submenu_id: int, dishes: int) -> None:
+    db.execute(
+        update(DBSubmenu)
+        .where(DBSubmenu.id == submenu_id)
+        .values(
+            dishes_count=DBSubmenu.dishes_count + dishes,
+            version=DBSubmenu.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+# Conditions hiding menus marked deleted, and everything below them, from
+# reads until the menu is purged. The arguments are a menu or submenu id,
+# either a value or the column of the enclosing query.
+def menu_is_live(menu_id):
+    return exists().where(DBMenu.id == menu_id, DBMenu.deleted_at.is_(None))
+
 
-    return submenus_count, dishes_count
+def submenu_is_live(submenu_id):
+    return exists().where(
+        DBSubmenu.id == submenu_id,
+        DBMenu.id == DBSubmenu.menu_id,
+        DBMenu.deleted_at.is_(None),
+    )
 
 
 # Get items from db
@@ -43,17 +117,34 @@ def get_item_from_db(db: Session, model, **kwargs):
 
 # Get menu by id from db
 def get_menu_from_db(db: Session, menu_id: int):
-    return get_item_from_db(db, DBMenu, id=menu_id)
+    return get_item_from_db(db, DBMenu, id=menu_id, deleted_at=None)
 
 
 # Get submenu by id from db
 def get_submenu_from_db(db: Session, menu_id: int, submenu_id: int):
-    return get_item_from_db(db, DBSubmenu, menu_id=menu_id, id=submenu_id)
+    return db.execute(
+        select(DBSubmenu)
+        .filter_by(menu_id=menu_id, id=submenu_id)
+        .where(menu_is_live(menu_id))
+    ).scalar()
 
 
 # Get dish by id from db
 def get_dish_from_db(db: Session, dish_id: int, submenu_id: int):
-    return get_item_from_db(db, DBDish, id=dish_id, submenu_id=submenu_id)
+    return db.execute(
+        select(DBDish)
+        .filter_by(id=dish_id, submenu_id=submenu_id)
+        .where(submenu_is_live(submenu_id))
+    ).scalar()
+
+
+# Get id of the menu the submenu belongs to
+def get_menu_id_of_submenu(db: Session, submenu_id: int) -> Optional[int]:
+    return db.scalar(
+        select(DBSubmenu.menu_id).where(
+            DBSubmenu.id == submenu_id, menu_is_live(DBSubmenu.menu_id)
+        )
+    )
 
 
 # Класс Pydantic для Блюда (используется для входных данных при создании)
@@ -63,6 +154,14 @@ class DishCreate(BaseModel):
     price: float
 
 
+# Класс Pydantic для Блюда (изменение нескольких блюд одним запросом)
+class DishBulkUpdate(BaseModel):
+    id: int
+    title: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+
+
 # Класс Pydantic для Блюда (используется для вывода данных)
 class DishBase(BaseModel):
     id: str
@@ -78,6 +177,7 @@ class DishBase(BaseModel):
 class SubMenuCreate(BaseModel):
     title: str
     description: str
+    dishes: Optional[List[DishCreate]] = None
 
 
 # Класс Pydantic для Подменю (используется для вывода данных)
@@ -110,6 +210,24 @@ class MenuBase(BaseModel):
         orm_mode = True
 
 
+# Класс Pydantic для дерева Меню с подменю, блюдами и счетчиками
+class MenuTreeResponse(MenuBase):
+    submenus_count: int = 0
+    dishes_count: int = 0
+
+
+# Результат импорта Подменю: id подменю и его блюд
+class SubMenuImportResult(BaseModel):
+    id: str
+    dishes: List[str] = []
+
+
+# Результат импорта Меню: id меню и его подменю
+class MenuImportResult(BaseModel):
+    id: str
+    submenus: List[SubMenuImportResult] = []
+
+
 # Ответы от сервера (Response модели)
 class DishResponse(BaseModel):
     id: str
@@ -119,6 +237,20 @@ class DishResponse(BaseModel):
     dishes_count: int  # Add the dishes_count field
 
 
+class DishBulkUpdateResult(BaseModel):
+    id: str
+    updated: int
+
+
+class DishSearchResult(BaseModel):
+    id: str
+    title: str
+    description: str
+    price: str
+    submenu_id: str
+    menu_id: str
+
+
 class SubMenuResponse(BaseModel):
     id: str
     title: str
@@ -0,0 +1,120 @@
+# Module containing the dish full-text search.
+#
+# Every word of the query must match a word of the dish title or
+# description by prefix ("сал" finds "Салат"). Results are ranked, title
+# matches first, and paged by (rank, id) cursors, so deep pages cost the
+# same as the first one. The text indexes are described in app.models.
+
+
+import base64
+import binascii
+import json
+import re
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import cast, column, func, literal_column, or_, select, table
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+
+from app.models import Dish as DBDish
+from app.models import Menu as DBMenu
+from app.models import Submenu as DBSubmenu
+
+WORD_PATTERN = re.compile(r"\w+")
+
+dishes_search = table("dishes_search", column("rowid"))
+
+
+# Split a search query into lowercase words
+def parse_query(q: str) -> List[str]:
+    return WORD_PATTERN.findall(q.lower())
+
+
+# Encode the rank and id of the last result of a page into a cursor
+def encode_cursor(rank: float, last_id: int) -> str:
+    data = json.dumps({"rank": rank, "id": last_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+# Decode a cursor back into the rank and id of the last result of a page
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(data)
+        rank, last_id = position["rank"], position["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+    if not isinstance(rank, (int, float)) or not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return float(rank), last_id
+
+
+# Get the match condition and rank of a search, higher rank first
+def _match_and_rank(dialect: str, words: List[str]):
+    if dialect == "postgresql":
+        search_vector = literal_column("dishes.search_vector")
+        query = func.to_tsquery("simple", " & ".join(f"{w}:*" for w in words))
+        # ts_rank() returns real, widened so cursors round-trip it exactly
+        rank = cast(func.ts_rank(search_vector, query), DOUBLE_PRECISION)
+        return search_vector.op("@@")(query), rank
+
+    if dialect == "sqlite":
+        query = " AND ".join(f'"{w}"*' for w in words)
+        # bm25() is lower for better matches; title words weigh twice as much
+        rank = -func.bm25(literal_column("dishes_search"), 2.0, 1.0)
+        return literal_column("dishes_search").op("MATCH")(query), rank
+
+    raise HTTPException(
+        status_code=501, detail=f"Search is not supported on {dialect}"
+    )
+
+
+# Get the statement of a search results page
+def get_search_statement(
+    dialect: str,
+    words: List[str],
+    menu_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+):
+    match, rank = _match_and_rank(dialect, words)
+    stmt = (
+        select(
+            DBDish.id,
+            DBDish.title,
+            DBDish.description,
+            DBDish.price,
+            DBDish.submenu_id,
+            DBSubmenu.menu_id,
+            rank.label("rank"),
+        )
+        .join(DBSubmenu, DBSubmenu.id == DBDish.submenu_id)
+        .join(DBMenu, DBMenu.id == DBSubmenu.menu_id)
+        .where(match, DBMenu.deleted_at.is_(None))
+    )
+    if dialect == "sqlite":
+        stmt = stmt.join(dishes_search, dishes_search.c.rowid == DBDish.id)
+    if menu_id is not None:
+        stmt = stmt.where(DBSubmenu.menu_id == menu_id)
+    if min_price is not None:
+        stmt = stmt.where(DBDish.price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(DBDish.price <= max_price)
+
+    # The rank is computed once in a subquery, so the cursor condition and
+    # ORDER BY compare the same value
+    results = stmt.subquery()
+    page = select(results).order_by(results.c.rank.desc(), results.c.id).limit(limit)
+    if cursor is not None:
+        last_rank, last_id = decode_cursor(cursor)
+        page = page.where(
+            or_(
+                results.c.rank < last_rank,
+                (results.c.rank == last_rank) & (results.c.id > last_id),
+            )
+        )
+    return page
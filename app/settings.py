@@ -1,3 +1,127 @@
-from decouple import config
+from decouple import Csv, config
 
 SQLALCHEMY_DATABASE_URL = config("DATABASE_URL")
+
+# Connection pool
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=float)
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", default=True, cast=bool)
+DB_ECHO = config("DB_ECHO", default=False, cast=bool)
+
+# Statement timeouts in milliseconds, 0 disables them.
+# DB_ROUTE_STATEMENT_TIMEOUTS overrides the default per route name,
+# e.g. "export_catalogue=0,import_menus=60000".
+DB_STATEMENT_TIMEOUT = config("DB_STATEMENT_TIMEOUT", default=5000, cast=int)
+DB_ROUTE_STATEMENT_TIMEOUTS = {
+    route: int(timeout)
+    for route, timeout in (
+        item.split("=", 1)
+        for item in config(
+            "DB_ROUTE_STATEMENT_TIMEOUTS",
+            default="export_catalogue=0,import_menus=60000",
+            cast=Csv(),
+        )
+    )
+}
+
+# Read replicas serving GET requests, "round_robin" or "least_connections".
+# After a write a client reads from the primary for DB_REPLICA_PIN_SECONDS.
+SQLALCHEMY_REPLICA_URLS = config("DATABASE_REPLICA_URLS", default="", cast=Csv())
+DB_REPLICA_BALANCING = config("DB_REPLICA_BALANCING", default="round_robin")
+DB_REPLICA_PIN_SECONDS = config("DB_REPLICA_PIN_SECONDS", default=5, cast=float)
+
+
+# Get the async driver URL for a database URL
+def to_async_url(url: str) -> str:
+    return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+# Serve requests with AsyncEngine/AsyncSession instead of the threadpool
+DB_ASYNC = config("DB_ASYNC", default=False, cast=bool)
+SQLALCHEMY_ASYNC_DATABASE_URL = config(
+    "ASYNC_DATABASE_URL", default=to_async_url(SQLALCHEMY_DATABASE_URL)
+)
+SQLALCHEMY_ASYNC_REPLICA_URLS = config(
+    "ASYNC_DATABASE_REPLICA_URLS",
+    default=",".join(to_async_url(url) for url in SQLALCHEMY_REPLICA_URLS),
+    cast=Csv(),
+)
+
+# Per-route latency and SQL statement metrics exposed at /metrics
+REQUEST_METRICS = config("REQUEST_METRICS", default=True, cast=bool)
+
+# Send list pages without validating them against the response model again
+FAST_RESPONSES = config("FAST_RESPONSES", default=True, cast=bool)
+
+# Per-route SQL statement budgets: "off", "log" or "raise"
+DB_QUERY_BUDGET = config("DB_QUERY_BUDGET", default="off")
+
+# Admission control: at most ADMISSION_READ_LIMIT reads and
+# ADMISSION_WRITE_LIMIT writes at once, up to ADMISSION_QUEUE_SIZE more of
+# each waiting ADMISSION_QUEUE_TIMEOUT seconds, the rest get 503
+ADMISSION_CONTROL = config("ADMISSION_CONTROL", default=False, cast=bool)
+ADMISSION_READ_LIMIT = config(
+    "ADMISSION_READ_LIMIT", default=DB_POOL_SIZE + DB_MAX_OVERFLOW, cast=int
+)
+ADMISSION_WRITE_LIMIT = config("ADMISSION_WRITE_LIMIT", default=DB_POOL_SIZE, cast=int)
+ADMISSION_QUEUE_SIZE = config("ADMISSION_QUEUE_SIZE", default=100, cast=int)
+ADMISSION_QUEUE_TIMEOUT = config("ADMISSION_QUEUE_TIMEOUT", default=2, cast=float)
+ADMISSION_RETRY_AFTER = config("ADMISSION_RETRY_AFTER", default=1, cast=int)
+
+# Group commit: creates of menus, submenus and dishes arriving within
+# GROUP_COMMIT_WINDOW milliseconds share one transaction, up to
+# GROUP_COMMIT_MAX_BATCH rows of a kind
+GROUP_COMMIT = config("GROUP_COMMIT", default=False, cast=bool)
+GROUP_COMMIT_WINDOW = config("GROUP_COMMIT_WINDOW", default=5, cast=float)
+GROUP_COMMIT_MAX_BATCH = config("GROUP_COMMIT_MAX_BATCH", default=500, cast=int)
+
+# Menus with more submenus and dishes than DB_PURGE_THRESHOLD are deleted
+# in the background, DB_PURGE_BATCH_SIZE dishes per transaction. Pending
+# deletes are also looked for every DB_PURGE_INTERVAL seconds.
+DB_PURGE_THRESHOLD = config("DB_PURGE_THRESHOLD", default=10000, cast=int)
+DB_PURGE_BATCH_SIZE = config("DB_PURGE_BATCH_SIZE", default=1000, cast=int)
+DB_PURGE_INTERVAL = config("DB_PURGE_INTERVAL", default=60, cast=float)
+
+# Serve GET requests from an in-memory snapshot of the catalogue, reloaded
+# in full every READ_SNAPSHOT_RECONCILE_SECONDS to catch outside changes
+READ_SNAPSHOT = config("READ_SNAPSHOT", default=False, cast=bool)
+READ_SNAPSHOT_RECONCILE_SECONDS = config(
+    "READ_SNAPSHOT_RECONCILE_SECONDS", default=60, cast=float
+)
+
+# Identical concurrent GET requests share one read (single flight) on the
+# routes named in SINGLE_FLIGHT_ROUTES, "*" for all and empty for none.
+# A request waits for the shared read at most SINGLE_FLIGHT_TIMEOUT seconds.
+SINGLE_FLIGHT_ROUTES = config("SINGLE_FLIGHT_ROUTES", default="*", cast=Csv())
+SINGLE_FLIGHT_TIMEOUT = config("SINGLE_FLIGHT_TIMEOUT", default=5, cast=float)
+
+# Compress responses of at least COMPRESSION_MIN_SIZE bytes with zstd, br or
+# gzip as the client accepts. COMPRESSION_LEVELS overrides the level per
+# encoding, e.g. "gzip=6,br=4,zstd=3". Up to COMPRESSION_CACHE_ENTRIES
+# compressed GET bodies are kept in memory. Off by default, as a reverse
+# proxy in front of the app usually compresses already.
+COMPRESSION = config("COMPRESSION", default=False, cast=bool)
+COMPRESSION_MIN_SIZE = config("COMPRESSION_MIN_SIZE", default=1024, cast=int)
+COMPRESSION_LEVELS = {
+    encoding: int(level)
+    for encoding, level in (
+        item.split("=", 1)
+        for item in config("COMPRESSION_LEVELS", default="", cast=Csv())
+    )
+}
+COMPRESSION_CACHE_ENTRIES = config(
+    "COMPRESSION_CACHE_ENTRIES", default=1000, cast=int
+)
+
+# Response cache: "none", "memory" (per process) or "redis"
+CACHE_BACKEND = config("CACHE_BACKEND", default="none")
+CACHE_TTL = config("CACHE_TTL", default=60, cast=int)
+CACHE_MAX_ENTRIES = config("CACHE_MAX_ENTRIES", default=10000, cast=int)
+CACHE_REDIS_URL = config("CACHE_REDIS_URL", default="redis://localhost:6379/0")
+
+# Worker processes started by docker-entrypoint.sh, 0 to pick: one per CPU
+# when the cache is shared through Redis, otherwise one, as workers do not
+# see each other's in-process cache invalidations or read snapshot updates
+WEB_CONCURRENCY = config("WEB_CONCURRENCY", default=0, cast=int)
@@ -0,0 +1,113 @@
+# Module coalescing identical concurrent reads (single flight).
+#
+# When a popular response is not cached, for example right after its cache
+# entry expired or at a cold start, concurrent requests for it would all
+# run the same queries. Instead the first request runs them and the ones
+# arriving meanwhile wait for its result, or its error, and share it. The
+# loaders run through app.async_views, so this covers both the sync views
+# in the threadpool and the async ones; all bookkeeping happens on the
+# event loop and needs no locking.
+#
+# A request only joins a read started after the last commit in this
+# process, so it never gets data older than a write it could have seen.
+# Reads from the primary, of clients pinned to it after a write, are not
+# shared with replica reads. A request waits at most SINGLE_FLIGHT_TIMEOUT
+# seconds for the shared read, then reads by itself.
+
+
+import asyncio
+import itertools
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import database, metrics
+from app.settings import SINGLE_FLIGHT_ROUTES, SINGLE_FLIGHT_TIMEOUT
+
+READS = metrics.register(
+    metrics.Counter(
+        "single_flight_reads_total",
+        "Coalesced reads by route and outcome: run, shared or fallback",
+        ("route", "outcome"),
+    )
+)
+
+# Route name of the current request and whether it reads from a replica,
+# None when not coalesced
+current_route: ContextVar[Optional[Tuple[str, bool]]] = ContextVar(
+    "single_flight_route", default=None
+)
+
+_in_flight: Dict[tuple, Tuple[int, asyncio.Future]] = {}
+
+_commits = itertools.count(1)
+_generation = 0
+
+
+# Count commits, so reads started before one are not joined after it
+@event.listens_for(Session, "after_commit")
+def _next_generation(session) -> None:
+    global _generation
+    _generation = next(_commits)
+
+
+# Router dependency enabling coalescing for the GET routes selected in
+# settings
+async def coalesce_route(request: Request) -> None:
+    name = getattr(request.scope.get("endpoint"), "__name__", None)
+    enabled = request.method == "GET" and (
+        "*" in SINGLE_FLIGHT_ROUTES or name in SINGLE_FLIGHT_ROUTES
+    )
+    replica = database.reads_from_replica(request)
+    current_route.set((name, replica) if enabled else None)
+
+
+# Run loader, a coroutine function reading the response identified by key,
+# or share the result of an identical read already running
+async def run(key: str, loader):
+    route = current_route.get()
+    if route is None:
+        return await loader()
+
+    flight_key = (*route, key)
+    entry = _in_flight.get(flight_key)
+    if entry is not None and entry[0] == _generation:
+        future = entry[1]
+        try:
+            result = await asyncio.wait_for(
+                asyncio.shield(future), SINGLE_FLIGHT_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            READS.inc(route[0], "fallback")
+            return await loader()
+        except asyncio.CancelledError:
+            # The request that ran the read went away, not this one
+            if not future.cancelled():
+                raise
+            READS.inc(route[0], "fallback")
+            return await loader()
+        READS.inc(route[0], "shared")
+        return result
+
+    future = asyncio.get_event_loop().create_future()
+    _in_flight[flight_key] = (_generation, future)
+    READS.inc(route[0], "run")
+    try:
+        result = await loader()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        # Retrieved by waiters, if any; keep asyncio from logging it
+        future.exception()
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        if _in_flight.get(flight_key, (None, None))[1] is future:
+            del _in_flight[flight_key]
@@ -0,0 +1,669 @@
+# Module containing the in-memory read model of the catalogue.
+#
+# With READ_SNAPSHOT enabled the whole menu/submenu/dish graph is loaded
+# into immutable tuples at startup and every GET route is answered from it,
+# without touching the database. A write reloads the rows it changed once
+# it has committed and publishes a new snapshot sharing everything else
+# with the previous one (copy-on-write). A background job reloads the
+# whole catalogue every READ_SNAPSHOT_RECONCILE_SECONDS to catch changes
+# made elsewhere, such as by other worker processes or directly in the
+# database.
+#
+# Every load takes a ticket before running its statements. A menu is only
+# replaced by a full load with a newer ticket than the one it was published
+# from and than any row applied to it since, and a row only by a load newer
+# than both. A load that started later has seen every commit an earlier
+# one has, so racing writes never roll a menu or a row back.
+
+
+import asyncio
+import bisect
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import database, metrics, pagination
+from app.models import Dish as DBDish
+from app.models import Menu as DBMenu
+from app.models import Submenu as DBSubmenu
+from app.settings import READ_SNAPSHOT, READ_SNAPSHOT_RECONCILE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class DishEntry(NamedTuple):
+    id: int
+    title: str
+    description: Optional[str]
+    price: float
+    version: int
+    updated_at: datetime
+
+
+class SubmenuEntry(NamedTuple):
+    id: int
+    title: str
+    description: str
+    dishes_count: int
+    version: int
+    updated_at: datetime
+    dish_ids: Tuple[int, ...]
+    dishes: Dict[int, DishEntry]
+
+
+class MenuEntry(NamedTuple):
+    id: int
+    title: str
+    description: str
+    submenus_count: int
+    dishes_count: int
+    version: int
+    updated_at: datetime
+    submenu_ids: Tuple[int, ...]
+    submenus: Dict[int, SubmenuEntry]
+
+
+class Catalogue(NamedTuple):
+    menus: Dict[int, MenuEntry]
+    menu_ids: Tuple[int, ...]
+    # Menu of each submenu, for the dish routes that are keyed by submenu
+    submenu_menus: Dict[int, int]
+
+
+# The published snapshot, None while the database serves the reads
+catalogue: Optional[Catalogue] = None
+
+_tickets = itertools.count(1)
+_published: Dict[int, int] = {}
+# Tickets of the rows applied by update() since their menu was last
+# published, as {menu_id: {(table, row_id): ticket}}
+_applied: Dict[int, Dict[Tuple[str, int], int]] = {}
+_lock = threading.Lock()
+_reconciled_at = 0.0
+_task: Optional[asyncio.Task] = None
+
+DRIFT = metrics.register(
+    metrics.Counter(
+        "read_snapshot_drift_total",
+        "Menus corrected by the read snapshot reconciliation",
+    )
+)
+metrics.register(
+    metrics.Gauge(
+        "read_snapshot_menus",
+        "Menus held in the read snapshot",
+        lambda: len(catalogue.menus) if catalogue is not None else 0,
+    )
+)
+metrics.register(
+    metrics.Gauge(
+        "read_snapshot_age_seconds",
+        "Time since the read snapshot was last reconciled",
+        lambda: time.time() - _reconciled_at if _reconciled_at else 0,
+    )
+)
+
+
+# Columns of the entries, in the order of their fields
+MENU_COLUMNS = (
+    DBMenu.id,
+    DBMenu.title,
+    DBMenu.description,
+    DBMenu.submenus_count,
+    DBMenu.dishes_count,
+    DBMenu.version,
+    DBMenu.updated_at,
+)
+SUBMENU_COLUMNS = (
+    DBSubmenu.id,
+    DBSubmenu.title,
+    DBSubmenu.description,
+    DBSubmenu.dishes_count,
+    DBSubmenu.version,
+    DBSubmenu.updated_at,
+)
+DISH_COLUMNS = (
+    DBDish.id,
+    DBDish.title,
+    DBDish.description,
+    DBDish.price,
+    DBDish.version,
+    DBDish.updated_at,
+)
+
+
+# Get the statement loading menus with their submenus and dishes
+def get_load_statement(menu_ids: Optional[Iterable[int]] = None):
+    stmt = (
+        select(*MENU_COLUMNS, *SUBMENU_COLUMNS, *DISH_COLUMNS)
+        .outerjoin(DBSubmenu, DBSubmenu.menu_id == DBMenu.id)
+        .outerjoin(DBDish, DBDish.submenu_id == DBSubmenu.id)
+        .where(DBMenu.deleted_at.is_(None))
+        .order_by(DBMenu.id, DBSubmenu.id, DBDish.id)
+    )
+    if menu_ids is not None:
+        stmt = stmt.where(DBMenu.id.in_(list(menu_ids)))
+    return stmt
+
+
+# Build menu entries from the rows of the load statement
+def build_menus(rows) -> Dict[int, MenuEntry]:
+    menu_fields: Dict[int, tuple] = {}
+    submenu_fields: Dict[int, Dict[int, tuple]] = {}
+    dishes: Dict[int, Dict[int, DishEntry]] = {}
+
+    for row in rows:
+        menu_id, submenu_id, dish_id = row[0], row[7], row[13]
+        if menu_id not in menu_fields:
+            menu_fields[menu_id] = row[0:7]
+            submenu_fields[menu_id] = {}
+        if submenu_id is not None and submenu_id not in submenu_fields[menu_id]:
+            submenu_fields[menu_id][submenu_id] = row[7:13]
+            dishes[submenu_id] = {}
+        if dish_id is not None:
+            dishes[submenu_id][dish_id] = DishEntry(*row[13:19])
+
+    menus = {}
+    for menu_id, fields in menu_fields.items():
+        submenus = {
+            submenu_id: SubmenuEntry(
+                *submenu, tuple(dishes[submenu_id]), dishes[submenu_id]
+            )
+            for submenu_id, submenu in submenu_fields[menu_id].items()
+        }
+        menus[menu_id] = MenuEntry(*fields, tuple(submenus), submenus)
+    return menus
+
+
+# Load menus, all of them when menu_ids is None. Returns the load's ticket
+# and the menus found.
+def load(
+    db: Session, menu_ids: Optional[Iterable[int]] = None
+) -> Tuple[int, Dict[int, MenuEntry]]:
+    ticket = next(_tickets)
+    return ticket, build_menus(db.execute(get_load_statement(menu_ids)))
+
+
+# Build a catalogue from scratch
+def index(menus: Dict[int, MenuEntry]) -> Catalogue:
+    return Catalogue(
+        menus,
+        tuple(sorted(menus)),
+        {
+            submenu_id: menu_id
+            for menu_id, menu in menus.items()
+            for submenu_id in menu.submenu_ids
+        },
+    )
+
+
+# Publish the menus of a load for the menu ids it covered, keeping menus
+# published from newer loads. Returns the number of menus that changed.
+def publish(ticket: int, covered: Iterable[int], menus: Dict[int, MenuEntry]) -> int:
+    global catalogue
+    with _lock:
+        current = catalogue
+        if current is None:
+            return 0
+
+        new_menus = dict(current.menus)
+        submenu_menus = current.submenu_menus
+        membership_changed = False
+        changed = 0
+        for menu_id in covered:
+            if _published.get(menu_id, 0) > ticket or ticket < max(
+                _applied.get(menu_id, {}).values(), default=0
+            ):
+                continue
+            _published[menu_id] = ticket
+            _applied.pop(menu_id, None)
+
+            old, new = new_menus.get(menu_id), menus.get(menu_id)
+            if old == new:
+                continue
+            changed += 1
+
+            old_submenus = old.submenu_ids if old is not None else ()
+            new_submenus = new.submenu_ids if new is not None else ()
+            if old_submenus != new_submenus:
+                if submenu_menus is current.submenu_menus:
+                    submenu_menus = dict(submenu_menus)
+                for submenu_id in old_submenus:
+                    submenu_menus.pop(submenu_id, None)
+                for submenu_id in new_submenus:
+                    submenu_menus[submenu_id] = menu_id
+
+            if new is None:
+                del new_menus[menu_id]
+                membership_changed = True
+            else:
+                membership_changed = membership_changed or old is None
+                new_menus[menu_id] = new
+
+        if changed:
+            menu_ids = (
+                tuple(sorted(new_menus)) if membership_changed else current.menu_ids
+            )
+            catalogue = Catalogue(new_menus, menu_ids, submenu_menus)
+        return changed
+
+
+# Reload whole menus after a write has committed, for writes creating
+# entire menus such as the import. Called from the write views with their
+# session; the statement is not counted against the route's query budget.
+# Failures are left to the reconciliation.
+def refresh(db: Session, menu_ids: Iterable[Optional[int]]) -> None:
+    if catalogue is None:
+        return
+
+    menu_ids = [menu_id for menu_id in menu_ids if menu_id is not None]
+    if not menu_ids:
+        return
+
+    token = metrics.request_stats.set(None)
+    try:
+        ticket, menus = load(db, menu_ids)
+    except SQLAlchemyError:
+        logger.exception("Read snapshot refresh failed for menus %s", menu_ids)
+        return
+    finally:
+        metrics.request_stats.reset(token)
+
+    publish(ticket, menu_ids, menus)
+
+
+# Reload the rows a write has changed once it has committed and apply them
+# to the snapshot, a missing row being deleted. Dishes are given as
+# (submenu_id, dish_id). Like refresh(), the statements, one per table
+# given, are not counted against the route's query budget.
+def update(
+    db: Session,
+    menus: Iterable[int] = (),
+    submenus: Iterable[int] = (),
+    dishes: Iterable[Tuple[int, int]] = (),
+) -> None:
+    if catalogue is None:
+        return
+
+    menu_ids, submenu_ids, dishes = set(menus), set(submenus), set(dishes)
+    dish_ids = {dish_id for _, dish_id in dishes}
+    token = metrics.request_stats.set(None)
+    try:
+        ticket = next(_tickets)
+        menu_rows = submenu_rows = dish_rows = {}
+        if menu_ids:
+            menu_rows = {
+                row[0]: row
+                for row in db.execute(
+                    select(*MENU_COLUMNS).where(
+                        DBMenu.id.in_(menu_ids), DBMenu.deleted_at.is_(None)
+                    )
+                )
+            }
+        if submenu_ids:
+            submenu_rows = {
+                row[1]: row
+                for row in db.execute(
+                    select(DBSubmenu.menu_id, *SUBMENU_COLUMNS).where(
+                        DBSubmenu.id.in_(submenu_ids)
+                    )
+                )
+            }
+        if dish_ids:
+            dish_rows = {
+                row[1]: row
+                for row in db.execute(
+                    select(DBDish.submenu_id, *DISH_COLUMNS).where(
+                        DBDish.id.in_(dish_ids)
+                    )
+                )
+            }
+    except SQLAlchemyError:
+        logger.exception("Read snapshot update failed")
+        return
+    finally:
+        metrics.request_stats.reset(token)
+
+    apply(ticket, menu_ids, menu_rows, submenu_ids, submenu_rows, dishes, dish_rows)
+
+
+# Record that a row of a menu is being applied from a load, unless a newer
+# load has already published the menu or applied the row
+def _claim(menu_id: int, row: Tuple[str, int], ticket: int) -> bool:
+    if _published.get(menu_id, 0) > ticket:
+        return False
+    applied = _applied.setdefault(menu_id, {})
+    if applied.get(row, 0) > ticket:
+        return False
+    applied[row] = ticket
+    return True
+
+
+# Apply rows loaded by update(), rebuilding only the entries on their path
+def apply(
+    ticket: int,
+    menu_ids: Iterable[int],
+    menu_rows: Dict[int, tuple],
+    submenu_ids: Iterable[int],
+    submenu_rows: Dict[int, tuple],
+    dishes: Iterable[Tuple[int, int]],
+    dish_rows: Dict[int, tuple],
+) -> None:
+    global catalogue
+    with _lock:
+        current = catalogue
+        if current is None:
+            return
+
+        menus = dict(current.menus)
+        submenu_menus = current.submenu_menus
+        membership_changed = False
+
+        # Set or, with None, drop the menu of a submenu, copying the index
+        # on its first change
+        def set_menu_of(submenu_id: int, menu_id: Optional[int]) -> None:
+            nonlocal submenu_menus
+            if submenu_menus is current.submenu_menus:
+                submenu_menus = dict(submenu_menus)
+            if menu_id is None:
+                submenu_menus.pop(submenu_id, None)
+            else:
+                submenu_menus[submenu_id] = menu_id
+
+        for menu_id in menu_ids:
+            if not _claim(menu_id, ("menus", menu_id), ticket):
+                continue
+            old, row = menus.get(menu_id), menu_rows.get(menu_id)
+            if row is not None:
+                submenus = old.submenus if old is not None else {}
+                menus[menu_id] = MenuEntry(*row, tuple(submenus), submenus)
+                membership_changed = membership_changed or old is None
+            elif old is not None:
+                del menus[menu_id]
+                for submenu_id in old.submenu_ids:
+                    set_menu_of(submenu_id, None)
+                membership_changed = True
+
+        for submenu_id in submenu_ids:
+            row = submenu_rows.get(submenu_id)
+            menu_id = row[0] if row is not None else submenu_menus.get(submenu_id)
+            menu = menus.get(menu_id)
+            if menu is None or not _claim(menu_id, ("submenus", submenu_id), ticket):
+                continue
+            submenus = dict(menu.submenus)
+            old = submenus.pop(submenu_id, None)
+            if row is not None:
+                children = old.dishes if old is not None else {}
+                submenus[submenu_id] = SubmenuEntry(
+                    *row[1:], tuple(children), children
+                )
+            if (old is None) != (row is None):
+                set_menu_of(submenu_id, menu_id if row is not None else None)
+            submenus = {key: submenus[key] for key in sorted(submenus)}
+            menus[menu_id] = menu._replace(
+                submenu_ids=tuple(submenus), submenus=submenus
+            )
+
+        # Dishes are applied per submenu so each submenu is rebuilt once
+        by_submenu: Dict[int, Dict[int, Optional[tuple]]] = {}
+        for submenu_id, dish_id in dishes:
+            row = dish_rows.get(dish_id)
+            submenu_id = row[0] if row is not None else submenu_id
+            by_submenu.setdefault(submenu_id, {})[dish_id] = row
+        for submenu_id, rows in by_submenu.items():
+            menu_id = submenu_menus.get(submenu_id)
+            menu = menus.get(menu_id)
+            if menu is None:
+                continue
+            submenu = menu.submenus[submenu_id]
+            children = dict(submenu.dishes)
+            for dish_id, row in rows.items():
+                if not _claim(menu_id, ("dishes", dish_id), ticket):
+                    continue
+                children.pop(dish_id, None)
+                if row is not None:
+                    children[dish_id] = DishEntry(*row[1:])
+            children = {key: children[key] for key in sorted(children)}
+            submenus = dict(menu.submenus)
+            submenus[submenu_id] = submenu._replace(
+                dish_ids=tuple(children), dishes=children
+            )
+            menus[menu_id] = menu._replace(submenus=submenus)
+
+        menu_ids = tuple(sorted(menus)) if membership_changed else current.menu_ids
+        catalogue = Catalogue(menus, menu_ids, submenu_menus)
+
+
+# Reload the whole catalogue and correct any drift
+async def reconcile() -> None:
+    global catalogue, _reconciled_at
+    ticket, menus = await database.run_in_session(load)
+    with _lock:
+        if catalogue is None:
+            catalogue = index(menus)
+            _published.update(dict.fromkeys(menus, ticket))
+            _reconciled_at = time.time()
+            return
+
+    # Menus with applied rows are covered too, deleted ones included, so
+    # the tickets of their rows are dropped
+    covered = set(catalogue.menus) | set(menus) | set(_applied)
+    drift = publish(ticket, covered, menus)
+    _reconciled_at = time.time()
+    if drift:
+        DRIFT.inc(amount=drift)
+        logger.warning("Read snapshot reconciliation corrected %d menus", drift)
+
+
+async def _reconcile_forever() -> None:
+    while True:
+        await asyncio.sleep(READ_SNAPSHOT_RECONCILE_SECONDS)
+        try:
+            await reconcile()
+        except Exception:
+            logger.exception("Read snapshot reconciliation failed")
+
+
+# Load the snapshot and start the reconciliation job. If the database is
+# not reachable yet, reads use it until a reconciliation succeeds.
+async def start() -> None:
+    global _task
+    if not READ_SNAPSHOT:
+        return
+
+    try:
+        await reconcile()
+    except SQLAlchemyError:
+        logger.exception("Read snapshot could not be loaded at startup")
+    _task = asyncio.get_event_loop().create_task(_reconcile_forever())
+
+
+async def stop() -> None:
+    if _task is not None:
+        _task.cancel()
+
+
+# Reads, answering like the views in app.views with the same arguments
+# minus the session.
+def _page(ids: Tuple[int, ...], skip: int, limit: int, cursor: Optional[str]):
+    if cursor is not None:
+        start = bisect.bisect_right(ids, pagination.decode_cursor(cursor))
+    else:
+        start = max(skip, 0)
+    return ids[start:start + limit] if limit >= 0 else ids[start:]
+
+
+def _find_submenu(current: Catalogue, submenu_id: int) -> Optional[SubmenuEntry]:
+    menu = current.menus.get(current.submenu_menus.get(submenu_id))
+    return menu.submenus.get(submenu_id) if menu is not None else None
+
+
+def _find_dish(current: Catalogue, dish_id: int, submenu_id: int):
+    submenu = _find_submenu(current, submenu_id)
+    return submenu.dishes.get(dish_id) if submenu is not None else None
+
+
+def _menu_response(menu: MenuEntry) -> dict:
+    return {
+        "id": str(menu.id),
+        "title": menu.title,
+        "description": menu.description,
+        "submenus_count": menu.submenus_count,
+        "dishes_count": menu.dishes_count,
+    }
+
+
+def _submenu_response(submenu: SubmenuEntry) -> dict:
+    return {
+        "id": str(submenu.id),
+        "title": submenu.title,
+        "description": submenu.description,
+        "dishes_count": submenu.dishes_count,
+    }
+
+
+def get_menus_with_counts(
+    skip: int = 0, limit: int = 10, cursor: Optional[str] = None
+) -> List[dict]:
+    current = catalogue
+    return [
+        _menu_response(current.menus[menu_id])
+        for menu_id in _page(current.menu_ids, skip, limit, cursor)
+    ]
+
+
+def get_menu_by_id(menu_id: int) -> dict:
+    menu = catalogue.menus.get(menu_id)
+    if menu is None:
+        raise HTTPException(status_code=404, detail="menu not found")
+    return _menu_response(menu)
+
+
+def get_menu_version(menu_id: int):
+    menu = catalogue.menus.get(menu_id)
+    return (menu.version, menu.updated_at) if menu is not None else None
+
+
+def get_menus_tree(menu_id: Optional[int] = None) -> List[dict]:
+    current = catalogue
+    if menu_id is None:
+        menus = [current.menus[menu_id] for menu_id in current.menu_ids]
+    elif menu_id in current.menus:
+        menus = [current.menus[menu_id]]
+    else:
+        raise HTTPException(status_code=404, detail="menu not found")
+
+    return [
+        {
+            **_menu_response(menu),
+            "submenus": [
+                {
+                    **_submenu_response(submenu),
+                    "dishes": [
+                        {
+                            "id": str(dish.id),
+                            "title": dish.title,
+                            "description": dish.description,
+                            "price": dish.price,
+                        }
+                        for dish in submenu.dishes.values()
+                    ],
+                }
+                for submenu in menu.submenus.values()
+            ],
+        }
+        for menu in menus
+    ]
+
+
+def get_submenus_with_counts(
+    menu_id: int, skip: int = 0, limit: int = 10, cursor: Optional[str] = None
+) -> List[dict]:
+    menu = catalogue.menus.get(menu_id)
+    if menu is None:
+        return []
+    return [
+        _submenu_response(menu.submenus[submenu_id])
+        for submenu_id in _page(menu.submenu_ids, skip, limit, cursor)
+    ]
+
+
+def get_submenu_by_id(menu_id: int, submenu_id: int) -> dict:
+    menu = catalogue.menus.get(menu_id)
+    submenu = menu.submenus.get(submenu_id) if menu is not None else None
+    if submenu is None:
+        raise HTTPException(status_code=404, detail="submenu not found")
+    return _submenu_response(submenu)
+
+
+def get_submenu_version(menu_id: int, submenu_id: int):
+    menu = catalogue.menus.get(menu_id)
+    submenu = menu.submenus.get(submenu_id) if menu is not None else None
+    return (submenu.version, submenu.updated_at) if submenu is not None else None
+
+
+def get_dishes_with_counts(
+    submenu_id: int, skip: int = 0, limit: int = 10, cursor: Optional[str] = None
+) -> List[dict]:
+    submenu = _find_submenu(catalogue, submenu_id)
+    if submenu is None:
+        return []
+    return [
+        {
+            "id": str(dish.id),
+            "title": dish.title,
+            "description": dish.description,
+            "price": str(dish.price),
+            "dishes_count": submenu.dishes_count,
+        }
+        for dish in map(
+            submenu.dishes.__getitem__, _page(submenu.dish_ids, skip, limit, cursor)
+        )
+    ]
+
+
+def get_dish_by_id(dish_id: int, submenu_id: int) -> dict:
+    dish = _find_dish(catalogue, dish_id, submenu_id)
+    if dish is None:
+        raise HTTPException(status_code=404, detail="dish not found")
+    return {
+        "id": str(dish.id),
+        "title": dish.title,
+        "description": dish.description or "",
+        "price": str(dish.price),
+        "dishes_count": 0,
+    }
+
+
+def get_dish_version(dish_id: int, submenu_id: int):
+    dish = _find_dish(catalogue, dish_id, submenu_id)
+    return (dish.version, dish.updated_at) if dish is not None else None
+
+
+# Rows of the catalogue export, in the order of views.get_export_statement
+def export_rows() -> Iterator[tuple]:
+    current = catalogue
+    for menu_id in current.menu_ids:
+        menu = current.menus[menu_id]
+        menu_fields = (menu.id, menu.title, menu.description)
+        if not menu.submenus:
+            yield menu_fields + (None,) * 7
+        for submenu in menu.submenus.values():
+            submenu_fields = (submenu.id, submenu.title, submenu.description)
+            if not submenu.dishes:
+                yield menu_fields + submenu_fields + (None,) * 4
+            for dish in submenu.dishes.values():
+                yield menu_fields + submenu_fields + (
+                    dish.id,
+                    dish.title,
+                    dish.description,
+                    dish.price,
+                )
@@ -1,17 +1,22 @@
 # Module containing view functions for menu-related operations.
 
 
-from typing import List
+import csv
+import io
+import json
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from fastapi import HTTPException
-from sqlalchemy import delete, func, select, update
+from sqlalchemy import bindparam, delete, func, insert, select, update
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, subqueryload
 
-from app import schemas
+from app import cache, pagination, purge, schemas, search, snapshot
 from app.models import Dish as DBDish
 from app.models import Menu as DBMenu
 from app.models import Submenu as DBSubmenu
+from app.settings import DB_PURGE_THRESHOLD
 
 
 # Create new menu
@@ -22,15 +27,15 @@ def post_create_menu(db: Session,
     try:
         db.commit()
         db.refresh(db_menu)
-
-        submenus_count, dishes_count = schemas.calculate_counts(db, db_menu.id)
+        cache.invalidate_menu(db_menu.id)
+        snapshot.update(db, menus=[db_menu.id])
 
         return schemas.MenuResponse(
             id=str(db_menu.id),
             title=db_menu.title,
             description=db_menu.description,
-            submenus_count=submenus_count,
-            dishes_count=dishes_count,
+            submenus_count=db_menu.submenus_count,
+            dishes_count=db_menu.dishes_count,
         )
     except IntegrityError as exc:
         db.rollback()
@@ -39,29 +44,173 @@ def post_create_menu(db: Session,
         ) from exc
 
 
-# Get menu list with submenus count and dishes count for each
-def get_menus_with_counts(
-    db: Session, skip: int = 0, limit: int = 10
-) -> List[schemas.MenuResponse]:
-    stmt_menus = select(DBMenu).offset(skip).limit(limit)
-    result_menus = db.execute(stmt_menus)
-    db_menus = result_menus.scalars().all()
-
-    # Calculate submenus_count and dishes_count for each menu
-    menu_responses = []
-    for menu in db_menus:
-        submenus_count, dishes_count = schemas.calculate_counts(db, menu.id)
-
-        menu_response = schemas.MenuResponse(
-            id=str(menu.id),
+# Create the menus of concurrent requests in one transaction, see
+# app.group_commit. Returns a response per item, in input order.
+def post_create_menus(db: Session, items: List[tuple]) -> list:
+    menus = [menu for menu, in items]
+    rows = [{"title": menu.title, "description": menu.description} for menu in menus]
+    try:
+        menu_ids = insert_returning_ids(db, DBMenu, rows)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return create_one_by_one(db, post_create_menu, items)
+
+    cache.invalidate_catalogue()
+    snapshot.update(db, menus=menu_ids)
+
+    return [
+        schemas.MenuResponse(
+            id=str(menu_id),
             title=menu.title,
             description=menu.description,
-            submenus_count=submenus_count,
-            dishes_count=dishes_count,
+            submenus_count=0,
+            dishes_count=0,
         )
-        menu_responses.append(menu_response)
+        for menu, menu_id in zip(menus, menu_ids)
+    ]
+
+
+# Run a create view for each item in a transaction of its own, collecting
+# its response or its HTTPException. Used for the items of a group that
+# cannot be inserted together, so each gets the error it would alone.
+def create_one_by_one(db: Session, view, items: List[tuple]) -> list:
+    results = []
+    for args in items:
+        try:
+            results.append(view(db, *args))
+        except HTTPException as exc:
+            results.append(exc)
+    return results
+
+
+# Fill in the results still missing by creating their items one by one
+def fill_one_by_one(db: Session, view, items: List[tuple], results: list) -> list:
+    missing = [i for i, result in enumerate(results) if result is None]
+    singles = create_one_by_one(db, view, [items[i] for i in missing])
+    for i, result in zip(missing, singles):
+        results[i] = result
+    return results
+
+
+# Rows per multi-row INSERT statement of the bulk import
+IMPORT_BATCH_SIZE = 1000
+
+
+# Insert rows with multi-row INSERT ... RETURNING and return their ids
+# in input order. Dialects without RETURNING fall back to one row at a time.
+def insert_returning_ids(db: Session, model, rows: List[dict]) -> List[int]:
+    if not db.get_bind().dialect.full_returning:
+        return [
+            db.execute(insert(model).values(row)).inserted_primary_key[0]
+            for row in rows
+        ]
+
+    ids = []
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        batch = rows[start:start + IMPORT_BATCH_SIZE]
+        result = db.execute(insert(model).values(batch).returning(model.id))
+        ids.extend(result.scalars().all())
+
+    return ids
+
+
+# Import menus with nested submenus and dishes in one transaction
+def post_import_menus(
+    db: Session, menus: List[schemas.MenuCreate]
+) -> List[schemas.MenuImportResult]:
+    menu_rows = []
+    for menu in menus:
+        submenus = menu.submenus or []
+        menu_rows.append(
+            {
+                "title": menu.title,
+                "description": menu.description,
+                "submenus_count": len(submenus),
+                "dishes_count": sum(len(sub.dishes or []) for sub in submenus),
+            }
+        )
+
+    try:
+        menu_ids = insert_returning_ids(db, DBMenu, menu_rows)
+
+        submenu_rows = [
+            {
+                "menu_id": menu_id,
+                "title": submenu.title,
+                "description": submenu.description,
+                "dishes_count": len(submenu.dishes or []),
+            }
+            for menu, menu_id in zip(menus, menu_ids)
+            for submenu in menu.submenus or []
+        ]
+        submenu_ids = insert_returning_ids(db, DBSubmenu, submenu_rows)
+
+        submenus = [
+            submenu for menu in menus for submenu in menu.submenus or []
+        ]
+        dish_rows = [
+            {
+                "submenu_id": submenu_id,
+                "title": dish.title,
+                "description": dish.description,
+                "price": dish.price,
+            }
+            for submenu, submenu_id in zip(submenus, submenu_ids)
+            for dish in submenu.dishes or []
+        ]
+        dish_ids = iter(insert_returning_ids(db, DBDish, dish_rows))
 
-    return menu_responses
+        db.commit()
+    except IntegrityError as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Menus import failed") from exc
+
+    cache.invalidate_catalogue()
+    snapshot.refresh(db, menu_ids)
+
+    submenu_ids = iter(submenu_ids)
+    return [
+        schemas.MenuImportResult(
+            id=str(menu_id),
+            submenus=[
+                schemas.SubMenuImportResult(
+                    id=str(next(submenu_ids)),
+                    dishes=[str(next(dish_ids)) for _ in submenu.dishes or []],
+                )
+                for submenu in menu.submenus or []
+            ],
+        )
+        for menu, menu_id in zip(menus, menu_ids)
+    ]
+
+
+# Get menu list with submenus count and dishes count for each
+# Rows are returned as plain dicts in MenuResponse field order, so the
+# router can send them without building models, see app.responses.
+def get_menus_with_counts(
+    db: Session, skip: int = 0, limit: int = 10, cursor: Optional[str] = None
+) -> List[dict]:
+    stmt = select(
+        DBMenu.id,
+        DBMenu.title,
+        DBMenu.description,
+        DBMenu.submenus_count,
+        DBMenu.dishes_count,
+    ).where(DBMenu.deleted_at.is_(None))
+    stmt = pagination.paginate(stmt, DBMenu.id, skip, limit, cursor)
+    result = db.execute(stmt)
+
+    return [
+        {
+            "id": str(menu_id),
+            "title": title,
+            "description": description,
+            "submenus_count": submenus_count,
+            "dishes_count": dishes_count,
+        }
+        for menu_id, title, description, submenus_count, dishes_count in result
+    ]
 
 
 # Get menu by id
@@ -71,16 +220,70 @@ def get_menu_by_id(db: Session, menu_id: int) -> schemas.MenuResponse:
     if not db_menu:
         raise HTTPException(status_code=404, detail="menu not found")
 
-    # Calculate submenus_count and dishes_count
-    submenus_count, dishes_count = schemas.calculate_counts(db, db_menu.id)
-
     return schemas.MenuResponse(
         id=str(db_menu.id),
         title=db_menu.title,
         description=db_menu.description,
-        submenus_count=submenus_count,
-        dishes_count=dishes_count,
+        submenus_count=db_menu.submenus_count,
+        dishes_count=db_menu.dishes_count,
+    )
+
+
+# Get menus with their submenus and dishes, optionally a single menu.
+# Eager loading keeps it at three statements whatever the catalogue size.
+def get_menus_tree(
+    db: Session, menu_id: Optional[int] = None
+) -> List[schemas.MenuTreeResponse]:
+    stmt = (
+        select(DBMenu)
+        .options(subqueryload(DBMenu.submenus).subqueryload(DBSubmenu.dishes))
+        .where(DBMenu.deleted_at.is_(None))
+        .order_by(DBMenu.id)
     )
+    if menu_id is not None:
+        stmt = stmt.where(DBMenu.id == menu_id)
+    menus = db.execute(stmt).scalars().all()
+
+    if menu_id is not None and not menus:
+        raise HTTPException(status_code=404, detail="menu not found")
+
+    return [
+        schemas.MenuTreeResponse(
+            id=str(menu.id),
+            title=menu.title,
+            description=menu.description,
+            submenus_count=menu.submenus_count,
+            dishes_count=menu.dishes_count,
+            submenus=[
+                schemas.SubMenuBase(
+                    id=str(submenu.id),
+                    title=submenu.title,
+                    description=submenu.description,
+                    dishes_count=submenu.dishes_count,
+                    dishes=[
+                        schemas.DishBase(
+                            id=str(dish.id),
+                            title=dish.title,
+                            description=dish.description,
+                            price=dish.price,
+                        )
+                        for dish in submenu.dishes
+                    ],
+                )
+                for submenu in menu.submenus
+            ],
+        )
+        for menu in menus
+    ]
+
+
+# Get version and last modification time of a menu
+def get_menu_version(db: Session, menu_id: int):
+    return db.execute(
+        select(DBMenu.version, DBMenu.updated_at).where(
+            DBMenu.id == menu_id, DBMenu.deleted_at.is_(None)
+        )
+    ).first()
 
 
 # Update_menu
@@ -93,14 +296,21 @@ def update_menu_by_id(
         raise HTTPException(status_code=404, detail="Menu not found")
     db_menu.title = menu.title
     db_menu.description = menu.description
+    db_menu.version = DBMenu.version + 1
 
     try:
         db.commit()
         db.refresh(db_menu)
+        cache.invalidate_menu(db_menu.id)
+        snapshot.update(db, menus=[db_menu.id])
 
         return schemas.MenuResponse(
-            id=str(db_menu.id), title=db_menu.title,
-            description=db_menu.description)
+            id=str(db_menu.id),
+            title=db_menu.title,
+            description=db_menu.description,
+            submenus_count=db_menu.submenus_count,
+            dishes_count=db_menu.dishes_count,
+        )
 
     except IntegrityError as exc:
         db.rollback()
@@ -109,27 +319,38 @@ def update_menu_by_id(
         ) from exc
 
 
-# Delete menu
+# Delete menu. Submenus and dishes go with it through ON DELETE CASCADE.
+# A menu with more than DB_PURGE_THRESHOLD submenus and dishes is only
+# marked deleted here and purged in the background, see app.purge.
 def delete_menu_by_id(db: Session, menu_id: int) -> schemas.MenuResponse:
-    # Check if the menu exists before deleting
     deleted_menu = schemas.get_menu_from_db(db, menu_id)
     if not deleted_menu:
         raise HTTPException(status_code=404, detail="Menu not found")
 
-    # Update all submenus related to the menu being deleted
-    # and set their menu_id to None
-    stmt_update_submenus = (
-        update(DBSubmenu).where(
-            DBSubmenu.menu_id == menu_id).values(menu_id=None)
+    submenu_ids = (
+        db.execute(select(DBSubmenu.id).where(DBSubmenu.menu_id == menu_id))
+        .scalars()
+        .all()
     )
-    db.execute(stmt_update_submenus)
 
-    # Delete the menu
-    stmt_delete_menu = delete(DBMenu).where(DBMenu.id == menu_id)
-    db.execute(stmt_delete_menu)
+    purge_later = (
+        deleted_menu.submenus_count + deleted_menu.dishes_count > DB_PURGE_THRESHOLD
+    )
+    if purge_later:
+        db.execute(
+            update(DBMenu)
+            .where(DBMenu.id == menu_id)
+            .values(deleted_at=func.now(), version=DBMenu.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        db.execute(delete(DBMenu).where(DBMenu.id == menu_id))
 
-    # Commit the transaction to apply the changes
     db.commit()
+    cache.invalidate_menu_tree(menu_id, submenu_ids)
+    snapshot.update(db, menus=[menu_id])
+    if purge_later:
+        purge.wake()
 
     return {"status": True, "message": "The menu has been deleted"}
 
@@ -141,22 +362,21 @@ def post_create_submenu(
         title=submenu.title, description=submenu.description, menu_id=menu_id
     )
     db.add(db_submenu)
+    if not schemas.add_to_menu_counts(db, menu_id, submenus=1):
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Menu not found")
 
     try:
         db.commit()
         db.refresh(db_submenu)
-
-        dishes_count = db.scalar(
-            select(func.count(DBDish.id))
-            .join(DBSubmenu)
-            .where(DBSubmenu.menu_id == db_submenu.menu_id)
-        )
+        cache.invalidate_submenu(menu_id, db_submenu.id, counts=True)
+        snapshot.update(db, menus=[menu_id], submenus=[db_submenu.id])
 
         return schemas.SubMenuResponse(
             id=str(db_submenu.id),
             title=db_submenu.title,
             description=db_submenu.description,
-            dishes_count=dishes_count,
+            dishes_count=db_submenu.dishes_count,
         )
     except IntegrityError as exc:
         db.rollback()
@@ -165,34 +385,81 @@ def post_create_submenu(
         ) from exc
 
 
-# Get submenu list with dishes count for each
-def get_submenus_with_counts(
-    db: Session, menu_id: int, skip: int = 0, limit: int = 10
-) -> schemas.SubMenuResponse:
-    stmt = (
-        select(DBSubmenu).filter(
-            DBSubmenu.menu_id == menu_id).offset(skip).limit(limit)
-    )
-    result = db.execute(stmt)
-    submenus = result.scalars().all()
-
-    submenu_responses = []
-    for submenu in submenus:
-        dishes_count = db.scalar(
-            select(func.count(DBDish.id))
-            .join(DBSubmenu)
-            .where(DBSubmenu.menu_id == submenu.menu_id)
+# Create the submenus of concurrent requests, given as (menu_id, submenu),
+# in one transaction, see app.group_commit. Items of missing or deleted
+# menus are then created one by one, failing with 404 as they would alone.
+def post_create_submenus(db: Session, items: List[tuple]) -> list:
+    existing = set(
+        db.scalars(
+            select(DBMenu.id).where(
+                DBMenu.id.in_({menu_id for menu_id, _ in items}),
+                DBMenu.deleted_at.is_(None),
+            )
         )
+    )
+    grouped = [i for i, (menu_id, _) in enumerate(items) if menu_id in existing]
+    rows = [
+        {
+            "menu_id": items[i][0],
+            "title": items[i][1].title,
+            "description": items[i][1].description,
+        }
+        for i in grouped
+    ]
 
-        submenu_response = schemas.SubMenuResponse(
-            id=str(submenu.id),
+    try:
+        submenu_ids = insert_returning_ids(db, DBSubmenu, rows)
+        for menu_id, count in Counter(row["menu_id"] for row in rows).items():
+            schemas.add_to_menu_counts(db, menu_id, submenus=count)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return create_one_by_one(db, post_create_submenu, items)
+
+    # One invalidation per menu drops its lists and counts
+    created = {items[i][0]: submenu_id for i, submenu_id in zip(grouped, submenu_ids)}
+    for menu_id, submenu_id in created.items():
+        cache.invalidate_submenu(menu_id, submenu_id, counts=True)
+    snapshot.update(db, menus=list(created), submenus=submenu_ids)
+
+    results = [None] * len(items)
+    for i, submenu_id in zip(grouped, submenu_ids):
+        submenu = items[i][1]
+        results[i] = schemas.SubMenuResponse(
+            id=str(submenu_id),
             title=submenu.title,
             description=submenu.description,
-            dishes_count=dishes_count,
+            dishes_count=0,
         )
-        submenu_responses.append(submenu_response)
+    return fill_one_by_one(db, post_create_submenu, items, results)
 
-    return submenu_responses
+
+# Get submenu list with dishes count for each
+def get_submenus_with_counts(
+    db: Session,
+    menu_id: int,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+) -> List[dict]:
+    stmt = select(
+        DBSubmenu.id,
+        DBSubmenu.title,
+        DBSubmenu.description,
+        DBSubmenu.dishes_count,
+    ).filter(DBSubmenu.menu_id == menu_id, schemas.menu_is_live(menu_id))
+    stmt = pagination.paginate(stmt, DBSubmenu.id, skip, limit, cursor)
+    result = db.execute(stmt)
+
+    return [
+        {
+            "id": str(submenu_id),
+            "title": title,
+            "description": description,
+            "dishes_count": dishes_count,
+        }
+        for submenu_id, title, description, dishes_count in result
+    ]
 
 
 # Get submenu by id
@@ -204,20 +471,25 @@ def get_submenu_by_id(
     if not db_submenu:
         raise HTTPException(status_code=404, detail="submenu not found")
 
-    # Получаем количество блюд для данного подменю
-    dishes_count = db.scalar(
-        select(func.count(DBDish.id)).join(
-            DBSubmenu).where(DBSubmenu.id == submenu_id)
-    )
-
     return schemas.SubMenuResponse(
         id=str(db_submenu.id),
         title=db_submenu.title,
         description=db_submenu.description,
-        dishes_count=dishes_count,
+        dishes_count=db_submenu.dishes_count,
     )
 
 
+# Get version and last modification time of a submenu
+def get_submenu_version(db: Session, menu_id: int, submenu_id: int):
+    return db.execute(
+        select(DBSubmenu.version, DBSubmenu.updated_at).where(
+            DBSubmenu.id == submenu_id,
+            DBSubmenu.menu_id == menu_id,
+            schemas.menu_is_live(menu_id),
+        )
+    ).first()
+
+
 # Update submenu by id
 def update_submenu_by_id(
     db: Session, menu_id: int, submenu_id: int, submenu: schemas.SubMenuCreate
@@ -228,15 +500,19 @@ def update_submenu_by_id(
 
     db_submenu.title = submenu.title
     db_submenu.description = submenu.description
+    db_submenu.version = DBSubmenu.version + 1
 
     try:
         db.commit()
         db.refresh(db_submenu)
+        cache.invalidate_submenu(menu_id, submenu_id)
+        snapshot.update(db, submenus=[submenu_id])
+
         return schemas.SubMenuResponse(
             id=str(db_submenu.id),
             title=db_submenu.title,
             description=db_submenu.description,
-            dishes_count=0,
+            dishes_count=db_submenu.dishes_count,
         )
     except IntegrityError as exc:
         db.rollback()
@@ -245,34 +521,42 @@ def update_submenu_by_id(
         ) from exc
 
 
-# Delete submenu
+# Delete submenu. Its dishes go with it through ON DELETE CASCADE.
 def delete_submenu_by_id(
     db: Session, menu_id: int, submenu_id: int
 ) -> schemas.SubMenuResponse:
-    # Check if the menu exists before deleting
-    deleted_submenu = schemas.get_submenu_from_db(db, menu_id, submenu_id)
-    if not deleted_submenu:
-        raise HTTPException(status_code=404, detail="Submenu not found")
-
-    # Update all rows in the "dishes" table related to the deleted submenu
-    stmt_update = (
-        update(DBDish)
-        .where(DBDish.submenu_id == submenu_id)
-        .values(submenu_id=None)
-        .where(DBDish.submenu_id == submenu_id)
+    conditions = (
+        DBSubmenu.menu_id == menu_id,
+        DBSubmenu.id == submenu_id,
+        schemas.menu_is_live(menu_id),
     )
-
-    db.execute(stmt_update)
-
-    # Delete submenu
-    stmt_delete = delete(DBSubmenu).where(
-        DBSubmenu.menu_id == menu_id, DBSubmenu.id == submenu_id
+    stmt = (
+        delete(DBSubmenu)
+        .where(*conditions)
+        .execution_options(synchronize_session=False)
     )
 
-    db.execute(stmt_delete)
+    # The deleted row's dishes_count is needed for the menu counters.
+    # Without RETURNING the row is read first and stays locked, so no dish
+    # is added to it before it is deleted.
+    if db.get_bind().dialect.full_returning:
+        dishes_count = db.execute(stmt.returning(DBSubmenu.dishes_count)).scalar()
+    else:
+        dishes_count = db.execute(
+            select(DBSubmenu.dishes_count).where(*conditions).with_for_update()
+        ).scalar()
+        if dishes_count is not None:
+            db.execute(stmt)
+
+    if dishes_count is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Submenu not found")
+
+    schemas.add_to_menu_counts(db, menu_id, submenus=-1, dishes=-dishes_count)
 
-    # Commit the transaction to apply the changes
     db.commit()
+    cache.invalidate_submenu_tree(menu_id, submenu_id)
+    snapshot.update(db, menus=[menu_id], submenus=[submenu_id])
 
     return {"status": True, "message": "The submenu has been deleted"}
 
@@ -281,6 +565,9 @@ def delete_submenu_by_id(
 def create_dish(
     db: Session, submenu_id: int, dish: schemas.DishCreate
 ) -> schemas.DishResponse:
+    menu_id = schemas.get_menu_id_of_submenu(db, submenu_id)
+    if menu_id is None:
+        raise HTTPException(status_code=404, detail="Submenu not found")
     db_dish = DBDish(
         title=dish.title,
         price=dish.price,
@@ -288,10 +575,19 @@ def create_dish(
         description=dish.description,
     )
     db.add(db_dish)
+    schemas.add_to_submenu_counts(db, submenu_id, dishes=1)
+    schemas.add_to_menu_counts(db, menu_id, dishes=1)
 
     try:
         db.commit()
         db.refresh(db_dish)
+        cache.invalidate_dish(menu_id, submenu_id, db_dish.id, counts=True)
+        snapshot.update(
+            db,
+            menus=[menu_id],
+            submenus=[submenu_id],
+            dishes=[(submenu_id, db_dish.id)],
+        )
 
         return schemas.DishResponse(
             id=str(db_dish.id),
@@ -307,33 +603,103 @@ def create_dish(
         ) from exc
 
 
-# Get dishes list
-def get_dishes_with_counts(
-    db: Session, submenu_id: int, skip: int = 0, limit: int = 10
-) -> schemas.DishResponse:
-    stmt = (
-        select(DBDish).filter(
-            DBDish.submenu_id == submenu_id).offset(skip).limit(limit)
+# Create the dishes of concurrent requests, given as (submenu_id, dish),
+# in one transaction, see app.group_commit. Items of missing submenus, or
+# of submenus of deleted menus, are then created one by one, failing with
+# 404 as they would alone.
+def create_dishes(db: Session, items: List[tuple]) -> list:
+    submenu_ids = {submenu_id for submenu_id, _ in items}
+    # Menu of each submenu whose menu is not marked deleted
+    menu_of = dict(
+        db.execute(
+            select(DBSubmenu.id, DBSubmenu.menu_id).where(
+                DBSubmenu.id.in_(submenu_ids),
+                schemas.menu_is_live(DBSubmenu.menu_id),
+            )
+        ).all()
     )
-    result = db.execute(stmt)
-    dishes = result.scalars().all()
-
-    if not dishes:
-        return []
+    grouped = [i for i, (submenu_id, _) in enumerate(items) if submenu_id in menu_of]
+    rows = [
+        {
+            "submenu_id": items[i][0],
+            "title": items[i][1].title,
+            "description": items[i][1].description,
+            "price": items[i][1].price,
+        }
+        for i in grouped
+    ]
 
-    stmt = select(func.count()).where(DBDish.submenu_id == submenu_id)
-    result = db.execute(stmt)
-    dish_count = result.scalar() or 0
+    try:
+        dish_ids = insert_returning_ids(db, DBDish, rows)
+        counts = Counter(row["submenu_id"] for row in rows)
+        for submenu_id, count in counts.items():
+            schemas.add_to_submenu_counts(db, submenu_id, dishes=count)
+        menu_counts = Counter()
+        for submenu_id, count in counts.items():
+            menu_counts[menu_of[submenu_id]] += count
+        for menu_id, count in menu_counts.items():
+            schemas.add_to_menu_counts(db, menu_id, dishes=count)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return create_one_by_one(db, create_dish, items)
+
+    # One invalidation per submenu drops its lists and counts
+    created = {items[i][0]: dish_id for i, dish_id in zip(grouped, dish_ids)}
+    for submenu_id, dish_id in created.items():
+        cache.invalidate_dish(menu_of[submenu_id], submenu_id, dish_id, counts=True)
+    snapshot.update(
+        db,
+        menus=list(menu_counts),
+        submenus=list(counts),
+        dishes=[(items[i][0], dish_id) for i, dish_id in zip(grouped, dish_ids)],
+    )
 
-    return [
-        schemas.DishResponse(
-            id=str(dish.id),
+    results = [None] * len(items)
+    for i, dish_id in zip(grouped, dish_ids):
+        dish = items[i][1]
+        results[i] = schemas.DishResponse(
+            id=str(dish_id),
             title=dish.title,
             description=dish.description,
             price=str(dish.price),
-            dishes_count=dish_count,
+            dishes_count=0,
         )
-        for dish in dishes
+    return fill_one_by_one(db, create_dish, items, results)
+
+
+# Get dishes list
+def get_dishes_with_counts(
+    db: Session,
+    submenu_id: int,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+) -> List[dict]:
+    dishes_count = (
+        select(DBSubmenu.dishes_count)
+        .where(DBSubmenu.id == submenu_id)
+        .scalar_subquery()
+    )
+    stmt = select(
+        DBDish.id,
+        DBDish.title,
+        DBDish.description,
+        DBDish.price,
+        dishes_count,
+    ).filter(DBDish.submenu_id == submenu_id, schemas.submenu_is_live(submenu_id))
+    stmt = pagination.paginate(stmt, DBDish.id, skip, limit, cursor)
+    result = db.execute(stmt)
+
+    return [
+        {
+            "id": str(dish_id),
+            "title": title,
+            "description": description,
+            "price": str(price),
+            "dishes_count": dishes_count,
+        }
+        for dish_id, title, description, price, dishes_count in result
     ]
 
 
@@ -354,6 +720,17 @@ def get_dish_by_id(db: Session, dish_id: int,
     )
 
 
+# Get version and last modification time of a dish
+def get_dish_version(db: Session, dish_id: int, submenu_id: int):
+    return db.execute(
+        select(DBDish.version, DBDish.updated_at).where(
+            DBDish.id == dish_id,
+            DBDish.submenu_id == submenu_id,
+            schemas.submenu_is_live(submenu_id),
+        )
+    ).first()
+
+
 # Update dish
 def update_dish_by_id(
     db: Session, dish_id: int, submenu_id: int, dish: schemas.DishCreate
@@ -365,10 +742,15 @@ def update_dish_by_id(
     db_dish.title = dish.title
     db_dish.description = dish.description
     db_dish.price = dish.price
+    db_dish.version = DBDish.version + 1
 
     try:
         db.commit()
         db.refresh(db_dish)
+        menu_id = schemas.get_menu_id_of_submenu(db, submenu_id)
+        cache.invalidate_dish(menu_id, submenu_id, dish_id)
+        snapshot.update(db, dishes=[(submenu_id, dish_id)])
+
         return schemas.DishResponse(
             id=str(db_dish.id),
             title=db_dish.title,
@@ -383,20 +765,229 @@ def update_dish_by_id(
         ) from exc
 
 
+# Dishes updated per executemany batch
+BULK_UPDATE_BATCH_SIZE = 1000
+
+
+# Update many dishes in one transaction. Updates setting the same fields
+# share one executemany statement per batch, whatever their number. Returns
+# the number of updated rows for each item, 0 when the dish does not exist.
+def update_dishes(
+    db: Session, dishes: List[schemas.DishBulkUpdate]
+) -> List[schemas.DishBulkUpdateResult]:
+    dish_ids = list({dish.id for dish in dishes})
+    found = {}
+    for start in range(0, len(dish_ids), BULK_UPDATE_BATCH_SIZE):
+        batch = dish_ids[start:start + BULK_UPDATE_BATCH_SIZE]
+        found.update(
+            (dish_id, (menu_id, submenu_id))
+            for dish_id, submenu_id, menu_id in db.execute(
+                select(DBDish.id, DBDish.submenu_id, DBSubmenu.menu_id)
+                .outerjoin(DBSubmenu, DBSubmenu.id == DBDish.submenu_id)
+                .where(DBDish.id.in_(batch), schemas.menu_is_live(DBSubmenu.menu_id))
+                .with_for_update(of=DBDish)
+            )
+        )
+
+    # Group the rows by the fields they set, in payload order. Parameters
+    # are prefixed as column names are reserved for the SET clause.
+    groups = {}
+    for dish in dishes:
+        values = dish.dict(exclude={"id"}, exclude_none=True)
+        if dish.id in found and values:
+            groups.setdefault(tuple(sorted(values)), []).append(
+                {"dish_id": dish.id, **{f"new_{k}": v for k, v in values.items()}}
+            )
+
+    # Dishes of the batches whose row count does not confirm that every
+    # row was updated, checked again once all batches ran
+    unconfirmed = set()
+    counted = db.get_bind().dialect.supports_sane_multi_rowcount
+    try:
+        for fields, rows in groups.items():
+            stmt = (
+                update(DBDish)
+                .where(DBDish.id == bindparam("dish_id"))
+                .values({field: bindparam(f"new_{field}") for field in fields})
+                .values(version=DBDish.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+            for start in range(0, len(rows), BULK_UPDATE_BATCH_SIZE):
+                batch = rows[start:start + BULK_UPDATE_BATCH_SIZE]
+                result = db.execute(stmt, batch)
+                if not counted or result.rowcount != len(batch):
+                    unconfirmed.update(row["dish_id"] for row in batch)
+
+        # A dish deleted since it was found is no longer there to update
+        unconfirmed = list(unconfirmed)
+        deleted = set(unconfirmed)
+        for start in range(0, len(unconfirmed), BULK_UPDATE_BATCH_SIZE):
+            batch = unconfirmed[start:start + BULK_UPDATE_BATCH_SIZE]
+            deleted.difference_update(
+                db.scalars(select(DBDish.id).where(DBDish.id.in_(batch)))
+            )
+        db.commit()
+    except IntegrityError as exc:
+        db.rollback()
+        raise HTTPException(
+            status_code=400, detail="Dish with this title already exists"
+        ) from exc
+
+    updated_ids = {
+        row["dish_id"] for rows in groups.values() for row in rows
+    } - deleted
+    if updated_ids:
+        updated = [(*found[dish_id], dish_id) for dish_id in updated_ids]
+        cache.invalidate_dishes(updated)
+        snapshot.update(db, dishes=[dish[1:] for dish in updated])
+
+    return [
+        schemas.DishBulkUpdateResult(
+            id=str(dish.id), updated=int(dish.id in updated_ids)
+        )
+        for dish in dishes
+    ]
+
+
 # Delete dish
 def delete_dish_by_id(
     db: Session, dish_id: int, submenu_id: int
 ) -> schemas.DishResponse:
-    stmt = (
-        delete(DBDish)
-        .where(DBDish.id == dish_id, DBDish.submenu_id == submenu_id)
-        .returning(DBDish)
+    menu_id = schemas.get_menu_id_of_submenu(db, submenu_id)
+    stmt = delete(DBDish).where(
+        DBDish.id == dish_id, DBDish.submenu_id == submenu_id
     )
 
     result = db.execute(stmt)
-    deleted_dish = result.scalars()
-    if not deleted_dish:
+    if not result.rowcount:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Dish not found")
 
+    schemas.add_to_submenu_counts(db, submenu_id, dishes=-1)
+    schemas.add_to_menu_counts(db, menu_id, dishes=-1)
     db.commit()
+    cache.invalidate_dish(menu_id, submenu_id, dish_id, counts=True)
+    snapshot.update(
+        db, menus=[menu_id], submenus=[submenu_id], dishes=[(submenu_id, dish_id)]
+    )
+
     return {"status": True, "message": "The dish has been deleted"}
+
+
+# Search dishes by words of their title and description. Returns a page
+# of results, best matches first, and the cursor of the following page.
+def search_dishes(
+    db: Session,
+    q: str,
+    menu_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    words = search.parse_query(q)
+    if not words or limit <= 0:
+        return [], None
+
+    stmt = search.get_search_statement(
+        db.get_bind().dialect.name,
+        words,
+        menu_id,
+        min_price,
+        max_price,
+        limit,
+        cursor,
+    )
+    rows = db.execute(stmt).all()
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = search.encode_cursor(rows[-1].rank, rows[-1].id)
+
+    return [
+        {
+            "id": str(row.id),
+            "title": row.title,
+            "description": row.description,
+            "price": str(row.price),
+            "submenu_id": str(row.submenu_id),
+            "menu_id": str(row.menu_id),
+        }
+        for row in rows
+    ], next_cursor
+
+
+# Rows fetched from the server-side cursor per exported chunk
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    "menu_id",
+    "menu_title",
+    "menu_description",
+    "submenu_id",
+    "submenu_title",
+    "submenu_description",
+    "dish_id",
+    "dish_title",
+    "dish_description",
+    "dish_price",
+)
+
+
+# Get the flat menus/submenus/dishes statement used by the export
+def get_export_statement():
+    return (
+        select(
+            DBMenu.id,
+            DBMenu.title,
+            DBMenu.description,
+            DBSubmenu.id,
+            DBSubmenu.title,
+            DBSubmenu.description,
+            DBDish.id,
+            DBDish.title,
+            DBDish.description,
+            DBDish.price,
+        )
+        .outerjoin(DBSubmenu, DBSubmenu.menu_id == DBMenu.id)
+        .outerjoin(DBDish, DBDish.submenu_id == DBSubmenu.id)
+        .where(DBMenu.deleted_at.is_(None))
+        .order_by(DBMenu.id, DBSubmenu.id, DBDish.id)
+    )
+
+
+# Get the chunk opening an export (the CSV header)
+def format_export_header(export_format: str) -> str:
+    if export_format == "csv":
+        return format_export_rows([EXPORT_COLUMNS], export_format)
+    return ""
+
+
+# Format a batch of export rows as CSV lines or NDJSON records
+def format_export_rows(rows: Iterable, export_format: str) -> str:
+    if export_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+# Stream the whole catalogue from a server-side cursor, one batch at a time,
+# so memory stays bounded whatever the size of the tables. The statement
+# goes through the ORM, which fetches every row at once without yield_per.
+def stream_export(db: Session, export_format: str) -> Iterator[str]:
+    result = db.execute(
+        get_export_statement().execution_options(
+            stream_results=True,
+            max_row_buffer=EXPORT_BATCH_SIZE,
+            yield_per=EXPORT_BATCH_SIZE,
+        )
+    )
+
+    yield format_export_header(export_format)
+    for rows in result.partitions(EXPORT_BATCH_SIZE):
+        yield format_export_rows(rows, export_format)
@@ -0,0 +1,80 @@
+# Compare two benchmark results written by run.py.
+#
+# Prints p50/p95/p99 latency, throughput and SQL statements per request of
+# every route side by side, with the relative change. Exits with status 1
+# when a route's p95 latency or statement count grew by more than
+# --threshold percent, so it can gate a CI job.
+#
+#     python benchmarks/compare.py before.json after.json [--threshold 10]
+
+
+import argparse
+import json
+import sys
+
+
+def change(before: float, after: float) -> float:
+    if not before:
+        return 0.0 if not after else float("inf")
+    return (after - before) / before * 100
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+
+    for key in ("database", "menus", "submenus", "dishes", "requests", "concurrency"):
+        if before["meta"].get(key) != after["meta"].get(key):
+            print(
+                f"warning: {key} differs "
+                f"({before['meta'].get(key)} vs {after['meta'].get(key)})",
+                file=sys.stderr,
+            )
+
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+    old_start = before["meta"].get("cold_start_seconds")
+    new_start = after["meta"].get("cold_start_seconds")
+    if old_start is not None and new_start is not None:
+        print(f"cold start {new_start:.3f} s {change(old_start, new_start):+.1f}%")
+    print(
+        f"{'route':<22} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18} "
+        f"{'rps':>18} {'queries':>18}"
+    )
+
+    regressions = []
+    for name, new in after["routes"].items():
+        old = before["routes"].get(name)
+        if old is None:
+            continue
+
+        cells = []
+        for metric in ("p50", "p95", "p99"):
+            old_value, new_value = old["latency_ms"][metric], new["latency_ms"][metric]
+            cells.append(f"{new_value:8.2f} {change(old_value, new_value):+7.1f}%")
+        rps = change(old["throughput_rps"], new["throughput_rps"])
+        cells.append(f"{new['throughput_rps']:8.1f} {rps:+7.1f}%")
+        cells.append(
+            f"{old['queries_per_request']:g} -> {new['queries_per_request']:g}"
+        )
+        print(f"{name:<22} " + " ".join(f"{cell:>18}" for cell in cells))
+
+        p95 = change(old["latency_ms"]["p95"], new["latency_ms"]["p95"])
+        queries = change(old["queries_per_request"], new["queries_per_request"])
+        if p95 > args.threshold or queries > args.threshold:
+            regressions.append(name)
+
+    if regressions:
+        print(f"\nRegressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
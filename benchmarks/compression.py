@@ -0,0 +1,111 @@
+# Benchmark of the response compression trade-off, CPU time versus bytes.
+#
+# Seeds a synthetic catalogue into a temporary SQLite database, fetches
+# uncompressed bodies of a few list, tree and export responses from the app
+# and compresses each with every available encoding at several levels.
+# Prints the compressed size, the CPU time per response, and the time to
+# send the body over a link of --link-kbps, to pick COMPRESSION_LEVELS and
+# COMPRESSION_MIN_SIZE for a deployment.
+#
+#     python benchmarks/compression.py [--menus 100] [--link-kbps 1000]
+
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "compression.sqlite")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}?check_same_thread=false"
+os.environ["CACHE_BACKEND"] = "none"
+
+from driver import call  # noqa: E402
+from generate import generate  # noqa: E402
+
+from app import compression  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 8, 11), "zstd": (1, 3, 9, 19)}
+
+RESPONSES = {
+    "menu": "/api/v1/menus/1",
+    "menus page": "/api/v1/menus/?limit=100",
+    "tree": "/api/v1/menus/tree",
+    "export ndjson": "/api/v1/export?format=ndjson",
+    "export csv": "/api/v1/export?format=csv",
+}
+
+
+# Compress body repeat times and return the best CPU time and the size
+def measure(encoding: str, level: int, body: bytes, repeat: int):
+    best = float("inf")
+    size = 0
+    for _ in range(repeat):
+        started = time.process_time()
+        size = len(compression.compress(encoding, body, level))
+        best = min(best, time.process_time() - started)
+    return best, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--menus", type=int, default=100)
+    parser.add_argument("--submenus", type=int, default=10)
+    parser.add_argument("--dishes", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--link-kbps", type=float, default=1000, help="client link speed, kbit/s"
+    )
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        generate(db, args.menus, args.submenus, args.dishes)
+    finally:
+        db.close()
+
+    # Bodies as sent without compression
+    async def fetch_all() -> dict:
+        return {
+            name: (await call(app, "GET", path))[1]
+            for name, path in RESPONSES.items()
+        }
+
+    bodies = asyncio.get_event_loop().run_until_complete(fetch_all())
+    os.remove(DATABASE_PATH)
+
+    bytes_per_ms = args.link_kbps * 1000 / 8 / 1000
+    print(
+        f"encodings: {', '.join(compression.COMPRESSORS)}, "
+        f"link {args.link_kbps:g} kbit/s"
+    )
+    print(
+        f"{'response':<14} {'encoding':<9} {'bytes':>10} {'ratio':>7} "
+        f"{'cpu ms':>9} {'send ms':>9} {'total ms':>9}"
+    )
+    for name, body in bodies.items():
+        send_ms = len(body) / bytes_per_ms
+        print(
+            f"{name:<14} {'identity':<9} {len(body):>10} {1:>7.2f} "
+            f"{0:>9.3f} {send_ms:>9.1f} {send_ms:>9.1f}"
+        )
+        for encoding in compression.COMPRESSORS:
+            for level in LEVELS[encoding]:
+                seconds, size = measure(encoding, level, body, args.repeat)
+                cpu_ms = seconds * 1000
+                send_ms = size / bytes_per_ms
+                print(
+                    f"{'':<14} {f'{encoding}:{level}':<9} {size:>10} "
+                    f"{len(body) / size:>7.2f} {cpu_ms:>9.3f} {send_ms:>9.1f} "
+                    f"{cpu_ms + send_ms:>9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
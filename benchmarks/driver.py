@@ -0,0 +1,100 @@
+# Module driving the ASGI app in process for the benchmarks.
+
+
+import asyncio
+import json
+import time
+from typing import List, Optional, Tuple
+
+
+# Call the ASGI app directly, without a server or HTTP client in between.
+# Returns the status code and the response body. An exception raised by
+# the app is answered as a 500 with the error as the body, so it counts as
+# a failed request instead of ending the run.
+async def call(
+    app, method: str, path: str, body: Optional[object] = None
+) -> Tuple[int, bytes]:
+    path, _, query = path.partition("?")
+    payload = b"" if body is None else json.dumps(body).encode()
+    headers = [(b"host", b"bench")]
+    if body is not None:
+        headers += [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode()),
+        ]
+
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    status = 0
+    chunks = []
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    # Send the body once, then report the client as gone when the response
+    # is complete, as streaming responses listen for the disconnect
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    try:
+        await app(scope, receive, send)
+    except Exception as exc:
+        return 500, repr(exc).encode()
+    return status, b"".join(chunks)
+
+
+# Send requests given as (method, path, body) with up to concurrency of them
+# in flight. Returns (seconds, status, body) per request in input order and
+# the wall time of the whole run.
+async def run_concurrently(
+    app, requests: List[tuple], concurrency: int
+) -> Tuple[List[tuple], float]:
+    results = [None] * len(requests)
+    pending = iter(range(len(requests)))
+
+    async def worker():
+        for index in pending:
+            method, path, body = requests[index]
+            started = time.perf_counter()
+            status, content = await call(app, method, path, body)
+            results[index] = (time.perf_counter() - started, status, content)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    return results, time.perf_counter() - started
+
+
+# Get the q-th percentile (0-100) of values by linear interpolation
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
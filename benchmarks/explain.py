@@ -0,0 +1,128 @@
+# Check that the SQL statements of every route use indexes.
+#
+# Seeds a catalogue into DATABASE_URL (Postgres or SQLite), sends one
+# request of each benchmark scenario and runs EXPLAIN on every SELECT,
+# UPDATE and DELETE it executed. Exits with status 1 when a plan scans a
+# whole table, except where the route reads the whole table by design
+# (the menus list, the catalogue tree and the export). The test suite
+# runs the same check on SQLite, see tests/test_query_plans.py.
+#
+#     DATABASE_URL=sqlite:////tmp/explain.sqlite python benchmarks/explain.py
+
+
+import argparse
+import asyncio
+import random
+import re
+import sys
+
+from driver import call
+from generate import generate
+from run import SCENARIOS, Catalogue, record_created
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from app.database import Base, SessionLocal, engine
+from app.main import app
+from app.models import Menu
+
+TABLES = {"menus", "submenus", "dishes"}
+
+# Tables a scenario reads in full by design
+FULL_SCANS = {
+    "GET menus": {"menus"},
+    "GET catalogue tree": TABLES,
+    "GET export": TABLES,
+}
+
+POSTGRES_SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+# Get the plan of a statement and the tables it scans in full
+def explain(conn, statement: str, parameters) -> tuple:
+    if conn.dialect.name == "postgresql":
+        rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+        lines = [row[0] for row in rows]
+        scanned = set(POSTGRES_SEQ_SCAN.findall("\n".join(lines)))
+    else:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        lines = [row[-1] for row in rows]
+        scanned = {m.group(1) for m in map(SQLITE_SCAN.match, lines) if m}
+    return lines, scanned & TABLES
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--menus", type=int, default=200)
+    parser.add_argument("--submenus", type=int, default=10)
+    parser.add_argument("--dishes", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="drop and recreate the tables when the database is not empty",
+    )
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        if db.query(Menu.id).first() is not None:
+            if not args.reset:
+                sys.exit("The database is not empty, pass --reset to drop it")
+            db.close()
+            Base.metadata.drop_all(engine)
+            Base.metadata.create_all(engine)
+        catalogue = Catalogue(
+            generate(db, args.menus, args.submenus, args.dishes, args.seed)
+        )
+    finally:
+        db.close()
+
+    # Planner statistics for the freshly loaded tables
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        keyword = statement.lstrip().split(None, 1)[0].upper()
+        if not executemany and keyword in ("SELECT", "UPDATE", "DELETE"):
+            statements.append((statement, parameters))
+
+    async def run_all():
+        failures = 0
+        for name, _, _, build in SCENARIOS:
+            request = build(catalogue, random.Random(f"{args.seed}:{name}"), 0)
+
+            statements.clear()
+            event.listen(Engine, "before_cursor_execute", capture)
+            try:
+                result = await call(app, *request)
+            finally:
+                event.remove(Engine, "before_cursor_execute", capture)
+            record_created(catalogue, name, [request], [(0.0, *result)])
+
+            with engine.connect() as conn:
+                for statement, parameters in statements:
+                    lines, scanned = explain(conn, statement, parameters)
+                    unexpected = scanned - FULL_SCANS.get(name, set())
+                    if unexpected:
+                        failures += 1
+                    if unexpected or args.verbose:
+                        status = "FULL SCAN " + ", ".join(sorted(unexpected))
+                        print(f"{name}: {status if unexpected else 'ok'}")
+                        print("  " + " ".join(statement.split()))
+                        for line in lines:
+                            print("    " + line)
+        return failures
+
+    failures = asyncio.get_event_loop().run_until_complete(run_all())
+    print(f"{failures} statements scan a whole table")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Module generating a synthetic catalogue for the benchmarks.
+#
+# Seeds menus x submenus x dishes through the bulk import view, so rows and
+# counters are written the same way as by POST /api/v1/menus/bulk.
+#
+#     DATABASE_URL=... python benchmarks/generate.py \
+#         --menus 100 --submenus 10 --dishes 10
+
+
+import argparse
+import os
+import random
+import sys
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import schemas, views  # noqa: E402
+
+# Menus imported per transaction
+GENERATE_BATCH_SIZE = 100
+
+
+# Build menus with nested submenus and dishes. The same seed gives the
+# same catalogue.
+def build_menus(
+    menus: int, submenus: int, dishes: int, seed: int = 0, start: int = 0
+) -> List[schemas.MenuCreate]:
+    rng = random.Random(seed + start)
+    return [
+        schemas.MenuCreate(
+            title=f"Menu {start + m}",
+            description=f"Synthetic menu {start + m}",
+            submenus=[
+                schemas.SubMenuCreate(
+                    title=f"Submenu {start + m}.{s}",
+                    description=f"Synthetic submenu {start + m}.{s}",
+                    dishes=[
+                        schemas.DishCreate(
+                            title=f"Dish {start + m}.{s}.{d}",
+                            description=f"Synthetic dish {start + m}.{s}.{d}",
+                            price=round(rng.uniform(1, 100), 2),
+                        )
+                        for d in range(dishes)
+                    ],
+                )
+                for s in range(submenus)
+            ],
+        )
+        for m in range(menus)
+    ]
+
+
+# Seed the catalogue and return the ids of the created rows
+def generate(
+    db, menus: int, submenus: int, dishes: int, seed: int = 0
+) -> List[schemas.MenuImportResult]:
+    results = []
+    for start in range(0, menus, GENERATE_BATCH_SIZE):
+        batch = build_menus(
+            min(GENERATE_BATCH_SIZE, menus - start), submenus, dishes, seed, start
+        )
+        results.extend(views.post_import_menus(db, batch))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--menus", type=int, default=100)
+    parser.add_argument("--submenus", type=int, default=10)
+    parser.add_argument("--dishes", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from app.database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        generate(db, args.menus, args.submenus, args.dishes, args.seed)
+    finally:
+        db.close()
+    print(
+        f"Generated {args.menus} menus, {args.menus * args.submenus} submenus "
+        f"and {args.menus * args.submenus * args.dishes} dishes"
+    )
+
+
+if __name__ == "__main__":
+    main()
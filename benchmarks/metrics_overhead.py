@@ -0,0 +1,101 @@
+# Benchmark of the per-request metrics overhead.
+#
+# Serves the same GET requests with REQUEST_METRICS enabled and disabled,
+# each in a fresh process on a throwaway SQLite database, and reports the
+# mean time per request and the difference.
+#
+#     python benchmarks/metrics_overhead.py [--requests 5000] [--rounds 5]
+
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PATHS = (
+    "/api/v1/menus/",
+    "/api/v1/menus/1",
+    "/api/v1/menus/1/submenus/",
+    "/api/v1/menus/1/submenus/1/dishes/",
+    "/api/v1/menus/1/submenus/1/dishes/1",
+)
+
+
+# Measure the mean seconds per request in this process
+def run_worker(requests: int) -> float:
+    from driver import call
+    from generate import generate
+
+    from app.database import Base, SessionLocal, engine
+    from app.main import app
+
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        generate(db, menus=1, submenus=1, dishes=1)
+    finally:
+        db.close()
+
+    async def run() -> float:
+        for path in PATHS:
+            status, _ = await call(app, "GET", path)
+            assert status == 200, path
+        started = time.perf_counter()
+        for index in range(requests):
+            await call(app, "GET", PATHS[index % len(PATHS)])
+        return (time.perf_counter() - started) / requests
+
+    return asyncio.get_event_loop().run_until_complete(run())
+
+
+# Run a worker process with metrics enabled or disabled
+def measure(enabled: bool, requests: int) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{directory}/bench.sqlite?check_same_thread=false",
+            REQUEST_METRICS=str(enabled),
+            CACHE_BACKEND="none",
+        )
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", "--requests", str(requests)],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    return json.loads(output)["seconds_per_request"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps({"seconds_per_request": run_worker(args.requests)}))
+        return
+
+    # Alternate the runs and keep the best of each, to damp machine noise
+    results = {True: [], False: []}
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            results[enabled].append(measure(enabled, args.requests))
+
+    disabled, enabled = min(results[False]), min(results[True])
+    print(f"metrics disabled: {disabled * 1e6:8.1f} us/request")
+    print(f"metrics enabled:  {enabled * 1e6:8.1f} us/request")
+    print(
+        f"overhead:         {(enabled - disabled) * 1e6:8.1f} us/request "
+        f"({(enabled / disabled - 1) * 100:+.2f}%)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+# Benchmark driving every route of the API against a synthetic catalogue.
+#
+# Seeds menus x submenus x dishes into DATABASE_URL (Postgres or SQLite),
+# sends the requests of each route in turn with the given concurrency and
+# prints latency percentiles, throughput and SQL statements per request as
+# JSON. The catalogue and the requests only depend on the arguments, so
+# results of different commits can be put side by side with compare.py.
+#
+#     DATABASE_URL=sqlite:////tmp/bench.sqlite python benchmarks/run.py \
+#         --menus 100 --submenus 10 --dishes 10 --concurrency 8 > results.json
+
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Statement counts are read from the request metrics, and responses are
+# not cached unless asked for, so every request reaches the database
+os.environ["REQUEST_METRICS"] = "True"
+os.environ.setdefault("CACHE_BACKEND", "none")
+
+from driver import percentile, run_concurrently  # noqa: E402
+from generate import generate  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app import database, metrics  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Menu  # noqa: E402
+from app.settings import DB_ASYNC  # noqa: E402
+
+MENUS = "/api/v1/menus"
+SUBMENUS = MENUS + "/{menu_id}/submenus"
+DISHES = SUBMENUS + "/{submenu_id}/dishes"
+
+
+# How long a SQLite connection waits for the database lock. Each commit
+# waits for the disk, so concurrent writes queue up for longer than the
+# 5 seconds sqlite3 waits by default.
+SQLITE_BUSY_TIMEOUT_MS = 60000
+
+
+def set_busy_timeout(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", set_busy_timeout)
+    if database.async_engine is not None:
+        event.listen(database.async_engine.sync_engine, "connect", set_busy_timeout)
+
+
+# Get the current commit, marked when the tree has local changes
+def get_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+# Script starting the app in a fresh interpreter and sending it a health
+# check, with the arguments of run.py in its environment
+COLD_START = """
+import asyncio, sys
+sys.path[:0] = [{root!r}, {benchmarks!r}]
+from driver import call
+from app.main import app
+
+async def start():
+    await app.router.startup()
+    status, _ = await call(app, "GET", "/healthz")
+    await app.router.shutdown()
+    return status
+
+sys.exit(0 if asyncio.get_event_loop().run_until_complete(start()) == 200 else 1)
+"""
+
+
+# Time a new process from interpreter start until the app, started up
+# (loading the catalogue snapshot when enabled), answers /healthz
+def measure_cold_start() -> float:
+    script = COLD_START.format(root=ROOT, benchmarks=os.path.dirname(__file__))
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", script], check=True)
+    return time.perf_counter() - started
+
+
+# Ids of the seeded catalogue and of the rows created by the benchmark
+class Catalogue:
+    def __init__(self, imported):
+        self.menus = []
+        self.submenus = []
+        self.dishes = []
+        for menu in imported:
+            menu_id = int(menu.id)
+            self.menus.append(menu_id)
+            for submenu in menu.submenus:
+                self.submenus.append((menu_id, int(submenu.id)))
+                self.dishes.extend(
+                    (menu_id, int(submenu.id), int(dish_id))
+                    for dish_id in submenu.dishes
+                )
+        self.created = {"menus": [], "submenus": [], "dishes": []}
+
+
+def submenu_path(menu_id: int, submenu_id: int) -> str:
+    return f"{MENUS}/{menu_id}/submenus/{submenu_id}"
+
+
+def dish_path(menu_id: int, submenu_id: int, dish_id: int) -> str:
+    return f"{submenu_path(menu_id, submenu_id)}/dishes/{dish_id}"
+
+
+def menu_body(index: int) -> dict:
+    return {"title": f"Menu {index}", "description": "Benchmark"}
+
+
+def dish_body(index: int) -> dict:
+    return {"title": f"Dish {index}", "description": "Benchmark", "price": 9.99}
+
+
+def import_body(index: int) -> list:
+    return [
+        {
+            "title": f"Imported {index}",
+            "description": "Benchmark",
+            "submenus": [
+                {
+                    "title": f"Imported {index}.{s}",
+                    "description": "Benchmark",
+                    "dishes": [dish_body(d) for d in range(2)],
+                }
+                for s in range(2)
+            ],
+        }
+    ]
+
+
+# Request builders. Each gets the catalogue, a seeded random generator
+# and the request index and returns (method, path, body).
+def read_menus(c, rng, i):
+    return "GET", f"{MENUS}/?skip={rng.randrange(len(c.menus))}&limit=10", None
+
+
+def read_catalogue_tree(c, rng, i):
+    return "GET", f"{MENUS}/tree", None
+
+
+def read_menu_tree(c, rng, i):
+    return "GET", f"{MENUS}/tree?menu_id={rng.choice(c.menus)}", None
+
+
+def read_menu(c, rng, i):
+    return "GET", f"{MENUS}/{rng.choice(c.menus)}", None
+
+
+def read_submenus(c, rng, i):
+    return "GET", f"{MENUS}/{rng.choice(c.menus)}/submenus/", None
+
+
+def read_submenu(c, rng, i):
+    return "GET", submenu_path(*rng.choice(c.submenus)), None
+
+
+def read_dishes(c, rng, i):
+    return "GET", submenu_path(*rng.choice(c.submenus)) + "/dishes/", None
+
+
+def read_dish(c, rng, i):
+    return "GET", dish_path(*rng.choice(c.dishes)), None
+
+
+def search_dishes(c, rng, i):
+    return "GET", f"/api/v1/dishes/search?q=dish+{rng.randrange(len(c.menus))}", None
+
+
+def export_catalogue(c, rng, i):
+    return "GET", "/api/v1/export?format=ndjson", None
+
+
+def create_menu(c, rng, i):
+    return "POST", f"{MENUS}/", menu_body(i)
+
+
+def import_menus(c, rng, i):
+    return "POST", f"{MENUS}/bulk", import_body(i)
+
+
+def create_submenu(c, rng, i):
+    return "POST", f"{MENUS}/{rng.choice(c.menus)}/submenus/", menu_body(i)
+
+
+def create_dish(c, rng, i):
+    return "POST", submenu_path(*rng.choice(c.submenus)) + "/dishes/", dish_body(i)
+
+
+def update_menu(c, rng, i):
+    return "PATCH", f"{MENUS}/{rng.choice(c.menus)}", menu_body(i)
+
+
+def update_submenu(c, rng, i):
+    return "PATCH", submenu_path(*rng.choice(c.submenus)), menu_body(i)
+
+
+def update_dish(c, rng, i):
+    return "PATCH", dish_path(*rng.choice(c.dishes)), dish_body(i)
+
+
+def update_dishes(c, rng, i):
+    dishes = rng.sample(c.dishes, min(100, len(c.dishes)))
+    body = [
+        {"id": dish_id, "price": round(rng.uniform(1, 100), 2)}
+        for *_, dish_id in dishes
+    ]
+    return "PATCH", "/api/v1/dishes/bulk", body
+
+
+def delete_dish(c, rng, i):
+    return "DELETE", dish_path(*c.created["dishes"][i]), None
+
+
+def delete_submenu(c, rng, i):
+    return "DELETE", submenu_path(*c.created["submenus"][i]), None
+
+
+def delete_menu(c, rng, i):
+    return "DELETE", f"{MENUS}/{c.created['menus'][i]}", None
+
+
+# Scenarios as (name, route template, share of --requests, builder). They
+# run in this order, so the deletes remove the rows created by the posts.
+SCENARIOS = [
+    ("GET menus", MENUS + "/", 1, read_menus),
+    ("GET catalogue tree", MENUS + "/tree", 0.1, read_catalogue_tree),
+    ("GET menu tree", MENUS + "/tree", 1, read_menu_tree),
+    ("GET menu", MENUS + "/{menu_id}", 1, read_menu),
+    ("GET submenus", SUBMENUS + "/", 1, read_submenus),
+    ("GET submenu", SUBMENUS + "/{submenu_id}", 1, read_submenu),
+    ("GET dishes", DISHES + "/", 1, read_dishes),
+    ("GET dish", DISHES + "/{dish_id}", 1, read_dish),
+    ("GET dish search", "/api/v1/dishes/search", 1, search_dishes),
+    ("GET export", "/api/v1/export", 0.1, export_catalogue),
+    ("POST menu", MENUS + "/", 1, create_menu),
+    ("POST menus bulk", MENUS + "/bulk", 0.1, import_menus),
+    ("POST submenu", SUBMENUS + "/", 1, create_submenu),
+    ("POST dish", DISHES + "/", 1, create_dish),
+    ("PATCH menu", MENUS + "/{menu_id}", 1, update_menu),
+    ("PATCH submenu", SUBMENUS + "/{submenu_id}", 1, update_submenu),
+    ("PATCH dish", DISHES + "/{dish_id}", 1, update_dish),
+    ("PATCH dishes bulk", "/api/v1/dishes/bulk", 0.1, update_dishes),
+    ("DELETE dish", DISHES + "/{dish_id}", 1, delete_dish),
+    ("DELETE submenu", SUBMENUS + "/{submenu_id}", 1, delete_submenu),
+    ("DELETE menu", MENUS + "/{menu_id}", 1, delete_menu),
+]
+
+
+# Remember the ids of rows created by a scenario for the deletes
+def record_created(catalogue: Catalogue, name: str, requests, results) -> None:
+    for (_, path, _), (_, status, content) in zip(requests, results):
+        if status != 201:
+            continue
+        parts = path.split("/")
+        if name == "POST menu":
+            catalogue.created["menus"].append(int(json.loads(content)["id"]))
+        elif name == "POST submenu":
+            item_id = int(json.loads(content)["id"])
+            catalogue.created["submenus"].append((int(parts[4]), item_id))
+        elif name == "POST dish":
+            item_id = int(json.loads(content)["id"])
+            catalogue.created["dishes"].append(
+                (int(parts[4]), int(parts[6]), item_id)
+            )
+
+
+# Run one scenario and summarise it
+async def run_scenario(catalogue, scenario, count, concurrency, seed) -> dict:
+    name, route, _, build = scenario
+    if name.startswith("DELETE"):
+        kind = {"DELETE dish": "dishes", "DELETE submenu": "submenus"}.get(
+            name, "menus"
+        )
+        count = min(count, len(catalogue.created[kind]))
+
+    rng = random.Random(f"{seed}:{name}")
+    requests = [build(catalogue, rng, index) for index in range(count)]
+
+    method = name.split()[0]
+    queries_before = metrics.REQUEST_QUERIES.totals(method, route)
+    results, elapsed = await run_concurrently(app, requests, concurrency)
+    queries_after = metrics.REQUEST_QUERIES.totals(method, route)
+
+    record_created(catalogue, name, requests, results)
+
+    latencies = [seconds * 1000 for seconds, _, _ in results]
+    handled = queries_after[0] - queries_before[0]
+    statements = queries_after[1] - queries_before[1]
+    return {
+        "route": f"{method} {route}",
+        "requests": count,
+        "errors": sum(1 for _, status, _ in results if status >= 400),
+        "throughput_rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / count, 3) if count else 0.0,
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        "queries_per_request": round(statements / handled, 2) if handled else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--menus", type=int, default=100)
+    parser.add_argument("--submenus", type=int, default=10)
+    parser.add_argument("--dishes", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=500, help="per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--routes", help="only run scenarios containing this text")
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="drop and recreate the tables when the database is not empty",
+    )
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        if db.query(Menu.id).first() is not None:
+            if not args.reset:
+                sys.exit("The database is not empty, pass --reset to drop it")
+            db.close()
+            Base.metadata.drop_all(engine)
+            Base.metadata.create_all(engine)
+
+        started = time.perf_counter()
+        catalogue = Catalogue(
+            generate(db, args.menus, args.submenus, args.dishes, args.seed)
+        )
+        generate_seconds = time.perf_counter() - started
+    finally:
+        db.close()
+
+    cold_start_seconds = measure_cold_start()
+
+    async def run_all() -> dict:
+        routes = {}
+        for scenario in SCENARIOS:
+            name, _, share, _ = scenario
+            if args.routes and args.routes not in name:
+                continue
+            count = max(int(args.requests * share), 1)
+            routes[name] = await run_scenario(
+                catalogue, scenario, count, args.concurrency, args.seed
+            )
+        return routes
+
+    routes = asyncio.get_event_loop().run_until_complete(run_all())
+    report = {
+        "meta": {
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "async": DB_ASYNC,
+            "menus": args.menus,
+            "submenus": args.submenus,
+            "dishes": args.dishes,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "generate_seconds": round(generate_seconds, 3),
+            "cold_start_seconds": round(cold_start_seconds, 3),
+        },
+        "routes": routes,
+    }
+    print(json.dumps(report, indent=2))
+
+    # A failed request, e.g. a 500 for going over the query budget, fails
+    # the run once the report is out
+    if any(route["errors"] for route in routes.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Microbenchmark of the list response serialization.
+#
+# Encodes a page of rows per list endpoint in three ways:
+#   models     - response models built in the view, validated against
+#                response_model and run through jsonable_encoder (before)
+#   validated  - plain dicts from the view, validated as above
+#                (FAST_RESPONSES=False)
+#   fast       - plain dicts encoded once by FastJSONResponse
+# checks that all three produce the same bytes and reports the CPU time
+# per row.
+#
+#     python benchmarks/serialization.py [--rows 10000] [--repeat 5]
+
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from app import responses, schemas  # noqa: E402
+
+
+# Rows as the list queries return them, and how each view turns them into
+# a model and into a dict
+def menu_rows(count: int) -> list:
+    return [(i, f"Меню {i}", f"Описание {i}", 10, 100) for i in range(count)]
+
+
+def submenu_rows(count: int) -> list:
+    return [(i, f"Подменю {i}", f"Описание {i}", 10) for i in range(count)]
+
+
+def dish_rows(count: int) -> list:
+    return [(i, f"Блюдо {i}", f"Описание {i}", 12.5 + i, 10) for i in range(count)]
+
+
+CASES = {
+    "menus": (
+        schemas.MenuResponse,
+        menu_rows,
+        lambda row: schemas.MenuResponse(
+            id=str(row[0]),
+            title=row[1],
+            description=row[2],
+            submenus_count=row[3],
+            dishes_count=row[4],
+        ),
+        lambda row: {
+            "id": str(row[0]),
+            "title": row[1],
+            "description": row[2],
+            "submenus_count": row[3],
+            "dishes_count": row[4],
+        },
+    ),
+    "submenus": (
+        schemas.SubMenuResponse,
+        submenu_rows,
+        lambda row: schemas.SubMenuResponse(
+            id=str(row[0]), title=row[1], description=row[2], dishes_count=row[3]
+        ),
+        lambda row: {
+            "id": str(row[0]),
+            "title": row[1],
+            "description": row[2],
+            "dishes_count": row[3],
+        },
+    ),
+    "dishes": (
+        schemas.DishResponse,
+        dish_rows,
+        lambda row: schemas.DishResponse(
+            id=str(row[0]),
+            title=row[1],
+            description=row[2],
+            price=str(row[3]),
+            dishes_count=row[4],
+        ),
+        lambda row: {
+            "id": str(row[0]),
+            "title": row[1],
+            "description": row[2],
+            "price": str(row[3]),
+            "dishes_count": row[4],
+        },
+    ),
+}
+
+
+async def encode_validated(field, items) -> bytes:
+    content = await serialize_response(field=field, response_content=items)
+    return JSONResponse(content).body
+
+
+# Run encode on rows repeat times and return the best time and the bytes
+def measure(encode, rows: list, repeat: int):
+    best = float("inf")
+    body = b""
+    for _ in range(repeat):
+        started = time.process_time()
+        body = encode(rows)
+        best = min(best, time.process_time() - started)
+    return best, body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    encoder = "orjson" if responses.orjson is not None else "json"
+    print(f"{args.rows} rows per page, fast path encoder: {encoder}")
+    print(
+        f"{'endpoint':<10} {'models':>12} {'validated':>12} {'fast':>12} "
+        f"{'saved':>12}"
+    )
+
+    for name, (model, make_rows, to_model, to_dict) in CASES.items():
+        field = create_response_field(name=f"Response_{name}", type_=List[model])
+        rows = make_rows(args.rows)
+
+        def models(rows):
+            items = [to_model(row) for row in rows]
+            return loop.run_until_complete(encode_validated(field, items))
+
+        def validated(rows):
+            items = [to_dict(row) for row in rows]
+            return loop.run_until_complete(encode_validated(field, items))
+
+        def fast(rows):
+            return responses.FastJSONResponse([to_dict(row) for row in rows]).body
+
+        results = [
+            measure(encode, rows, args.repeat) for encode in (models, validated, fast)
+        ]
+        bodies = {body for _, body in results}
+        assert len(bodies) == 1, f"{name}: encodings differ"
+
+        per_row = [seconds / args.rows * 1e6 for seconds, _ in results]
+        print(
+            f"{name:<10} "
+            + " ".join(f"{value:9.2f} us" for value in per_row)
+            + f" {per_row[0] - per_row[2]:9.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 #!/bin/sh
+set -e
 export PYTHONPATH=.
-poetry run alembic -c alembic/alembic.ini revision --autogenerate -m "add_ololo_to_menu"
-poetry run alembic -c alembic/alembic.ini upgrade head
-poetry run uvicorn app.main:app --host 0.0.0.0 --port 8000
+# Only applies existing migrations; replicas starting together take turns
+poetry run python -m app.cli migrate
+# One worker, or one per CPU when the cache is in Redis, see WEB_CONCURRENCY
+workers=$(poetry run python -m app.cli workers)
+exec poetry run uvicorn app.main:app --host 0.0.0.0 --port 8000 \
+    --workers "$workers"
@@ -0,0 +1,180 @@
+# Test fixtures. Every test runs against an empty SQLite database with
+# the tables created from the models; the settings below are read when
+# the app is imported, so they are set first.
+
+
+import os
+import tempfile
+
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "test.sqlite")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}"
+os.environ["CACHE_BACKEND"] = "none"
+os.environ["DB_ASYNC"] = "False"
+os.environ["READ_SNAPSHOT"] = "False"
+# Answer any request going over its route's statement budget with 500
+os.environ["DB_QUERY_BUDGET"] = "raise"
+
+import pytest  # noqa: E402
+from fastapi.routing import APIRoute  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from tests.redis_server import RedisServer  # noqa: E402
+
+MENUS = "/api/v1/menus"
+MENU = MENUS + "/{menu_id}"
+SUBMENU = MENU + "/submenus/{submenu_id}"
+DISH = SUBMENU + "/dishes/{dish_id}"
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    Base.metadata.create_all(engine)
+    yield
+    engine.dispose()
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+# SQL statements run through the engine while the test runs
+@pytest.fixture
+def statements():
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
+
+
+# Build the body of a bulk import of menus x submenus x dishes
+def catalogue_body(menus: int, submenus: int, dishes: int, prefix: str = "") -> list:
+    return [
+        {
+            "title": f"{prefix}Menu {m}",
+            "description": f"Menu {m} description",
+            "submenus": [
+                {
+                    "title": f"{prefix}Submenu {m}.{s}",
+                    "description": f"Submenu {m}.{s} description",
+                    "dishes": [
+                        {
+                            "title": f"{prefix}Dish {m}.{s}.{d}",
+                            "description": f"Dish {m}.{s}.{d} description",
+                            "price": 10 + d,
+                        }
+                        for d in range(dishes)
+                    ],
+                }
+                for s in range(submenus)
+            ],
+        }
+        for m in range(menus)
+    ]
+
+
+# Import a catalogue and return the created ids as
+# [(menu_id, [(submenu_id, [dish_id, ...]), ...]), ...]
+def seed(client, menus: int, submenus: int, dishes: int, prefix: str = "") -> list:
+    response = client.post(
+        f"{MENUS}/bulk", json=catalogue_body(menus, submenus, dishes, prefix)
+    )
+    assert response.status_code == 201, response.text
+    return [
+        (
+            int(menu["id"]),
+            [
+                (int(submenu["id"]), [int(dish_id) for dish_id in submenu["dishes"]])
+                for submenu in menu["submenus"]
+            ],
+        )
+        for menu in response.json()
+    ]
+
+
+# A small catalogue of 3 menus x 3 submenus x 3 dishes
+@pytest.fixture
+def catalogue(client):
+    return seed(client, 3, 3, 3)
+
+
+# Statement budget of every route declaring one, by (method, path)
+def budgeted_routes() -> dict:
+    budgets = {}
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        for dependency in route.dependant.dependencies:
+            statements = getattr(dependency.call, "statements", None)
+            if statements is not None:
+                for method in route.methods:
+                    budgets[(method, route.path)] = statements
+    return budgets
+
+
+# One request per budgeted route against the 3 x 3 x 3 catalogue, reading
+# from the first menu and writing to the others so the order does not matter
+def route_requests(catalogue) -> dict:
+    (menu_id, submenus), (other_menu_id, other_submenus), (deleted_menu_id, _) = (
+        catalogue
+    )
+    submenu_id, dish_ids = submenus[0]
+    ids = {"menu_id": menu_id, "submenu_id": submenu_id, "dish_id": dish_ids[0]}
+    other = {
+        "menu_id": other_menu_id,
+        "submenu_id": other_submenus[0][0],
+        "dish_id": other_submenus[0][1][0],
+    }
+    deleted_submenu = {"menu_id": other_menu_id, "submenu_id": other_submenus[1][0]}
+    deleted_dish = dict(other, dish_id=other_submenus[0][1][1])
+    item = {"title": "New", "description": "New description"}
+    dish = dict(item, price=12.5)
+    submenus_path = MENU.format(**ids) + "/submenus/"
+    dishes_path = SUBMENU.format(**ids) + "/dishes/"
+    return {
+        ("POST", MENUS + "/"): ("post", MENUS + "/", item),
+        ("GET", MENUS + "/"): ("get", MENUS + "/", None),
+        ("GET", MENUS + "/tree"): ("get", MENUS + "/tree", None),
+        ("GET", MENU): ("get", MENU.format(**ids), None),
+        ("PATCH", MENU): ("patch", MENU.format(**other), item),
+        ("DELETE", MENU): ("delete", MENU.format(menu_id=deleted_menu_id), None),
+        ("POST", MENU + "/submenus/"): ("post", submenus_path, item),
+        ("GET", MENU + "/submenus/"): ("get", submenus_path, None),
+        ("GET", SUBMENU): ("get", SUBMENU.format(**ids), None),
+        ("PATCH", SUBMENU): ("patch", SUBMENU.format(**other), item),
+        ("DELETE", SUBMENU): ("delete", SUBMENU.format(**deleted_submenu), None),
+        ("POST", SUBMENU + "/dishes/"): ("post", dishes_path, dish),
+        ("GET", SUBMENU + "/dishes/"): ("get", dishes_path, None),
+        ("GET", DISH): ("get", DISH.format(**ids), None),
+        ("PATCH", DISH): ("patch", DISH.format(**other), dish),
+        ("DELETE", DISH): ("delete", DISH.format(**deleted_dish), None),
+        ("GET", "/api/v1/dishes/search"): (
+            "get",
+            "/api/v1/dishes/search?q=Dish",
+            None,
+        ),
+        ("GET", "/api/v1/export"): ("get", "/api/v1/export?format=csv", None),
+    }
+
+
+# A Redis protocol stand-in, see tests/redis_server.py
+@pytest.fixture
+def redis_server():
+    server = RedisServer()
+    yield server
+    server.stop()
@@ -0,0 +1,152 @@
+# Minimal in-process server speaking the Redis protocol (RESP), standing in
+# for Redis in the cache tests. It knows only the commands RedisCache sends,
+# SCAN in particular is not one of them.
+
+
+import socketserver
+import threading
+import time
+
+
+class RedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RedisHandler)
+        self.data = {}
+        self.expires = {}
+        # Changes per key, for WATCH
+        self.changes = {}
+        self.commands = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def touch(self, key: bytes) -> None:
+        self.changes[key] = self.changes.get(key, 0) + 1
+
+    def lookup(self, key: bytes):
+        expires = self.expires.get(key)
+        if expires is not None and expires < time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def execute(self, args: list):
+        name, args = args[0].upper(), args[1:]
+        self.commands.append(name)
+        if name in (b"AUTH", b"SELECT"):
+            return b"+OK"
+        if name == b"GET":
+            return self.lookup(args[0])
+        if name == b"SET":
+            self.data[args[0]] = args[1]
+            self.expires.pop(args[0], None)
+            if len(args) > 3 and args[2].upper() == b"PX":
+                self.expires[args[0]] = time.monotonic() + int(args[3]) / 1000
+            self.touch(args[0])
+            return b"+OK"
+        if name == b"DEL":
+            deleted = 0
+            for key in args:
+                if self.data.pop(key, None) is not None:
+                    deleted += 1
+                    self.touch(key)
+            return deleted
+        if name == b"INCR":
+            value = int(self.lookup(args[0]) or 0) + 1
+            self.data[args[0]] = str(value).encode()
+            self.touch(args[0])
+            return value
+        if name == b"SADD":
+            members = self.data.setdefault(args[0], set())
+            added = len(set(args[1:]) - members)
+            members.update(args[1:])
+            self.touch(args[0])
+            return added
+        if name == b"SMEMBERS":
+            return list(self.lookup(args[0]) or ())
+        if name == b"PEXPIRE":
+            if self.lookup(args[0]) is None:
+                return 0
+            self.expires[args[0]] = time.monotonic() + int(args[1]) / 1000
+            return 1
+        raise ValueError(f"unknown command {name.decode()}")
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        watched = {}
+        queued = None
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+
+            name = args[0].upper()
+            with server.lock:
+                if name == b"WATCH":
+                    for key in args[1:]:
+                        watched[key] = server.changes.get(key, 0)
+                    reply = b"+OK"
+                elif name == b"UNWATCH":
+                    watched = {}
+                    reply = b"+OK"
+                elif name == b"MULTI":
+                    queued = []
+                    reply = b"+OK"
+                elif name == b"EXEC":
+                    aborted = any(
+                        server.changes.get(key, 0) != count
+                        for key, count in watched.items()
+                    )
+                    reply = (
+                        None
+                        if aborted
+                        else [server.execute(command) for command in queued]
+                    )
+                    watched, queued = {}, None
+                elif queued is not None:
+                    queued.append(args)
+                    reply = b"+QUEUED"
+                else:
+                    try:
+                        reply = server.execute(args)
+                    except ValueError as exc:
+                        reply = Exception(str(exc))
+            self.wfile.write(encode(reply))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+def encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return b"-ERR %s\r\n" % str(reply).encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes) and reply.startswith(b"+"):
+        return reply + b"\r\n"
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(encode(item) for item in reply)
@@ -0,0 +1,114 @@
+# Admission control queues requests over the limit and sheds them with 503
+# and Retry-After once the queue is full or their wait times out, while
+# health checks always go through.
+
+
+import asyncio
+
+import pytest
+
+from app import admission
+
+
+# An app holding every request until released
+class HeldApp:
+    def __init__(self):
+        self.released = asyncio.Event()
+        self.handled = []
+
+    async def __call__(self, scope, receive, send):
+        if scope["path"] != "/healthz":
+            await self.released.wait()
+        self.handled.append(scope["path"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+
+# Send a request through the middleware. Returns the status and headers.
+async def call(app, path: str, method: str = "GET"):
+    scope = {"type": "http", "method": method, "path": path, "headers": []}
+    response = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message["headers"])
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"]
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    limiters = {
+        "read": admission.Limiter(1, 1),
+        "write": admission.Limiter(1, 1),
+    }
+    monkeypatch.setattr(admission, "limiters", limiters)
+    monkeypatch.setattr(admission, "is_pool_saturated", lambda kind: False)
+    return limiters
+
+
+def test_requests_over_a_full_queue_are_shed(limiters):
+    async def run():
+        held = HeldApp()
+        app = admission.AdmissionControlMiddleware(held)
+        admitted = asyncio.ensure_future(call(app, "/menus"))
+        queued = asyncio.ensure_future(call(app, "/menus"))
+        await asyncio.sleep(0)
+        assert (limiters["read"].in_flight, limiters["read"].queued) == (1, 1)
+
+        status, headers = await call(app, "/menus")
+        assert status == 503
+        assert headers[b"retry-after"] == str(admission.ADMISSION_RETRY_AFTER).encode()
+
+        # Writes have their own slots, health checks are never held back
+        write = asyncio.ensure_future(call(app, "/menus", "POST"))
+        assert (await call(app, "/healthz"))[0] == 200
+
+        held.released.set()
+        statuses = [(await request)[0] for request in (admitted, queued, write)]
+        assert statuses == [200, 200, 200]
+        assert limiters["read"].in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_queued_request_is_shed_after_its_timeout(limiters, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_QUEUE_TIMEOUT", 0.01)
+
+    async def run():
+        held = HeldApp()
+        app = admission.AdmissionControlMiddleware(held)
+        admitted = asyncio.ensure_future(call(app, "/menus"))
+        await asyncio.sleep(0)
+
+        assert (await call(app, "/menus"))[0] == 503
+        assert limiters["read"].queued == 0
+
+        held.released.set()
+        assert (await admitted)[0] == 200
+        assert held.handled == ["/menus"]
+
+    asyncio.run(run())
+
+
+def test_request_is_shed_without_queueing_when_the_pool_is_saturated(
+    limiters, monkeypatch
+):
+    monkeypatch.setattr(admission, "is_pool_saturated", lambda kind: True)
+
+    async def run():
+        held = HeldApp()
+        app = admission.AdmissionControlMiddleware(held)
+        admitted = asyncio.ensure_future(call(app, "/menus"))
+        await asyncio.sleep(0)
+
+        assert (await call(app, "/menus"))[0] == 503
+        held.released.set()
+        assert (await admitted)[0] == 200
+
+    asyncio.run(run())
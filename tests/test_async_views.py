@@ -0,0 +1,59 @@
+# Views running on the event loop in async mode.
+
+
+import asyncio
+import threading
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import async_views, cache, schemas
+from tests.conftest import DATABASE_PATH
+
+
+# Memory backend posing as a blocking one, recording the threads it is
+# called from
+class RecordingBackend(cache.MemoryCache):
+    blocking = True
+
+    def __init__(self):
+        super().__init__(100, 60)
+        self.threads = []
+
+    def next_generation(self) -> None:
+        self.threads.append(threading.get_ident())
+        super().next_generation()
+
+    def delete(self, *keys: str) -> None:
+        self.threads.append(threading.get_ident())
+        super().delete(*keys)
+
+    def delete_prefix(self, prefix: str) -> None:
+        self.threads.append(threading.get_ident())
+        super().delete_prefix(prefix)
+
+
+async def run_view(view, *args):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{DATABASE_PATH}")
+    try:
+        async with AsyncSession(engine) as db:
+            return await view(db, *args)
+    finally:
+        await engine.dispose()
+
+
+def test_invalidation_runs_off_the_event_loop(monkeypatch, catalogue):
+    backend = RecordingBackend()
+    monkeypatch.setattr(cache, "backend", backend)
+    monkeypatch.setattr(async_views, "DB_ASYNC", True)
+    backend.set(cache.menu_key(catalogue[0][0]), {"title": "Menu 0"})
+
+    menu = schemas.MenuCreate(title="Renamed", description="")
+    response = asyncio.run(
+        run_view(async_views.update_menu_by_id, catalogue[0][0], menu)
+    )
+
+    assert response.title == "Renamed"
+    # Invalidated by the time the view returns, but not on the loop's thread
+    assert backend.get(cache.menu_key(catalogue[0][0])) is None
+    assert backend.threads
+    assert threading.get_ident() not in backend.threads
@@ -0,0 +1,64 @@
+# A benchmark run reports failed requests in its JSON and exits with
+# status 1, also when the app raises instead of answering.
+
+
+import asyncio
+import importlib
+import json
+import os
+
+import pytest
+
+from app import async_views
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks")
+
+
+@pytest.fixture
+def bench(monkeypatch):
+    # Set by run.py on import, restored when the test ends
+    monkeypatch.setenv("REQUEST_METRICS", "True")
+    monkeypatch.setenv("CACHE_BACKEND", "none")
+    monkeypatch.syspath_prepend(BENCHMARKS)
+    run = importlib.import_module("run")
+    monkeypatch.setattr(run, "measure_cold_start", lambda: 0.0)
+    return run
+
+
+# Run the benchmark with a small catalogue. Returns the exit status and
+# the report.
+def run_benchmark(bench, monkeypatch, capsys, routes: str):
+    argv = ["run.py", "--menus", "2", "--submenus", "2", "--dishes", "2"]
+    argv += ["--requests", "5", "--concurrency", "2", "--routes", routes]
+    monkeypatch.setattr("sys.argv", argv)
+    # run.py uses the current loop, which asyncio.run in other tests unsets
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        bench.main()
+        status = 0
+    except SystemExit as exc:
+        status = exc.code
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    return status, json.loads(capsys.readouterr().out)
+
+
+def test_run_without_errors_exits_0(bench, monkeypatch, capsys):
+    status, report = run_benchmark(bench, monkeypatch, capsys, "GET menu")
+    assert status == 0
+    assert [route["errors"] for route in report["routes"].values()] == [0, 0, 0]
+
+
+def test_failing_handler_is_reported_and_fails_the_run(bench, monkeypatch, capsys):
+    async def fail(db, menu_id):
+        raise RuntimeError("handler failed")
+
+    monkeypatch.setattr(async_views, "get_menu_by_id", fail)
+
+    status, report = run_benchmark(bench, monkeypatch, capsys, "GET menu")
+    assert status == 1
+    assert report["routes"]["GET menu"]["requests"] == 5
+    assert report["routes"]["GET menu"]["errors"] == 5
+    assert report["routes"]["GET menus"]["errors"] == 0
@@ -0,0 +1,65 @@
+# Bulk dish updates report, for each item, whether the dish was updated,
+# from the rows the statements actually changed rather than the payload.
+
+
+from sqlalchemy import delete, event
+
+from app.database import engine
+from app.models import Dish as DBDish
+from tests.conftest import MENUS
+
+BULK = "/api/v1/dishes/bulk"
+
+
+def results(response) -> dict:
+    assert response.status_code == 200, response.text
+    return {int(item["id"]): item["updated"] for item in response.json()}
+
+
+def test_bulk_update_reports_missing_dishes(client, catalogue):
+    menu_id, submenus = catalogue[0]
+    submenu_id, dish_ids = submenus[0]
+
+    response = client.patch(
+        BULK,
+        json=[
+            {"id": dish_ids[0], "price": 1},
+            {"id": dish_ids[1], "title": "Renamed"},
+            {"id": dish_ids[2]},
+            {"id": 999999, "price": 1},
+        ],
+    )
+
+    assert results(response) == {
+        dish_ids[0]: 1,
+        dish_ids[1]: 1,
+        dish_ids[2]: 0,
+        999999: 0,
+    }
+    path = f"{MENUS}/{menu_id}/submenus/{submenu_id}/dishes/{dish_ids[1]}"
+    assert client.get(path).json()["title"] == "Renamed"
+
+
+def test_dish_deleted_during_bulk_update_is_not_reported_updated(client, catalogue):
+    _, submenus = catalogue[0]
+    kept, deleted = submenus[0][1][:2]
+
+    # Delete a dish from another connection once the dishes were found,
+    # just before the first update runs
+    pending = [deleted]
+
+    def delete_dish(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE dishes") and pending:
+            with engine.begin() as other:
+                other.execute(delete(DBDish).where(DBDish.id == pending.pop()))
+
+    event.listen(engine, "before_cursor_execute", delete_dish)
+    try:
+        response = client.patch(
+            BULK, json=[{"id": kept, "price": 1}, {"id": deleted, "price": 1}]
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", delete_dish)
+
+    assert not pending
+    assert results(response) == {kept: 1, deleted: 0}
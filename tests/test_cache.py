@@ -0,0 +1,95 @@
+# Response cache backends and their invalidation on writes.
+
+
+import asyncio
+
+import pytest
+
+from app import cache
+from tests.conftest import MENUS
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request, monkeypatch):
+    if request.param == "memory":
+        backend = cache.MemoryCache(100, 60)
+    else:
+        backend = cache.RedisCache(request.getfixturevalue("redis_server").url, 60)
+    monkeypatch.setattr(cache, "backend", backend)
+    return backend
+
+
+def test_key_prefixes():
+    assert cache.key_prefixes(cache.menus_list_key(0, 10, None)) == ["menus:list:"]
+    assert cache.key_prefixes(cache.submenus_list_key(1, 0, 10, None)) == [
+        "menu:1:",
+        "menu:1:submenus:list:",
+    ]
+    assert cache.key_prefixes(cache.dish_key(2, 3)) == ["submenu:2:"]
+    assert cache.key_prefixes(cache.menu_key(1)) == []
+
+
+def test_redis_delete_prefix_uses_key_sets(redis_server):
+    backend = cache.RedisCache(redis_server.url, 60)
+    for key in ("menu:1", "menu:1:submenu:2", "menu:1:tree", "menu:10:submenu:3"):
+        backend.set(key, {"key": key})
+
+    backend.delete_prefix("menu:1:")
+
+    assert backend.get("menu:1") == {"key": "menu:1"}
+    assert backend.get("menu:1:submenu:2") is None
+    assert backend.get("menu:1:tree") is None
+    assert backend.get("menu:10:submenu:3") == {"key": "menu:10:submenu:3"}
+    assert b"SCAN" not in redis_server.commands
+
+
+def test_set_is_dropped_after_invalidation(backend):
+    generation = backend.generation()
+    cache.invalidate_menu(1)
+
+    backend.set("menu:1", {"stale": True}, generation)
+    assert backend.get("menu:1") is None
+
+    backend.set("menu:1", {"stale": False}, backend.generation())
+    assert backend.get("menu:1") == {"stale": False}
+
+
+def test_response_loaded_before_a_write_is_not_stored(backend):
+    async def load():
+        # A write commits and invalidates while the response is loaded
+        cache.invalidate_menu(1)
+        return {"id": "1", "submenus_count": 0}
+
+    value = asyncio.run(cache.get_or_set(cache.menu_key(1), load))
+
+    assert value == {"id": "1", "submenus_count": 0}
+    assert backend.get(cache.menu_key(1)) is None
+
+
+def test_writes_invalidate_cached_reads(backend, client, catalogue, statements):
+    menu_id, submenus = catalogue[0]
+    submenu_id = submenus[0][0]
+    dishes_path = f"{MENUS}/{menu_id}/submenus/{submenu_id}/dishes/"
+
+    assert client.get(f"{MENUS}/").json()[0]["submenus_count"] == 3
+    assert len(client.get(dishes_path).json()) == 3
+    statements.clear()
+    assert client.get(f"{MENUS}/").json()[0]["submenus_count"] == 3
+    assert client.get(f"{MENUS}/{menu_id}").json()["dishes_count"] == 9
+    assert len(client.get(dishes_path).json()) == 3
+    assert len(statements) == 2
+
+    response = client.post(
+        dishes_path, json={"title": "New dish", "description": "", "price": 1}
+    )
+    assert response.status_code == 201
+
+    assert client.get(f"{MENUS}/").json()[0]["dishes_count"] == 10
+    assert client.get(f"{MENUS}/{menu_id}").json()["dishes_count"] == 10
+    submenu = client.get(f"{MENUS}/{menu_id}/submenus/{submenu_id}").json()
+    assert submenu["dishes_count"] == 4
+    assert len(client.get(dishes_path).json()) == 4
+
+    client.delete(f"{MENUS}/{menu_id}/submenus/{submenu_id}")
+    assert client.get(f"{MENUS}/").json()[0]["submenus_count"] == 2
+    assert client.get(dishes_path).json() == []
@@ -0,0 +1,66 @@
+# Response compression is off unless enabled; when enabled, the encoding is
+# negotiated from Accept-Encoding and small bodies are sent as they are.
+
+
+import gzip
+
+import pytest
+from starlette.testclient import TestClient
+
+from app import compression
+from app.main import app
+from tests.conftest import MENUS
+
+
+@pytest.fixture
+def compressed_client():
+    return TestClient(compression.CompressionMiddleware(app))
+
+
+def test_compression_is_off_by_default(client, catalogue):
+    assert all(
+        middleware.cls is not compression.CompressionMiddleware
+        for middleware in app.user_middleware
+    )
+    response = client.get(f"{MENUS}/tree", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        ("gzip", "gzip"),
+        ("gzip;q=0.5, br", "br"),
+        ("br;q=0.1, zstd;q=0.9, gzip", "gzip"),
+        ("*", next(iter(compression.COMPRESSORS))),
+        ("gzip;q=0, identity", None),
+        ("", None),
+    ],
+)
+def test_encoding_is_negotiated(accept_encoding, encoding):
+    if encoding not in (*compression.COMPRESSORS, None):
+        pytest.skip(f"{encoding} is not installed")
+    assert compression.choose_encoding(accept_encoding) == encoding
+
+
+def test_large_responses_are_compressed(client, compressed_client, catalogue):
+    expected = client.get(f"{MENUS}/tree").content
+    assert len(expected) >= compression.COMPRESSION_MIN_SIZE
+
+    response = compressed_client.get(
+        f"{MENUS}/tree", headers={"Accept-Encoding": "gzip"}, stream=True
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    body = response.raw.read(decode_content=False)
+    assert int(response.headers["content-length"]) == len(body) < len(expected)
+    assert gzip.decompress(body) == expected
+
+
+def test_small_responses_are_sent_as_they_are(compressed_client, catalogue):
+    menu_id = catalogue[0][0]
+    response = compressed_client.get(
+        f"{MENUS}/{menu_id}", headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
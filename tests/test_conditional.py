@@ -0,0 +1,89 @@
+# Conditional GETs are answered with 304 while the client's copy is
+# current, and with the new body once the resource or one of its children
+# was written, also within the second of the client's Last-Modified.
+
+
+import time
+from email.utils import formatdate
+
+import pytest
+
+from tests.conftest import MENUS
+
+ITEM = {"title": "New", "description": "New description"}
+
+
+@pytest.fixture
+def menu_path(client) -> str:
+    response = client.post(f"{MENUS}/", json=ITEM)
+    assert response.status_code == 201, response.text
+    return f"{MENUS}/{response.json()['id']}"
+
+
+# Add a submenu, which changes the menu's counts
+def write_child(client, menu_path: str) -> None:
+    response = client.post(f"{menu_path}/submenus/", json=ITEM)
+    assert response.status_code == 201, response.text
+
+
+# Wait for the next second to start, so Last-Modified values of the writes
+# made before are settled
+def next_second() -> None:
+    time.sleep(1 - time.time() % 1)
+
+
+def test_if_none_match(client, menu_path):
+    response = client.get(menu_path)
+    etag = response.headers["etag"]
+    assert etag == 'W/"1"'
+
+    response = client.get(menu_path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    write_child(client, menu_path)
+    response = client.get(menu_path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] == 'W/"2"'
+    assert response.json()["submenus_count"] == 1
+
+
+def test_if_none_match_not_matching(client, menu_path):
+    response = client.get(menu_path, headers={"If-None-Match": 'W/"7", "8"'})
+    assert response.status_code == 200
+    assert response.json()["title"] == "New"
+
+
+def test_if_modified_since(client, menu_path):
+    next_second()
+    last_modified = client.get(menu_path).headers["last-modified"]
+
+    response = client.get(menu_path, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    assert response.headers["last-modified"] == last_modified
+
+    write_child(client, menu_path)
+    response = client.get(menu_path, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 200
+    assert response.json()["submenus_count"] == 1
+
+
+def test_if_modified_since_within_the_second_of_a_child_write(client, menu_path):
+    next_second()
+    write_child(client, menu_path)
+
+    # Last-Modified now has the second of the write, which may not have
+    # been its last write yet
+    response = client.get(menu_path)
+    assert "last-modified" not in response.headers
+    since = formatdate(time.time(), usegmt=True)
+    write_child(client, menu_path)
+
+    response = client.get(menu_path, headers={"If-Modified-Since": since})
+    assert response.status_code == 200
+    assert response.json()["submenus_count"] == 2
+
+    next_second()
+    response = client.get(menu_path, headers={"If-Modified-Since": since})
+    assert response.status_code == 304
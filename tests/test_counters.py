@@ -0,0 +1,43 @@
+# The repair-counters command recomputes the stored submenus_count and
+# dishes_count columns from the rows, fixing only the ones that are off.
+
+
+from sqlalchemy import update
+
+from app import cli
+from app.models import Menu as DBMenu
+from app.models import Submenu as DBSubmenu
+from tests.conftest import MENUS
+
+
+# Counts of every menu and submenu as read through the API
+def counts(client, catalogue) -> dict:
+    result = {}
+    for menu_id, submenus in catalogue:
+        menu = client.get(f"{MENUS}/{menu_id}").json()
+        result[menu_id] = (menu["submenus_count"], menu["dishes_count"])
+        for submenu_id, _ in submenus:
+            path = f"{MENUS}/{menu_id}/submenus/{submenu_id}"
+            result[(menu_id, submenu_id)] = client.get(path).json()["dishes_count"]
+    return result
+
+
+def test_repair_counters(client, db, catalogue, capsys):
+    expected = counts(client, catalogue)
+    (menu_id, submenus), (other_menu_id, _), _ = catalogue
+    db.execute(update(DBMenu).where(DBMenu.id == menu_id).values(submenus_count=7))
+    db.execute(update(DBMenu).where(DBMenu.id == other_menu_id).values(dishes_count=0))
+    db.execute(
+        update(DBSubmenu).where(DBSubmenu.id == submenus[0][0]).values(dishes_count=9)
+    )
+    db.commit()
+    assert counts(client, catalogue) != expected
+
+    cli.main(["repair-counters"])
+
+    # Menus are recomputed from their submenus once those are fixed
+    assert capsys.readouterr().out == "Fixed counters of 1 submenus and 2 menus\n"
+    assert counts(client, catalogue) == expected
+
+    cli.main(["repair-counters"])
+    assert capsys.readouterr().out == "Fixed counters of 0 submenus and 0 menus\n"
@@ -0,0 +1,51 @@
+# Deployment defaults: one server worker unless the cache is shared
+# through Redis, then one per CPU, and the health probes used by
+# orchestrators.
+
+
+import pytest
+
+from app import cli, migrate
+
+
+@pytest.mark.parametrize(
+    "cache_backend, read_snapshot, workers",
+    [
+        ("none", False, 1),
+        ("memory", False, 1),
+        ("redis", False, 4),
+        ("redis", True, 1),
+    ],
+)
+def test_default_worker_count(monkeypatch, cache_backend, read_snapshot, workers):
+    monkeypatch.setattr(cli, "WEB_CONCURRENCY", 0)
+    monkeypatch.setattr(cli, "CACHE_BACKEND", cache_backend)
+    monkeypatch.setattr(cli, "READ_SNAPSHOT", read_snapshot)
+    monkeypatch.setattr(cli, "get_cpu_count", lambda: 4)
+    assert cli.get_worker_count() == workers
+
+
+def test_workers_command_warns_about_per_process_state(monkeypatch, capsys):
+    monkeypatch.setattr(cli, "WEB_CONCURRENCY", 4)
+    monkeypatch.setattr(cli, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(cli, "READ_SNAPSHOT", False)
+
+    cli.main(["workers"])
+
+    output = capsys.readouterr()
+    assert output.out == "4\n"
+    assert "Warning" in output.err
+
+
+def test_health_and_readiness(client, monkeypatch):
+    assert client.get("/healthz").json() == {"status": "ok"}
+
+    # The test tables are created from the models, not by the migrations
+    response = client.get("/readyz")
+    assert response.status_code == 503
+
+    head = migrate.get_head()
+    monkeypatch.setattr(migrate, "get_current_revision", lambda connection: head)
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok", "revision": head}
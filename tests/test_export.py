@@ -0,0 +1,72 @@
+# Catalogue export streamed from a server-side cursor.
+
+
+import asyncio
+import csv
+import io
+import json
+import tracemalloc
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import async_views, views
+from tests.conftest import DATABASE_PATH, seed
+
+
+# Export the catalogue, returning the exported size and the peak of memory
+# allocated meanwhile
+def export_peak(db) -> tuple:
+    size = 0
+    tracemalloc.start()
+    try:
+        for chunk in views.stream_export(db, "ndjson"):
+            size += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size, peak
+
+
+def test_export_memory_does_not_grow_with_tables(client, db):
+    seed(client, 10, 10, 20, prefix="a")
+    small_size, small_peak = export_peak(db)
+    db.close()
+
+    seed(client, 40, 10, 20, prefix="b")
+    large_size, large_peak = export_peak(db)
+
+    assert large_size > 4 * small_size
+    assert large_peak < 1.5 * small_peak
+
+
+def test_export_formats(client, catalogue):
+    response = client.get("/api/v1/export?format=ndjson")
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert len(records) == 27
+    assert records[0]["menu_title"] == "Menu 0"
+    assert records[-1]["dish_title"] == "Dish 2.2.2"
+
+    response = client.get("/api/v1/export?format=csv")
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == list(views.EXPORT_COLUMNS)
+    assert len(rows) == 28
+
+
+def test_async_export_matches(client, db, catalogue):
+    async def export():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{DATABASE_PATH}")
+        try:
+            async with AsyncSession(engine) as session:
+                return [
+                    chunk
+                    async for chunk in async_views._stream_export_async(
+                        session, "csv"
+                    )
+                ]
+        finally:
+            await engine.dispose()
+
+    assert "".join(asyncio.run(export())) == "".join(
+        views.stream_export(db, "csv")
+    )
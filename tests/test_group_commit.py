@@ -0,0 +1,90 @@
+# Concurrent creates are written in one shared transaction, and each
+# request still gets the response it would get alone, 404 under a missing
+# or deleted parent.
+
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from app import group_commit, schemas, views
+from app.database import SessionLocal
+from tests.conftest import MENUS
+
+
+@pytest.fixture
+def parents(client, catalogue, monkeypatch):
+    monkeypatch.setattr(views, "DB_PURGE_THRESHOLD", 0)
+    (menu_id, submenus), _, (deleted_menu_id, deleted_submenus) = catalogue
+    response = client.delete(f"{MENUS}/{deleted_menu_id}")
+    assert response.status_code == 200, response.text
+    return menu_id, submenus[0][0], deleted_menu_id, deleted_submenus[0][0]
+
+
+# Sessions committed while the test runs
+@pytest.fixture
+def commits():
+    committed = []
+
+    def record(session):
+        committed.append(session)
+
+    event.listen(SessionLocal, "after_commit", record)
+    yield committed
+    event.remove(SessionLocal, "after_commit", record)
+
+
+# Submit creates concurrently. Returns the response or error of each.
+def submit_all(committer, items) -> list:
+    async def run():
+        return await asyncio.gather(
+            *(committer.submit(*args) for args in items), return_exceptions=True
+        )
+
+    return asyncio.run(run())
+
+
+def statuses(results) -> list:
+    return [
+        result.status_code if isinstance(result, HTTPException) else 201
+        for result in results
+    ]
+
+
+def test_submenus_are_created_together(client, parents, commits):
+    menu_id, _, deleted_menu_id, _ = parents
+    items = [
+        (menu_id, schemas.SubMenuCreate(title=f"Grouped {i}", description=""))
+        for i in range(3)
+    ]
+    items += [
+        (999999, schemas.SubMenuCreate(title="Missing", description="")),
+        (deleted_menu_id, schemas.SubMenuCreate(title="Deleted", description="")),
+    ]
+
+    commits.clear()
+    results = submit_all(group_commit.submenus, items)
+
+    assert statuses(results) == [201, 201, 201, 404, 404]
+    assert len(commits) == 1
+    menu = client.get(f"{MENUS}/{menu_id}").json()
+    assert menu["submenus_count"] == 6
+
+
+def test_dishes_are_created_together(client, parents, commits):
+    menu_id, submenu_id, _, deleted_submenu_id = parents
+    parent_ids = [submenu_id] * 3 + [999999, deleted_submenu_id]
+    items = [
+        (parent_id, schemas.DishCreate(title=f"Grouped {i}", description="", price=1))
+        for i, parent_id in enumerate(parent_ids)
+    ]
+
+    commits.clear()
+    results = submit_all(group_commit.dishes, items)
+
+    assert statuses(results) == [201, 201, 201, 404, 404]
+    assert len(commits) == 1
+    submenu = client.get(f"{MENUS}/{menu_id}/submenus/{submenu_id}").json()
+    assert submenu["dishes_count"] == 6
@@ -0,0 +1,114 @@
+# Menu, submenu and dish lists read a page with its counts in a single
+# statement, whatever the page size, and can be read page by page with
+# cursors.
+
+
+import base64
+
+import pytest
+
+from app import pagination
+from tests.conftest import MENUS, seed
+
+
+@pytest.fixture
+def large_catalogue(client):
+    return seed(client, 30, 12, 12)
+
+
+def list_paths(catalogue):
+    menu_id, submenus = catalogue[0]
+    submenu_id = submenus[0][0]
+    return {
+        "menus": f"{MENUS}/",
+        "submenus": f"{MENUS}/{menu_id}/submenus/",
+        "dishes": f"{MENUS}/{menu_id}/submenus/{submenu_id}/dishes/",
+    }
+
+
+@pytest.mark.parametrize("name", ["menus", "submenus", "dishes"])
+@pytest.mark.parametrize("limit", [1, 10, 100])
+def test_list_runs_one_statement(client, large_catalogue, statements, name, limit):
+    path = list_paths(large_catalogue)[name]
+
+    statements.clear()
+    response = client.get(f"{path}?limit={limit}")
+
+    assert response.status_code == 200
+    assert len(response.json()) == min(limit, {"menus": 30}.get(name, 12))
+    assert len(statements) == 1
+
+
+def test_list_counts(client, catalogue):
+    menu_id, submenus = catalogue[0]
+    submenu_id = submenus[0][0]
+
+    menus = client.get(f"{MENUS}/").json()
+    assert [menu["submenus_count"] for menu in menus] == [3, 3, 3]
+    assert [menu["dishes_count"] for menu in menus] == [9, 9, 9]
+
+    submenus = client.get(f"{MENUS}/{menu_id}/submenus/").json()
+    assert [submenu["dishes_count"] for submenu in submenus] == [3, 3, 3]
+
+    dishes = client.get(f"{MENUS}/{menu_id}/submenus/{submenu_id}/dishes/").json()
+    assert len(dishes) == 3
+    assert all(dish["dishes_count"] == 3 for dish in dishes)
+
+
+# Read every page of a list by cursor. Returns the ids of each page.
+def walk_pages(client, path: str, limit: int) -> list:
+    pages = []
+    params = {"limit": limit}
+    while True:
+        response = client.get(path, params=params)
+        assert response.status_code == 200, response.text
+        pages.append([int(item["id"]) for item in response.json()])
+        cursor = response.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+        params = {"limit": limit, "cursor": cursor}
+
+
+@pytest.mark.parametrize("name", ["menus", "submenus", "dishes"])
+@pytest.mark.parametrize("limit, sizes", [(3, [3, 3, 1]), (7, [7, 0]), (10, [7])])
+def test_cursor_walks_every_page(client, name, limit, sizes):
+    catalogue = seed(client, 7, 7, 7)
+    menu_id, submenus = catalogue[0]
+    ids = {
+        "menus": [menu_id for menu_id, _ in catalogue],
+        "submenus": [submenu_id for submenu_id, _ in submenus],
+        "dishes": submenus[0][1],
+    }[name]
+
+    pages = walk_pages(client, list_paths(catalogue)[name], limit)
+
+    assert [len(page) for page in pages] == sizes
+    assert [item_id for page in pages for item_id in page] == ids
+
+
+def test_cursor_pages_do_not_shift_on_inserts(client, catalogue):
+    first = client.get(f"{MENUS}/", params={"limit": 2})
+    cursor = first.headers[pagination.NEXT_CURSOR_HEADER]
+    seed(client, 1, 0, 0, prefix="New ")
+
+    second = client.get(f"{MENUS}/", params={"limit": 2, "cursor": cursor})
+
+    titles = [menu["title"] for menu in first.json() + second.json()]
+    assert titles == ["Menu 0", "Menu 1", "Menu 2", "New Menu 0"]
+
+
+@pytest.mark.parametrize("name", ["menus", "submenus", "dishes"])
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor!",
+        pagination.encode_cursor(1)[:-1],
+        base64.urlsafe_b64encode(b'{"id": "1"}').decode(),
+        base64.urlsafe_b64encode(b"[1]").decode(),
+    ],
+)
+def test_malformed_cursor_is_rejected(client, catalogue, name, cursor):
+    path = list_paths(catalogue)[name]
+    response = client.get(path, params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
@@ -0,0 +1,52 @@
+# /metrics exposes request counts, latency, SQL statement counts and
+# database time per route template in Prometheus text format.
+
+
+from tests.conftest import MENU, MENUS
+
+LABELS = f'method="GET",route="{MENU}"'
+
+
+# Read /metrics as {series: value}
+def scrape(client) -> dict:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    series = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            series[name] = float(value)
+    return series
+
+
+def test_request_series_grow_after_a_request(client, catalogue):
+    menu_id = catalogue[0][0]
+    before = scrape(client)
+
+    response = client.get(f"{MENUS}/{menu_id}")
+    assert response.status_code == 200
+
+    after = scrape(client)
+
+    def grown(name: str) -> float:
+        return after[name] - before.get(name, 0)
+
+    assert grown(f'http_requests_total{{{LABELS},status="200"}}') == 1
+    assert grown(f"http_request_duration_seconds_count{{{LABELS}}}") == 1
+    assert grown(f'http_request_duration_seconds_bucket{{{LABELS},le="+Inf"}}') == 1
+    assert grown(f"http_request_duration_seconds_sum{{{LABELS}}}") > 0
+    assert grown(f"http_request_sql_statements_count{{{LABELS}}}") == 1
+    assert grown(f"http_request_sql_statements_sum{{{LABELS}}}") == 2
+    assert grown(f"http_request_db_seconds_count{{{LABELS}}}") == 1
+    assert grown(f"http_request_db_seconds_sum{{{LABELS}}}") > 0
+
+
+def test_unknown_paths_share_one_series(client):
+    before = scrape(client)
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+    after = scrape(client)
+
+    name = 'http_requests_total{method="GET",route="unmatched",status="404"}'
+    assert after[name] - before.get(name, 0) == 2
@@ -0,0 +1,114 @@
+# The connection pool records how long checkouts wait for a free
+# connection, and the statement timeout is passed to Postgres by default
+# and per route.
+
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app import database
+from tests.conftest import DATABASE_PATH
+
+
+# An engine with a single connection, waiting at most timeout for it
+@pytest.fixture
+def small_engine():
+    engine = create_engine(
+        f"sqlite:///{DATABASE_PATH}",
+        poolclass=database.InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.2,
+    )
+    yield engine
+    engine.dispose()
+
+
+# Current value of the checkout timeouts counter
+def timeouts() -> float:
+    lines = list(database.POOL_CHECKOUT_TIMEOUTS.collect())
+    return float(lines[-1].rsplit(" ", 1)[1])
+
+
+def test_checkout_wait_is_recorded(small_engine):
+    count, total = database.POOL_CHECKOUT_WAIT.totals()
+    held = small_engine.connect()
+    threading.Timer(0.1, held.close).start()
+
+    with small_engine.connect():
+        pass
+
+    waits, waited = database.POOL_CHECKOUT_WAIT.totals()
+    assert waits == count + 2
+    assert waited - total >= 0.1
+
+
+def test_checkout_timeout_is_counted(small_engine):
+    before = timeouts()
+    count, total = database.POOL_CHECKOUT_WAIT.totals()
+
+    with small_engine.connect():
+        started = time.perf_counter()
+        with pytest.raises(PoolTimeoutError):
+            small_engine.connect()
+        assert time.perf_counter() - started >= 0.2
+
+    assert timeouts() == before + 1
+    waits, waited = database.POOL_CHECKOUT_WAIT.totals()
+    assert waits == count + 2
+    assert waited - total >= 0.2
+
+
+def test_default_statement_timeout_is_sent_to_postgres(monkeypatch):
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT", 5000)
+    url = "postgresql://user@localhost/db"
+
+    assert database.get_connect_args(url, async_driver=False) == {
+        "options": "-c statement_timeout=5000"
+    }
+    assert database.get_connect_args(url, async_driver=True) == {
+        "server_settings": {"statement_timeout": "5000"}
+    }
+
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT", 0)
+    assert database.get_connect_args(url, async_driver=False) == {}
+
+
+# A connection recording the SQL run on it
+class Connection:
+    def __init__(self, dialect: str):
+        self.dialect = SimpleNamespace(name=dialect)
+        self.executed = []
+
+    def exec_driver_sql(self, statement: str) -> None:
+        self.executed.append(statement)
+
+
+def test_route_statement_timeout_is_set_per_transaction(db, monkeypatch):
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT", 5000)
+    monkeypatch.setattr(
+        database,
+        "DB_ROUTE_STATEMENT_TIMEOUTS",
+        {"read_menus_tree": 20000, "read_menus": 5000},
+    )
+
+    def request(name: str):
+        endpoint = SimpleNamespace(__name__=name)
+        return SimpleNamespace(scope={"endpoint": endpoint})
+
+    # Only timeouts differing from the default are applied
+    database.set_statement_timeout(db, request("read_menus"))
+    assert "statement_timeout" not in db.info
+    database.set_statement_timeout(db, request("read_menus_tree"))
+    assert db.info["statement_timeout"] == 20000
+
+    postgres, sqlite = Connection("postgresql"), Connection("sqlite")
+    database.set_route_statement_timeout(db, None, postgres)
+    database.set_route_statement_timeout(db, None, sqlite)
+    assert postgres.executed == ["SET LOCAL statement_timeout = 20000"]
+    assert sqlite.executed == []
@@ -0,0 +1,66 @@
+# A large deleted menu is only marked deleted, then purged in batches:
+# its dishes, then its submenus, then the menu row. Nothing can be created
+# under it meanwhile.
+
+
+import pytest
+from sqlalchemy import func, select
+
+from app import purge, views
+from app.models import Dish as DBDish
+from app.models import Menu as DBMenu
+from app.models import Submenu as DBSubmenu
+from tests.conftest import MENUS, seed
+
+
+@pytest.fixture
+def deleted_menu(client, monkeypatch):
+    monkeypatch.setattr(views, "DB_PURGE_THRESHOLD", 0)
+    monkeypatch.setattr(purge, "DB_PURGE_BATCH_SIZE", 5)
+    menus = seed(client, 2, 3, 4)
+    menu_id, submenus = menus[0]
+
+    response = client.delete(f"{MENUS}/{menu_id}")
+    assert response.status_code == 200, response.text
+    return menu_id, submenus
+
+
+def count(db, model) -> int:
+    return db.scalar(select(func.count()).select_from(model))
+
+
+def test_purge_deletes_submenus_in_batches_before_the_menu(db, deleted_menu):
+    batches = []
+    while True:
+        dishes, submenus, menus = (
+            count(db, DBDish),
+            count(db, DBSubmenu),
+            count(db, DBMenu),
+        )
+        if not purge.purge_batch(db):
+            break
+        batches.append(
+            (
+                dishes - count(db, DBDish),
+                submenus - count(db, DBSubmenu),
+                menus - count(db, DBMenu),
+            )
+        )
+
+    # 12 dishes by 5, then the 3 submenus, then the menu, leaving the
+    # other menu alone
+    assert batches == [(5, 0, 0), (5, 0, 0), (2, 0, 0), (0, 3, 0), (0, 0, 1)]
+    assert (count(db, DBDish), count(db, DBSubmenu), count(db, DBMenu)) == (12, 3, 1)
+
+
+def test_nothing_is_created_under_a_deleted_menu(client, deleted_menu):
+    menu_id, submenus = deleted_menu
+    submenu_id = submenus[0][0]
+    item = {"title": "New", "description": "New description"}
+
+    response = client.post(f"{MENUS}/{menu_id}/submenus/", json=item)
+    assert response.status_code == 404
+    response = client.post(
+        f"{MENUS}/{menu_id}/submenus/{submenu_id}/dishes/", json=dict(item, price=1)
+    )
+    assert response.status_code == 404
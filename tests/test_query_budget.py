@@ -0,0 +1,20 @@
+# Every route with a statement budget stays within it. The tests run with
+# DB_QUERY_BUDGET=raise (see conftest.py), so a route going over its budget
+# answers 500 here and in any other test exercising it.
+
+
+from app.query_budget import QUERY_COUNT_HEADER
+from tests.conftest import budgeted_routes, route_requests
+
+
+def test_every_budgeted_route_is_exercised(catalogue):
+    assert set(route_requests(catalogue)) == set(budgeted_routes())
+
+
+def test_routes_stay_within_their_budget(client, catalogue):
+    budgets = budgeted_routes()
+    for route, (method, path, body) in route_requests(catalogue).items():
+        response = client.request(method, path, json=body)
+
+        assert response.status_code < 400, (route, response.text)
+        assert int(response.headers[QUERY_COUNT_HEADER]) <= budgets[route], route
@@ -0,0 +1,62 @@
+# The statements of every budgeted route use indexes: none of them scans
+# a whole table, except where the route reads it in full by design (the
+# menus list, the catalogue tree and the export). benchmarks/explain.py
+# runs the same check against a larger catalogue, on Postgres too.
+
+
+import re
+
+import pytest
+from sqlalchemy import event
+
+from app.database import engine
+from tests.conftest import MENUS, budgeted_routes, route_requests
+
+TABLES = {"menus", "submenus", "dishes"}
+
+# Tables a route reads in full by design
+FULL_SCANS = {
+    ("GET", MENUS + "/"): {"menus"},
+    ("GET", MENUS + "/tree"): TABLES,
+    ("GET", "/api/v1/export"): TABLES,
+}
+
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+# Get the plan of a statement and the tables it scans in full
+def explain(conn, statement: str, parameters) -> tuple:
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+    lines = [row[-1] for row in rows]
+    scanned = {m.group(1) for m in map(SQLITE_SCAN.match, lines) if m}
+    return lines, scanned & TABLES
+
+
+@pytest.fixture
+def plans():
+    executed = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        keyword = statement.lstrip().split(None, 1)[0].upper()
+        if not executemany and keyword in ("SELECT", "UPDATE", "DELETE"):
+            executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield executed
+    event.remove(engine, "before_cursor_execute", capture)
+
+
+@pytest.mark.parametrize("route", sorted(budgeted_routes()), ids=" ".join)
+def test_route_does_not_scan_whole_tables(client, catalogue, plans, route):
+    method, path, body = route_requests(catalogue)[route]
+
+    plans.clear()
+    response = client.request(method, path, json=body)
+    assert response.status_code < 400, response.text
+    assert plans
+
+    with engine.connect() as conn:
+        for statement, parameters in plans:
+            lines, scanned = explain(conn, statement, parameters)
+            unexpected = scanned - FULL_SCANS.get(route, set())
+            assert not unexpected, (" ".join(statement.split()), lines)
@@ -0,0 +1,142 @@
+# Reads go to the replicas unless the client has just written, and the
+# cache never serves a client reading from the primary a response read
+# from a lagging replica. The replicas are SQLite files of their own which
+# are never written to, so they lag behind the primary forever.
+
+
+import itertools
+import os
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+from starlette.testclient import TestClient
+
+from app import cache, database
+from app.database import Base
+from app.main import app
+from app.models import Menu as DBMenu
+from tests.conftest import DATABASE_PATH, MENUS
+
+ITEM = {"title": "Written", "description": "Written description"}
+
+
+@pytest.fixture
+def replicas(monkeypatch):
+    engines = [
+        database.create_pooled_engine(
+            "sqlite:///" + os.path.join(os.path.dirname(DATABASE_PATH), name)
+        )
+        for name in ("replica-1.sqlite", "replica-2.sqlite")
+    ]
+    for replica in engines:
+        Base.metadata.create_all(replica)
+    monkeypatch.setattr(database, "replica_engines", engines)
+    monkeypatch.setattr(
+        database,
+        "ReplicaSessions",
+        [
+            sessionmaker(autocommit=False, autoflush=False, bind=replica)
+            for replica in engines
+        ],
+    )
+    monkeypatch.setattr(database, "replica_pools", [e.pool for e in engines])
+    monkeypatch.setattr(database, "_replica_counter", itertools.count())
+    yield engines
+    for replica in engines:
+        replica.dispose()
+        Base.metadata.drop_all(replica)
+
+
+# Clients of the app with the pinning middleware, added to it only when
+# replicas are configured at startup
+@pytest.fixture
+def writer():
+    return TestClient(database.ReadYourWritesMiddleware(app))
+
+
+@pytest.fixture
+def reader():
+    return TestClient(database.ReadYourWritesMiddleware(app))
+
+
+# Add a menu to one replica only, as if it had caught up with a write
+def replicate_menu(replica, title: str) -> None:
+    db = sessionmaker(bind=replica)()
+    db.add(DBMenu(title=title, description=""))
+    db.commit()
+    db.close()
+
+
+def titles(response) -> list:
+    assert response.status_code == 200, response.text
+    return [menu["title"] for menu in response.json()]
+
+
+def test_reads_go_to_the_primary_without_replicas(client):
+    assert client.post(f"{MENUS}/", json=ITEM).status_code == 201
+    assert titles(TestClient(app).get(f"{MENUS}/")) == ["Written"]
+
+
+def test_writer_reads_the_primary_and_others_a_replica(writer, reader, replicas):
+    response = writer.post(f"{MENUS}/", json=ITEM)
+    assert response.status_code == 201
+    assert database.PRIMARY_PIN_COOKIE in response.cookies
+
+    assert titles(writer.get(f"{MENUS}/")) == ["Written"]
+    assert titles(reader.get(f"{MENUS}/")) == []
+
+
+@pytest.mark.parametrize("pinned_until", ["0", "not a time"])
+def test_expired_or_malformed_pin_reads_a_replica(writer, replicas, pinned_until):
+    assert writer.post(f"{MENUS}/", json=ITEM).status_code == 201
+    writer.cookies.set(database.PRIMARY_PIN_COOKIE, pinned_until)
+    assert titles(writer.get(f"{MENUS}/")) == []
+
+
+def test_failed_write_does_not_pin(writer, replicas):
+    response = writer.post(f"{MENUS}/", json={"title": "No description"})
+    assert response.status_code == 422
+    assert database.PRIMARY_PIN_COOKIE not in response.cookies
+
+
+def test_replicas_are_used_round_robin(reader, replicas):
+    replicate_menu(replicas[0], "First replica")
+    replicate_menu(replicas[1], "Second replica")
+
+    assert [titles(reader.get(f"{MENUS}/")) for _ in range(3)] == [
+        ["First replica"],
+        ["Second replica"],
+        ["First replica"],
+    ]
+
+
+def test_least_connections_picks_the_idle_replica(reader, replicas, monkeypatch):
+    monkeypatch.setattr(database, "DB_REPLICA_BALANCING", "least_connections")
+    replicate_menu(replicas[1], "Second replica")
+
+    with replicas[0].connect():
+        assert titles(reader.get(f"{MENUS}/")) == ["Second replica"]
+
+
+def test_replica_reads_are_not_served_to_the_writer(
+    writer, reader, replicas, monkeypatch
+):
+    monkeypatch.setattr(cache, "backend", cache.MemoryCache(100, 60))
+    key = cache.menus_list_key(0, 10, None)
+    assert titles(reader.get(f"{MENUS}/")) == []
+
+    response = writer.post(f"{MENUS}/", json=ITEM)
+    assert response.status_code == 201
+
+    # The lagging replica is read and cached after the write invalidated
+    # the list, and the writer still sees its menu
+    assert titles(reader.get(f"{MENUS}/")) == []
+    assert titles(writer.get(f"{MENUS}/")) == ["Written"]
+    assert titles(reader.get(f"{MENUS}/")) == []
+    assert cache.backend.get(key + cache.REPLICA_SUFFIX) == []
+
+    # A write drops the copies of both sources
+    response = writer.patch(f"{MENUS}/{response.json()['id']}", json=ITEM)
+    assert response.status_code == 200
+    assert cache.backend.get(key) is None
+    assert cache.backend.get(key + cache.REPLICA_SUFFIX) is None
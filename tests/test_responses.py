@@ -0,0 +1,57 @@
+# Responses are byte for byte the same with FAST_RESPONSES on and off.
+
+
+import pytest
+
+from app import routers
+from tests.conftest import MENUS
+
+TITLE = "Борщ «домашний» 🍲"
+ROUTES = ["menus list", "dishes list", "menu", "dish", "search"]
+
+
+@pytest.fixture
+def paths(client):
+    body = [
+        {
+            "title": TITLE,
+            "description": "Line\nbreak, \"quotes\" and \\ backslash",
+            "submenus": [
+                {
+                    "title": "Супы",
+                    "description": "",
+                    "dishes": [
+                        {"title": f"{TITLE} {i}", "description": "", "price": price}
+                        for i, price in enumerate([0.1, 12.5, 10, 99999.99, 1e-7])
+                    ],
+                }
+            ],
+        }
+    ]
+    response = client.post(f"{MENUS}/bulk", json=body)
+    assert response.status_code == 201, response.text
+    menu = response.json()[0]
+    submenu = menu["submenus"][0]
+    submenu_path = f"{MENUS}/{menu['id']}/submenus/{submenu['id']}"
+    return {
+        "menus list": f"{MENUS}/",
+        "dishes list": f"{submenu_path}/dishes/?limit=2",
+        "menu": f"{MENUS}/{menu['id']}",
+        "dish": f"{submenu_path}/dishes/{submenu['dishes'][0]}",
+        "search": "/api/v1/dishes/search?q=борщ&limit=2",
+    }
+
+
+@pytest.mark.parametrize("name", ROUTES)
+def test_fast_responses_are_identical(client, paths, monkeypatch, name):
+    responses = {}
+    for fast in (True, False):
+        monkeypatch.setattr(routers, "FAST_RESPONSES", fast)
+        responses[fast] = client.get(paths[name])
+        assert responses[fast].status_code == 200, responses[fast].text
+
+    fast, slow = responses[True], responses[False]
+    assert fast.content == slow.content
+    assert fast.json()
+    for header in ("content-type", "content-length", "x-next-cursor"):
+        assert fast.headers.get(header) == slow.headers.get(header)
@@ -0,0 +1,92 @@
+# Dish search matches every word by prefix, ranks title matches first,
+# filters by menu and price and pages with keyset cursors.
+
+
+from app.pagination import NEXT_CURSOR_HEADER
+from tests.conftest import MENUS, seed
+
+SEARCH = "/api/v1/dishes/search"
+
+
+def dish(title: str, description: str, price: float) -> dict:
+    return {"title": title, "description": description, "price": price}
+
+
+def import_menu(client, title: str, dishes: list) -> int:
+    body = [
+        {
+            "title": title,
+            "description": "",
+            "submenus": [
+                {"title": f"{title} submenu", "description": "", "dishes": dishes}
+            ],
+        }
+    ]
+    response = client.post(f"{MENUS}/bulk", json=body)
+    assert response.status_code == 201, response.text
+    return int(response.json()[0]["id"])
+
+
+def titles(response) -> list:
+    assert response.status_code == 200, response.text
+    return [result["title"] for result in response.json()]
+
+
+def test_search_matches_prefixes_and_ranks_titles_first(client):
+    import_menu(
+        client,
+        "Lunch",
+        [
+            dish("Soup of the day", "Tomato soup with greek salad", 5),
+            dish("Greek salad", "Tomatoes, cucumbers, feta", 7),
+            dish("Caesar salad", "Romaine lettuce", 8),
+        ],
+    )
+
+    assert titles(client.get(SEARCH, params={"q": "gre sal"})) == [
+        "Greek salad",
+        "Soup of the day",
+    ]
+    assert sorted(titles(client.get(SEARCH, params={"q": "tomato"}))) == [
+        "Greek salad",
+        "Soup of the day",
+    ]
+    assert titles(client.get(SEARCH, params={"q": "pizza"})) == []
+
+
+def test_search_filters_by_menu_and_price(client):
+    lunch_id = import_menu(
+        client, "Lunch", [dish("Green salad", "", 5), dish("Warm salad", "", 9)]
+    )
+    import_menu(client, "Dinner", [dish("Dinner salad", "", 6)])
+
+    assert titles(client.get(SEARCH, params={"q": "salad", "menu_id": lunch_id})) == [
+        "Green salad",
+        "Warm salad",
+    ]
+    response = client.get(SEARCH, params={"q": "salad", "min_price": 6, "max_price": 9})
+    assert sorted(titles(response)) == ["Dinner salad", "Warm salad"]
+
+
+def test_search_pages_follow_the_cursor(client):
+    seed(client, 2, 2, 5)
+    ranked = titles(client.get(SEARCH, params={"q": "dish", "limit": 100}))
+    assert len(ranked) == 20
+
+    paged, cursor = [], None
+    while True:
+        params = {"q": "dish", "limit": 6}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get(SEARCH, params=params)
+        paged += titles(response)
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+
+    assert paged == ranked
+
+
+def test_search_rejects_invalid_cursors(client):
+    response = client.get(SEARCH, params={"q": "dish", "cursor": "not a cursor"})
+    assert response.status_code == 400
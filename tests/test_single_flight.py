@@ -0,0 +1,91 @@
+# Identical concurrent reads share one load and its result or error, but a
+# read never joins one started before the last commit.
+
+
+import asyncio
+
+from app import single_flight
+
+
+# A loader counting its calls and holding until released
+class Loader:
+    def __init__(self, result=None, error=None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.released = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.released.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+# Run reads in a request of a coalesced route, or of none
+def run_reads(reads, route=("read_menus", False)):
+    async def run():
+        single_flight.current_route.set(route)
+        return await reads()
+
+    return asyncio.run(run())
+
+
+def test_identical_reads_share_one_load():
+    async def reads():
+        loader = Loader(result=["menu"])
+        first = asyncio.ensure_future(single_flight.run("menus", loader))
+        second = asyncio.ensure_future(single_flight.run("menus", loader))
+        other = asyncio.ensure_future(single_flight.run("submenus", loader))
+        await asyncio.sleep(0)
+        loader.released.set()
+        results = await asyncio.gather(first, second, other)
+        return loader.calls, results
+
+    calls, results = run_reads(reads)
+    assert calls == 2
+    assert results == [["menu"]] * 3
+
+
+def test_error_reaches_every_waiter():
+    async def reads():
+        loader = Loader(error=RuntimeError("database is down"))
+        first = asyncio.ensure_future(single_flight.run("menus", loader))
+        second = asyncio.ensure_future(single_flight.run("menus", loader))
+        await asyncio.sleep(0)
+        loader.released.set()
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        return loader.calls, results
+
+    calls, results = run_reads(reads)
+    assert calls == 1
+    assert [str(result) for result in results] == ["database is down"] * 2
+
+
+def test_read_after_a_commit_does_not_join_an_older_one():
+    async def reads():
+        loader = Loader(result=[])
+        first = asyncio.ensure_future(single_flight.run("menus", loader))
+        await asyncio.sleep(0)
+        single_flight._next_generation(None)
+        second = asyncio.ensure_future(single_flight.run("menus", loader))
+        await asyncio.sleep(0)
+        loader.released.set()
+        await asyncio.gather(first, second)
+        return loader.calls
+
+    assert run_reads(reads) == 2
+
+
+def test_reads_outside_coalesced_routes_run_alone():
+    async def reads():
+        loader = Loader(result=[])
+        first = asyncio.ensure_future(single_flight.run("menus", loader))
+        second = asyncio.ensure_future(single_flight.run("menus", loader))
+        await asyncio.sleep(0)
+        loader.released.set()
+        await asyncio.gather(first, second)
+        return loader.calls
+
+    assert run_reads(reads, route=None) == 2
@@ -0,0 +1,100 @@
+# The read snapshot applies the rows each write changed, without reloading
+# whole menus, and stays equal to a full load of the database.
+
+
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app import snapshot
+from app.models import Dish as DBDish
+from tests.conftest import MENUS
+
+
+@pytest.fixture
+def loaded(catalogue):
+    asyncio.run(snapshot.reconcile())
+    yield catalogue
+    snapshot.catalogue = None
+    snapshot._published.clear()
+    snapshot._applied.clear()
+
+
+def assert_matches_database(db):
+    _, menus = snapshot.load(db)
+    db.rollback()
+    assert snapshot.catalogue == snapshot.index(menus)
+
+
+def test_writes_keep_the_snapshot_equal_to_the_database(client, db, loaded):
+    (menu_id, submenus), (other_menu_id, other_submenus), _ = loaded
+    submenu_id, dish_ids = submenus[0]
+    submenu_path = f"{MENUS}/{menu_id}/submenus/{submenu_id}"
+    item = {"title": "New", "description": "New description"}
+
+    writes = [
+        ("post", f"{MENUS}/", item),
+        ("patch", f"{MENUS}/{menu_id}", {"title": "Menu", "description": "Menu"}),
+        ("post", f"{MENUS}/{menu_id}/submenus/", item),
+        ("patch", submenu_path, {"title": "Submenu", "description": "Submenu"}),
+        ("post", f"{submenu_path}/dishes/", dict(item, price=5)),
+        ("patch", f"{submenu_path}/dishes/{dish_ids[0]}", dict(item, price=7)),
+        ("patch", "/api/v1/dishes/bulk", [{"id": dish_ids[1], "price": 8}]),
+        ("delete", f"{submenu_path}/dishes/{dish_ids[2]}", None),
+        ("delete", f"{MENUS}/{other_menu_id}/submenus/{other_submenus[0][0]}", None),
+        ("delete", f"{MENUS}/{other_menu_id}", None),
+    ]
+    for method, path, body in writes:
+        response = client.request(method, path, json=body)
+        assert response.status_code < 400, (path, response.text)
+        assert_matches_database(db)
+
+
+def test_dish_update_does_not_reload_the_menu(
+    client, loaded, statements, monkeypatch
+):
+    menu_id, submenus = loaded[0]
+    submenu_id, dish_ids = submenus[0]
+    path = f"{MENUS}/{menu_id}/submenus/{submenu_id}/dishes/{dish_ids[0]}"
+
+    def load(db, menu_ids=None):
+        raise AssertionError("the menu was reloaded")
+
+    monkeypatch.setattr(snapshot, "load", load)
+    response = client.patch(
+        path, json={"title": "Renamed", "description": "", "price": 1}
+    )
+    assert response.status_code == 200
+
+    statements.clear()
+    assert client.get(path).json()["title"] == "Renamed"
+    assert statements == []
+
+
+def test_older_load_does_not_roll_a_row_back(client, db, loaded):
+    menu_id, submenus = loaded[0]
+    submenu_id, dish_ids = submenus[0]
+    dish_id = dish_ids[0]
+
+    # A load that started before the write but applies after it
+    ticket = next(snapshot._tickets)
+    rows = {
+        dish_id: db.execute(
+            select(DBDish.submenu_id, *snapshot.DISH_COLUMNS).where(
+                DBDish.id == dish_id
+            )
+        ).one()
+    }
+    db.rollback()
+    response = client.patch(
+        f"{MENUS}/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+        json={"title": "Renamed", "description": "", "price": 1},
+    )
+    assert response.status_code == 200
+
+    snapshot.apply(ticket, (), {}, (), {}, [(submenu_id, dish_id)], rows)
+
+    dish = snapshot.catalogue.menus[menu_id].submenus[submenu_id].dishes[dish_id]
+    assert dish.title == "Renamed"
+    assert_matches_database(db)